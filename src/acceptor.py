@@ -4,25 +4,76 @@
 #|_____________________________________________|
 from utils import BallotNumber, PValue
 from process import Process
-from message import P1aMessage,P1bMessage,P2aMessage,P2bMessage
+from message import P1aMessage,P1bMessage,P2aMessage,P2bMessage,CompactMessage
+from message import LeaseMessage,LeaseAckMessage
+from wal import Log, LOGREWRITE
+
+MAXGROUP = 256           # Most replies an acceptor holds back for one group commit
 
 class Acceptor(Process):
     """
     Acceptors in Paxos maintain the fault tolerant memory of Paxos and
     reply to p1a and p2a messages received from leaders. The Acceptor
-    state consists of two variables:
+    state consists of three variables:
     - ballot_number: a ballot number, initially None.
-    - accepted: a set of pvalues, initially empty.
+    - accepted: a map of slot numbers to the pvalue with the highest
+    ballot number accepted for that slot, initially empty.
+    - watermark: every slot below the watermark has been executed by
+    all replicas and is no longer kept in accepted, initially 1.
+
+    Given the path of a log, the acceptor records every promise,
+    accept and compaction in a write-ahead log (see wal.Log) and
+    rebuilds its state from the log when it is created. Replies are
+    held back until the records they depend on are durable. With the
+    group fsync policy, the acceptor commits once its inbox is
+    drained or MAXGROUP replies are waiting, so that one fsync covers
+    all the p1a and p2a messages that arrived in the meantime.
+
+    With a lease of more than zero seconds, adopting a ballot or
+    renewing it with a lease message also promises its leader that
+    no ballot of another leader is adopted for the next lease
+    seconds. A leader holding such promises from a phase 2 quorum,
+    which meets every phase 1 quorum (see quorum.py), knows no
+    other leader can decide anything, and serves reads without a
+    consensus round. An acceptor recovered from its log keeps the
+    promise for its recovered ballot, as it may have made it before.
     """
-    def __init__(self, env, id):
+    def __init__(self, env, id, log=None, fsync="group", lease=0):
         Process.__init__(self, env, id)
         self.ballot_number = BallotNumber(-1,-1)
-        self.accepted = set()
+        self.accepted = {}
+        self.watermark = 1
+        self.lease = lease
+        self.lease_until = 0
+        self.log = None
+        self.replies = []
+        if log is not None:
+            log = Log(log, fsync)
+            self.recover(log)
+            self.log = log
+            if log.records > 0:
+                self.lease_until = self.now() + self.lease
         self.env.addProc(self)
 
-    def body(self):
+    def recover(self, log):
+        """ Rebuild ballot_number, accepted and watermark from log. """
+        for kind, value in log.replay():
+            if kind == "P":
+                self.ballot_number = value
+            elif kind == "A":
+                if value.slot_number >= self.watermark:
+                    self.accepted[value.slot_number] = value
+            elif kind == "C":
+                self.compact(value)
+        print(self.name, ": recovered", log.records, "records, ballot",
+              self.ballot_number, "watermark", self.watermark)
+
+    def onStart(self):
+        print("Here I am: ", self.name)
+
+    def handle(self, msg):
         """
-        Acceptor receives either p1a or p2a messages:
+        Acceptor receives p1a, p2a or compact messages:
 
         - Upon receiving a P1a request message from a leader for a
         ballot number msg.ballot_number, an acceptor makes the
@@ -30,22 +81,117 @@ class Acceptor(Process):
         msg.ballot_number if and only if it exceeds its current ballot
         number. Then it returns to the leader a p1b response message
         containing its current ballot number and all pvalues accepted
-        thus far by the acceptor.
+        thus far by the acceptor for slots at or above the watermarks
+        of both the leader and the acceptor.
 
         - Upon receiving a p2a request message from a leader with pvalue
-        (b, s, c), an acceptor makes the following transition. If its
+        (b, s, c), an acceptor makes the following transition. It
+        first adopts b if b exceeds its current ballot number, as it
+        would for a p1a message: a thrifty leader sends its p1a
+        messages to a quorum only, so the other acceptors may learn
+        of its ballot from a p2a message first. If its
         current ballot number equals b, then the acceptor accepts (b,
-        s, c). The acceptor returns to the leader a p2b response
-        message containing its current ballot number.
+        s, c), replacing any pvalue accepted earlier for slot s, which
+        necessarily has a lower ballot number. The acceptor returns to
+        the leader a p2b response message containing its current
+        ballot number. A p2a for a slot below the watermark is refused
+        with a compacted p2b, since the slot has been decided and its
+        pvalue forgotten.
+
+        - Upon receiving a compact message, the acceptor forgets the
+        pvalues of all slots below the new watermark.
+
+        - Upon receiving a lease message for its current ballot number,
+        the acceptor renews the lease of that ballot and acknowledges it.
+        A ballot of another leader is not adopted while a lease holds.
         """
-        print("Here I am: ", self.id)
-        while True:
-            msg = self.getNextMessage()
-            if isinstance(msg, P1aMessage):
-                if msg.ballot_number > self.ballot_number:
-                    self.ballot_number = msg.ballot_number
-                self.sendMessage(msg.src, P1bMessage(self.id, self.ballot_number, self.accepted))
-            elif isinstance(msg, P2aMessage):
-                if msg.ballot_number == self.ballot_number:
-                    self.accepted.add(PValue(msg.ballot_number,msg.slot_number,msg.command))
-                self.sendMessage(msg.src, P2bMessage(self.id, self.ballot_number, msg.slot_number))
+        if isinstance(msg, P1aMessage):
+            if msg.ballot_number > self.ballot_number and not self.leased(msg.ballot_number):
+                self.ballot_number = msg.ballot_number
+                self.record("P", self.ballot_number)
+            if msg.ballot_number == self.ballot_number:
+                self.renew()
+            self.compact(msg.watermark)
+            self.reply(msg.src, P1bMessage(self.id, self.ballot_number,
+                                           set(self.accepted.values())))
+        elif isinstance(msg, P2aMessage):
+            if msg.ballot_number > self.ballot_number and not self.leased(msg.ballot_number):
+                self.ballot_number = msg.ballot_number
+                self.record("P", self.ballot_number)
+            if msg.slot_number < self.watermark:
+                # Decided and executed by every replica, maybe with another command
+                self.reply(msg.src, P2bMessage(self.id, self.ballot_number, msg.slot_number, True))
+                return
+            if msg.ballot_number == self.ballot_number:
+                self.accepted[msg.slot_number] = PValue(msg.ballot_number,msg.slot_number,msg.command)
+                self.record("A", self.accepted[msg.slot_number])
+            self.reply(msg.src, P2bMessage(self.id, self.ballot_number, msg.slot_number))
+        elif isinstance(msg, CompactMessage):
+            self.compact(msg.watermark)
+        elif isinstance(msg, LeaseMessage):
+            if msg.ballot_number == self.ballot_number:
+                self.renew()
+                self.reply(msg.src, LeaseAckMessage(self.id, self.ballot_number, msg.time))
+
+    def leased(self, ballot_number):
+        """ Return True if a lease held by another leader forbids adopting ballot_number. """
+        return self.now() < self.lease_until and \
+               ballot_number.leader_id != self.ballot_number.leader_id
+
+    def renew(self):
+        """ Promise the leader of the current ballot number another lease. """
+        if self.lease > 0:
+            self.lease_until = self.now() + self.lease
+
+    def onIdle(self):
+        self.commit()
+
+    def record(self, kind, value):
+        """ Append a record to the log, if there is one. """
+        if self.log is not None:
+            self.log.append(kind, value)
+
+    def reply(self, dst, msg):
+        """
+        Send msg to dst once every record logged so far is durable.
+        Without a log the reply is sent right away.
+        """
+        if self.log is None:
+            self.sendMessage(dst, msg)
+            return
+        self.replies.append((dst, msg))
+        if self.log.fsync == "always" or len(self.replies) >= MAXGROUP:
+            self.commit()
+
+    def commit(self):
+        """
+        Make the log durable and send the replies that waited for it.
+        Rewrite the log from the live state once it has grown well
+        beyond it. Nothing is done if no record or reply is waiting,
+        as when the inbox runs dry again right after a commit.
+        """
+        if self.log is None or (not self.log.dirty() and not self.replies):
+            return
+        self.log.sync()
+        if self.log.records > LOGREWRITE + 2 * len(self.accepted):
+            self.log.rewrite([("P", self.ballot_number), ("C", self.watermark)] +
+                             [("A", pv) for pv in self.accepted.values()])
+        replies, self.replies = self.replies, []
+        for dst, msg in replies:
+            self.sendMessage(dst, msg)
+
+    def compact(self, watermark):
+        """ Truncate accepted below watermark. """
+        if watermark <= self.watermark:
+            return
+        self.record("C", watermark)
+        if watermark - self.watermark < len(self.accepted):
+            for s in range(self.watermark, watermark):
+                self.accepted.pop(s, None)
+        else:
+            self.accepted = {s: pv for s, pv in self.accepted.items() if s >= watermark}
+        self.watermark = watermark
+
+if __name__ == '__main__':
+    from launcher import start_node
+    start_node(lambda env, pid: Acceptor(env, pid, env.logPath(pid), env.fsync, env.lease))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from results import COLUMNS
+
+def load(directory):
+    """
+    Map the columns a replica wrote to directory (see
+    results.ResultWriter). Return (dict of column name to array,
+    list of run meta data).
+    """
+    with open(os.path.join(directory, "meta.json")) as f:
+        meta = json.load(f)
+    columns = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+               for name, typecode in COLUMNS}
+    return columns, meta["runs"]
+
+def load_all(directory):
+    """
+    Load the results of every replica under directory. Return a dict
+    of replica name to load().
+    """
+    return {name: load(os.path.join(directory, name)) for name in sorted(os.listdir(directory))
+            if os.path.exists(os.path.join(directory, name, "meta.json"))}
+
+def run_rows(columns, run):
+    """ Return the columns restricted to the rows of run. """
+    start, end = run["rows"]
+    return {name: column[start:end] for name, column in columns.items()}
+
+def latencies(rows):
+    """ Return the latency of every command of rows whose request reached the replica. """
+    latency = rows["decided"] - rows["sent"]
+    return latency[np.isfinite(latency)]
+
+def run_latencies(replicas):
+    """
+    Pool the latencies of every run over all replicas. Return a list
+    of (meta data of the run, latencies), one per run in order.
+    """
+    runs = []
+    for name, (columns, meta) in replicas.items():
+        for run in meta:
+            if run["run"] == len(runs):
+                runs.append((run, []))
+            runs[run["run"]][1].append(latencies(run_rows(columns, run)))
+    return [(run, np.concatenate(latency)) for run, latency in runs]
+
+def percentiles(latency, ps=(50, 95, 99)):
+    if len(latency) == 0:
+        return [np.nan for p in ps]
+    return np.percentile(latency, ps)
+
+def throughput(rows, window=0.1):
+    """
+    Return (window start times relative to the first command,
+    commands per second performed in every window).
+    """
+    decided = np.asarray(rows["decided"])
+    if len(decided) == 0:
+        return np.zeros(0), np.zeros(0)
+    t0 = decided.min()
+    bins = np.arange(t0, decided.max() + window, window)
+    if len(bins) < 2:
+        bins = np.array([t0, t0 + window])
+    counts, edges = np.histogram(decided, bins)
+    return edges[:-1] - t0, counts / window
+
+def cdf(latency):
+    """ Return (sorted latencies, fraction of latencies up to each). """
+    x = np.sort(latency)
+    return x, np.arange(1, len(x) + 1) / max(len(x), 1)
+
+def divergence(replicas, run):
+    """
+    Compare the commands performed in every slot of run across
+    replicas. Return None if they agree, or the first slot in which
+    two replicas performed different commands.
+    """
+    sequences = []
+    for name, (columns, runs) in replicas.items():
+        if run >= len(runs):
+            continue
+        rows = run_rows(columns, runs[run])
+        sequences.append((np.asarray(rows["slot"]), np.asarray(rows["client"]),
+                          np.asarray(rows["req_id"])))
+    first = None
+    for slot, client, req_id in sequences[1:]:
+        slot0, client0, req_id0 = sequences[0]
+        n = min(len(slot0), len(slot))
+        differ = (slot0[:n] != slot[:n]) | (client0[:n] != client[:n]) | (req_id0[:n] != req_id[:n])
+        if differ.any():
+            s = int(slot0[np.argmax(differ)])
+            first = s if first is None else min(first, s)
+    return first
+
+def plot(replicas, out, window):
+    """ Write a latency CDF and throughput over time for every run of every replica to out. """
+    os.makedirs(out, exist_ok=True)
+    fig_cdf, ax_cdf = plt.subplots()
+    fig_thr, ax_thr = plt.subplots()
+    for name, (columns, runs) in replicas.items():
+        for run in runs:
+            rows = run_rows(columns, run)
+            label = "%s run %d (%d clients)" % (name, run["run"], run["clients"])
+            x, y = cdf(latencies(rows))
+            ax_cdf.plot(1000 * x, y, label=label)
+            t, rate = throughput(rows, window)
+            ax_thr.plot(t, rate, label=label)
+    ax_cdf.set_xlabel("Latency (ms)")
+    ax_cdf.set_ylabel("Fraction of requests")
+    ax_cdf.legend(fontsize="small")
+    fig_cdf.savefig(os.path.join(out, "latency_cdf.png"), dpi=150)
+    ax_thr.set_xlabel("Time (s)")
+    ax_thr.set_ylabel("Commands per second")
+    ax_thr.legend(fontsize="small")
+    fig_thr.savefig(os.path.join(out, "throughput.png"), dpi=150)
+    plt.close("all")
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Summarize and plot the results written by env.py -O.")
+    p.add_argument("results", type=str,
+        help="Results directory given to env.py -O.")
+    p.add_argument("-o", "--out", type=str, default=None,
+        help="Directory to write the figures to.")
+    p.add_argument("-w", "--window", type=float, default=0.1,
+        help="Seconds per window of the throughput over time.")
+    return p.parse_args()
+
+def main(args):
+    replicas = load_all(args.results)
+    print("%-12s %4s %8s %9s %12s %10s %10s %10s" % ("replica", "run", "clients", "commands",
+                                                     "cmds/sec", "p50 (ms)", "p95 (ms)", "p99 (ms)"))
+    runs = 0
+    for name, (columns, meta) in replicas.items():
+        runs = max(runs, len(meta))
+        for run in meta:
+            rows = run_rows(columns, run)
+            decided = np.asarray(rows["decided"])
+            span = decided.max() - decided.min() if len(decided) > 1 else np.nan
+            p50, p95, p99 = percentiles(latencies(rows))
+            print("%-12s %4d %8d %9d %12.0f %10.3f %10.3f %10.3f" % (
+                name, run["run"], run["clients"], len(decided), len(decided) / span,
+                1000 * p50, 1000 * p95, 1000 * p99))
+    for run in range(runs):
+        slot = divergence(replicas, run)
+        if slot is None:
+            print("Run %d: replicas agree" % run)
+        else:
+            print("Run %d: replicas diverge at slot %d" % (run, slot))
+    if args.out:
+        matplotlib.use("Agg")
+        plot(replicas, args.out, args.window)
+
+if __name__ == '__main__':
+    main(parse_args())
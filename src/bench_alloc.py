@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+import argparse
+import gc
+import time
+import tracemalloc
+from acceptor import Acceptor
+from env import Env
+from leader import Leader
+from message import P2aMessage, P2bMessage, DecisionMessage, ProposeMessage
+from utils import Command, Config
+
+class CaptureEnv(Env):
+    """
+    An environment whose processes are never started. Messages are
+    collected in outbox instead of being delivered, so that a benchmark
+    can drive the handle() methods of the processes by hand.
+    """
+    def __init__(self):
+        Env.__init__(self, 1, {"replicas": 0, "leaders": 0, "acceptors": 0}, 0, 1)
+        self.outbox = []
+
+    def addProc(self, proc):
+        self.procs[proc.id] = proc
+
+    def sendMessage(self, dst, msg):
+        self.outbox.append((dst, msg))
+
+def make_cluster(acceptors):
+    """ Create an active leader and acceptors in a CaptureEnv. Return (env, leader, replica id). """
+    env = CaptureEnv()
+    config = Config([env.register("replica 0")], [], [])
+    for i in range(acceptors):
+        config.acceptors.append(Acceptor(env, env.register("acceptor 0.%d" % i)).id)
+    leader = Leader(env, env.register("leader 0.0"), config)
+    config.leaders.append(leader.id)
+    leader.active = True
+    for a in config.acceptors:
+        env.procs[a].ballot_number = leader.ballot_number
+    return env, leader, config.replicas[0]
+
+def decide(env, leader, replica, slot, cmd):
+    """ Propose cmd for slot and run phase 2 until the leader has decided it. """
+    leader.handle(ProposeMessage(replica, slot, cmd))
+    p2a, env.outbox = env.outbox, []
+    for dst, msg in p2a:
+        env.procs[dst].handle(msg)
+    p2b, env.outbox = env.outbox, []
+    for dst, msg in p2b:
+        leader.handle(msg)
+    env.outbox = []
+
+def bench_phase2(slots, acceptors):
+    """
+    Decide slots commands through the P2a/P2b path of one leader and
+    its acceptors. Return (microseconds per slot, bytes allocated
+    and still held per slot, peak bytes per slot).
+    """
+    env, leader, replica = make_cluster(acceptors)
+    commands = [Command(replica, s + 1, "operation %d" % (s + 1)) for s in range(slots)]
+    gc.collect()
+    t0 = time.perf_counter()
+    for s in range(slots):
+        decide(env, leader, replica, s + 1, commands[s])
+    elapsed = time.perf_counter() - t0
+
+    env, leader, replica = make_cluster(acceptors)
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for s in range(slots):
+        decide(env, leader, replica, s + 1, commands[s])
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return 1e6 * elapsed / slots, (current - before) / slots, (peak - before) / slots
+
+def bench_messages(n):
+    """
+    Allocate n of each message on the P2a/P2b path and keep them
+    alive. Return a list of (message type, bytes per message).
+    """
+    env = CaptureEnv()
+    leader = env.register("leader 0.0")
+    ballot = Leader(env, leader, Config([], [], [])).ballot_number
+    cmd = Command(env.register("client 0"), 1, "operation 0.1")
+    makers = [
+        ("P2a", lambda s: P2aMessage(leader, ballot, s, cmd)),
+        ("P2b", lambda s: P2bMessage(leader, ballot, s)),
+        ("Decision", lambda s: DecisionMessage(leader, s, cmd)),
+    ]
+    results = []
+    for name, make in makers:
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        msgs = [make(s) for s in range(n)]
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        # Do not count the list holding the messages
+        results.append((name, (after - before - 8 * n) / n))
+        del msgs
+    return results
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Measure allocations on the phase 2 hot path with tracemalloc.")
+    p.add_argument("-n", "--slots", type=int, default=20000,
+        help="Number of slots decided, and of messages allocated per type.")
+    p.add_argument("-a", "--acceptors", type=int, default=3,
+        help="Number of acceptors.")
+    return p.parse_args()
+
+def main(args):
+    print("%-10s %15s" % ("message", "bytes/msg"))
+    for name, size in bench_messages(args.slots):
+        print("%-10s %15.1f" % (name, size))
+    us, held, peak = bench_phase2(args.slots, args.acceptors)
+    print()
+    print("%-10s %15s %15s %15s" % ("phase 2", "us/slot", "held bytes/slot", "peak bytes/slot"))
+    print("%-10s %15.2f %15.1f %15.1f" % ("leader", us, held, peak))
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import os
+import time
+import codec
+from env import Env
+from message import DecisionMessage
+from replica import Replica
+from utils import Command, Config
+
+CLIENTS = 10   # Clients whose requests are decided in turn
+
+def decide(replica, leader, slots):
+    """
+    Feed the decisions of slots 1 to slots to replica, one command
+    each, from CLIENTS clients.
+    """
+    for s in range(1, slots + 1):
+        client, req_id = s % CLIENTS, (s - 1) // CLIENTS + 1
+        replica.handle(DecisionMessage(leader, s, Command(client, req_id, "operation %d" % s)))
+
+def bench_catchup(slots):
+    """
+    Let a replica perform slots decisions, then start a second replica
+    that catches up through a state transfer from the first. Return
+    (seconds to replay every decision, seconds to catch up, slot of
+    the snapshot that was transferred, its size in bytes).
+    """
+    env = Env(1, {"replicas": 0, "leaders": 0, "acceptors": 0}, 0, 1)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        leader = env.register("leader 0.0")
+        config = Config([env.register("replica 0"), env.register("replica 1")], [], [leader])
+        first = Replica(env, config.replicas[0], config)
+        t0 = time.perf_counter()
+        decide(first, leader, slots)
+        replay = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        second = Replica(env, config.replicas[1], config)
+        while second.slot_out <= slots:
+            time.sleep(0.0001)
+        catchup = time.perf_counter() - t0
+        snapshot = second.snapshot["slot"] if second.snapshot else 0
+        size = len(codec.dumps(second.snapshot)) if second.snapshot else 0
+        env.shutdown()
+    return replay, catchup, snapshot, size
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare replaying all decisions with a state transfer from another replica.")
+    p.add_argument("-n", "--slots", type=str, default="1000,10000,50000,100000",
+        help="Comma separated numbers of decided slots to catch up with.")
+    return p.parse_args()
+
+def main(args):
+    print("%10s %12s %14s %12s %12s" % ("slots", "replay (ms)", "catch-up (ms)", "snapshot", "bytes"))
+    for slots in [int(n) for n in args.slots.split(",")]:
+        replay, catchup, snapshot, size = bench_catchup(slots)
+        print("%10d %12.1f %14.1f %12d %12d" % (slots, 1000 * replay, 1000 * catchup, snapshot, size))
+
+if __name__ == '__main__':
+    main(parse_args())
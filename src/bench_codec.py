@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+import argparse
+import pickle
+import time
+import codec
+from message import P1bMessage, P2aMessage, P2bMessage, DecisionMessage, RequestMessage
+from utils import BallotNumber, PValue, Command, BatchCommand
+
+def sample_messages(pvalues, batch_size):
+    """
+    Return a list of (name, message) pairs covering the hot paths.
+    Processes are addressed by integer ids, as env.py assigns them:
+    replicas, acceptors and leaders first, then the load generator.
+    """
+    replica, acceptor, leader, client = 0, 3, 5, 7
+    b = BallotNumber(7, leader)
+    cmd = Command(client, 42, "operation 3.42")
+    batch = BatchCommand(replica, 5, tuple(Command(client, i, "operation %d.%d" % (i % 4, i))
+                                           for i in range(batch_size)))
+    accepted = set(PValue(BallotNumber(1 + s % 3, leader + s % 2), s,
+                          Command(client, s, "operation %d" % s))
+                   for s in range(pvalues))
+    return [
+        ("P2a", P2aMessage(leader, b, 1234, cmd)),
+        ("P2b", P2bMessage(acceptor, b, 1234)),
+        ("Decision", DecisionMessage(leader, 1234, cmd)),
+        ("Request", RequestMessage(client, cmd, "1700000000.123")),
+        ("P2a batch %d" % batch_size, P2aMessage(leader, b, 1234, batch)),
+        ("P1b %d pvalues" % pvalues, P1bMessage(acceptor, b, accepted)),
+    ]
+
+def rate(f, arg, seconds):
+    """ Call f(arg) repeatedly for about seconds. Return calls per second. """
+    n = 0
+    t0 = time.perf_counter()
+    deadline = t0 + seconds
+    while True:
+        for i in range(10):
+            f(arg)
+        n += 10
+        t1 = time.perf_counter()
+        if t1 > deadline:
+            return n / (t1 - t0)
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare encode/decode throughput and size of the binary codec and pickle.")
+    p.add_argument("-p", "--pvalues", type=int, default=5000,
+        help="Number of pvalues in the P1b message.")
+    p.add_argument("-b", "--batch-size", type=int, default=50,
+        help="Number of commands in the batched P2a message.")
+    p.add_argument("-s", "--seconds", type=float, default=0.5,
+        help="Time spent on every measurement.")
+    return p.parse_args()
+
+def main(args):
+    codecs = [
+        ("pickle", lambda m: pickle.dumps(m, pickle.HIGHEST_PROTOCOL), pickle.loads),
+        ("binary", codec.dumps, codec.loads),
+    ]
+    print("%-18s %-7s %10s %14s %14s" % ("message", "codec", "bytes", "encode/sec", "decode/sec"))
+    for name, msg in sample_messages(args.pvalues, args.batch_size):
+        for cname, dumps, loads in codecs:
+            data = dumps(msg)
+            print("%-18s %-7s %10d %14.0f %14.0f" % (name, cname, len(data),
+                                                     rate(dumps, msg, args.seconds),
+                                                     rate(loads, data, args.seconds)))
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import os
+import time
+from env import Env
+from message import RequestMessage
+from utils import Command, parse_config
+
+def bench_decisions(config, requests, phase2, runtime="thread", batch_size=1, linger=0):
+    """
+    Run a cluster in-process, send requests to every replica and wait
+    until all replicas have performed them. Return decisions per second.
+    """
+    env = Env(requests, config, 0, 1, runtime=runtime, phase2=phase2,
+              batch_size=batch_size, linger=linger)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        initialconfig = env.setup()
+        replicas = [env.procs[r] for r in initialconfig.replicas]
+        pid = env.register("client 0")
+        t0 = time.perf_counter()
+        for i in range(1, requests + 1):
+            cmd = Command(pid, i, "operation 0.%d" % i)
+            for r in initialconfig.replicas:
+                env.sendMessage(r, RequestMessage(pid, cmd, str(time.time())))
+        while min(r.decs_made for r in replicas) < requests:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - t0
+        env.shutdown()
+    return requests / elapsed
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Measure decisions/sec of the phase 2 implementations.")
+    p.add_argument("-C", "--config", type=str, default="2,1,3",
+        help="Configuration (REPLICAS,LEADERS,ACCEPTORS).")
+    p.add_argument("-r", "--requests", type=int, default=20,
+        help="Number of requests to decide per run.")
+    p.add_argument("-P", "--phase2", type=str, default=None, choices=["leader", "commander"],
+        help="Only benchmark this phase 2 implementation.")
+    p.add_argument("-R", "--runtime", type=str, default="thread",
+        help="Runtime to run the processes in.")
+    p.add_argument("-b", "--batch-size", type=int, default=1,
+        help="Maximum number of client commands decided in one slot.")
+    p.add_argument("-l", "--linger", type=float, default=0,
+        help="Milliseconds a replica waits for a batch to fill up.")
+    return p.parse_args()
+
+def main(args):
+    config = parse_config(args.config)
+    modes = [args.phase2] if args.phase2 else ["commander", "leader"]
+    print("%-10s %15s" % ("phase2", "decisions/sec"))
+    for mode in modes:
+        rate = bench_decisions(config, args.requests, mode, args.runtime,
+                               args.batch_size, args.linger)
+        print("%-10s %15.2f" % (mode, rate))
+
+if __name__ == '__main__':
+    main(parse_args())
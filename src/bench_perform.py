@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import os
+import time
+from env import Env
+from message import DecisionMessage
+from replica import Replica
+from utils import BatchCommand, Command, Config
+
+def bench_perform(slots, step, batch_size):
+    """
+    Feed slots decisions in order to a single replica and time every
+    step of them. Return a list of (slot, microseconds per decision).
+    """
+    env = Env(1, {"replicas": 0, "leaders": 0, "acceptors": 0}, 0, 1)
+    results = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pid = env.register("replica 0")
+        leader = env.register("leader 0.0")
+        replica = Replica(env, pid, Config([pid], [], []))
+        t0 = time.perf_counter()
+        for s in range(1, slots + 1):
+            if batch_size > 1:
+                cmd = BatchCommand(pid, s,
+                                   tuple(Command(s, i, "operation %d.%d" % (s, i))
+                                         for i in range(1, batch_size + 1)))
+            else:
+                cmd = Command(s, 1, "operation %d" % s)
+            replica.handle(DecisionMessage(leader, s, cmd))
+            if s % step == 0:
+                t1 = time.perf_counter()
+                results.append((s, 1e6 * (t1 - t0) / step))
+                t0 = time.perf_counter()
+        env.shutdown()
+    return results
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Measure the cost of executing decisions as the log grows.")
+    p.add_argument("-n", "--slots", type=int, default=1000000,
+        help="Number of decided slots to execute.")
+    p.add_argument("-s", "--step", type=int, default=100000,
+        help="Number of slots per measurement.")
+    p.add_argument("-b", "--batch-size", type=int, default=1,
+        help="Number of commands in every decided slot.")
+    return p.parse_args()
+
+def main(args):
+    print("%10s %20s" % ("slot", "us/decision"))
+    for slot, cost in bench_perform(args.slots, args.step, args.batch_size):
+        print("%10d %20.2f" % (slot, cost))
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import os
+import time
+from benchmark import BenchGenerator
+from env import Env
+from loadgen import Workload
+from utils import parse_config
+
+def percentile(values, p):
+    """ Return the p-th percentile of values. """
+    values = sorted(values)
+    if len(values) == 0:
+        return float("nan")
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+def bench_reads(config, requests, reads, lease, outstanding, keys=100, seed=1):
+    """
+    Run a cluster in-process with a key-value store and one closed-loop
+    client, of whose requests a fraction reads are gets and the rest
+    puts. Return (requests per second, read latencies, write latencies).
+    """
+    env = Env(requests, config, 0, 1, lease=lease)
+    workload = Workload("kv", keys, reads=reads, seed=seed)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        initialconfig = env.setup()
+        # Let a leader get its ballot adopted before measuring.
+        time.sleep(0.2 + lease)
+        t0 = time.perf_counter()
+        client = BenchGenerator(env, env.register("client 0"), initialconfig.replicas, requests,
+                                outstanding=outstanding, workload=workload)
+        while not client.done:
+            time.sleep(0.001)
+        elapsed = time.perf_counter() - t0
+        env.shutdown()
+    read = [l for op, l in client.latencies[0] if op[0] == "get"]
+    write = [l for op, l in client.latencies[0] if op[0] != "get"]
+    return requests / elapsed, read, write
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare reads ordered through Paxos with lease-based reads.")
+    p.add_argument("-C", "--config", type=str, default="2,1,3",
+        help="Configuration (REPLICAS,LEADERS,ACCEPTORS).")
+    p.add_argument("-r", "--requests", type=int, default=2000,
+        help="Number of requests per run.")
+    p.add_argument("-f", "--reads", type=float, default=0.9,
+        help="Fraction of requests that are reads.")
+    p.add_argument("-o", "--outstanding", type=int, default=4,
+        help="Outstanding requests of the client.")
+    p.add_argument("--lease", type=float, default=2.0,
+        help="Seconds of leader leases in the lease run.")
+    return p.parse_args()
+
+def main(args):
+    config = parse_config(args.config)
+    print("%-8s %12s %14s %14s" % ("reads", "requests/sec", "read p50 (ms)", "write p50 (ms)"))
+    for name, lease in [("paxos", 0), ("lease", args.lease)]:
+        rate, read, write = bench_reads(config, args.requests, args.reads, lease, args.outstanding)
+        print("%-8s %12.0f %14.3f %14.3f" % (name, rate, 1000 * percentile(read, 50),
+                                            1000 * percentile(write, 50)))
+
+if __name__ == '__main__':
+    main(parse_args())
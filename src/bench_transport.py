@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+import argparse
+import time
+from env import Env
+from message import P2bMessage
+from process import Process
+from transport import TRANSPORTS, TcpTransport
+from utils import BallotNumber
+
+class Sink(Process):
+    """ A process that consumes a fixed number of messages and exits. """
+    def __init__(self, env, id, count):
+        Process.__init__(self, env, id)
+        self.count = count
+        self.env.addProc(self)
+
+    def body(self):
+        for i in range(self.count):
+            self.getNextMessage()
+        self.finished = time.perf_counter()
+
+def bench_startup(transport, n):
+    """ Time the creation of n processes. Return seconds. """
+    env = Env(1, {"replicas": 0, "leaders": 0, "acceptors": 0}, 0, 1, transport)
+    t0 = time.perf_counter()
+    procs = [Process(env, env.register("proc %d" % i)) for i in range(n)]
+    t1 = time.perf_counter()
+    env.transport.close()
+    return t1 - t0
+
+def bench_throughput(transport, n, port):
+    """
+    Send n messages to a single process. Return messages per second.
+    For the tcp transport the sink lives in a second environment
+    reached over the loopback interface.
+    """
+    config = {"replicas": 0, "leaders": 0, "acceptors": 0}
+    env = Env(1, config, 0, 1, transport)
+    pid = env.register("sink")
+    sender = env
+    if transport == TcpTransport.name:
+        addr = ("127.0.0.1", port)
+        env.transport.listen(env, addr)
+        sender = Env(1, config, 0, 1, TcpTransport({pid: addr}))
+    src = sender.register("bench")
+    msg = P2bMessage(src, BallotNumber(0, src), 1)
+    t0 = time.perf_counter()
+    sink = Sink(env, pid, n)
+    for i in range(n):
+        sender.sendMessage(pid, msg)
+    sink.join()
+    env.transport.close()
+    sender.transport.close()
+    return n / (sink.finished - t0)
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Compare startup time and message rate of each transport.")
+    p.add_argument("-p", "--procs", type=int, default=20,
+        help="Number of processes created when measuring startup time.")
+    p.add_argument("-m", "--messages", type=int, default=20000,
+        help="Number of messages sent when measuring throughput.")
+    p.add_argument("--port", type=int, default=9900,
+        help="Loopback port used to benchmark the tcp transport.")
+    p.add_argument("-t", "--transport", type=str, default=None, choices=sorted(TRANSPORTS),
+        help="Only benchmark this transport.")
+    return p.parse_args()
+
+def main(args):
+    names = [args.transport] if args.transport else sorted(TRANSPORTS)
+    print("%-10s %18s %18s" % ("transport", "startup/proc (ms)", "messages/sec"))
+    for name in names:
+        startup = bench_startup(name, args.procs)
+        rate = bench_throughput(name, args.messages, args.port)
+        print("%-10s %18.3f %18.0f" % (name, 1000 * startup / args.procs, rate))
+
+if __name__ == '__main__':
+    main(parse_args())
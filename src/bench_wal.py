@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+import time
+from acceptor import Acceptor
+from env import Env
+from message import P1aMessage, P1bMessage, P2aMessage, P2bMessage
+from process import Process
+from utils import BallotNumber, Command
+from wal import FSYNC
+
+class Proposer(Process):
+    """
+    Acts as a leader towards a single acceptor: it gets its ballot
+    adopted and then keeps depth p2a messages outstanding until slots
+    commands have been accepted.
+    """
+    def __init__(self, env, id, acceptor, slots, depth):
+        Process.__init__(self, env, id)
+        self.acceptor = acceptor
+        self.slots = slots
+        self.depth = depth
+        self.ballot_number = BallotNumber(1, id)
+        self.sent = self.accepted = 0
+        self.started = self.finished = None
+        self.env.addProc(self)
+
+    def onStart(self):
+        self.sendMessage(self.acceptor, P1aMessage(self.id, self.ballot_number, 1))
+
+    def handle(self, msg):
+        if isinstance(msg, P1bMessage):
+            self.started = time.perf_counter()
+            for i in range(min(self.depth, self.slots)):
+                self.sendP2a()
+        elif isinstance(msg, P2bMessage):
+            self.accepted += 1
+            if self.sent < self.slots:
+                self.sendP2a()
+            elif self.accepted == self.slots:
+                self.finished = time.perf_counter()
+                self.stop()
+
+    def sendP2a(self):
+        self.sent += 1
+        cmd = Command(self.id, self.sent, "operation %d" % self.sent)
+        self.sendMessage(self.acceptor, P2aMessage(self.id, self.ballot_number, self.sent, cmd))
+
+def bench_accepts(fsync, slots, depth, directory):
+    """
+    Let one acceptor accept slots commands, depth of them in flight
+    at a time, logging to directory with the given fsync policy, or
+    in memory only if fsync is None. Return accepts per second.
+    """
+    env = Env(1, {"replicas": 0, "leaders": 0, "acceptors": 0}, 0, 1, fsync=fsync or "group",
+              wal=directory if fsync else None)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pid = env.register("acceptor 0.0")
+        Acceptor(env, pid, env.logPath(pid), env.fsync)
+        proposer = Proposer(env, env.register("leader 0.0"), pid, slots, depth)
+        proposer.join()
+        env.shutdown()
+    return slots / (proposer.finished - proposer.started)
+
+def bench_recover(directory):
+    """
+    Time how long an acceptor takes to rebuild its state from the log
+    in directory. Return (seconds, records).
+    """
+    env = Env(1, {"replicas": 0, "leaders": 0, "acceptors": 0}, 0, 1, wal=directory)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        pid = env.register("acceptor 0.0")
+        t0 = time.perf_counter()
+        acceptor = Acceptor(env, pid, env.logPath(pid))
+        elapsed = time.perf_counter() - t0
+        env.shutdown()
+    return elapsed, acceptor.log.records
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Measure accepts/sec of an acceptor under each fsync policy.")
+    p.add_argument("-n", "--slots", type=int, default=5000,
+        help="Number of commands accepted per run.")
+    p.add_argument("-d", "--depth", type=int, default=32,
+        help="Number of p2a messages in flight.")
+    p.add_argument("-D", "--directory", type=str, default=".",
+        help="Directory in which the logs are created.")
+    p.add_argument("-F", "--fsync", type=str, default=None, choices=FSYNC,
+        help="Only benchmark this fsync policy.")
+    return p.parse_args()
+
+def main(args):
+    policies = [args.fsync] if args.fsync else [None] + FSYNC
+    print("%-10s %15s %15s" % ("fsync", "accepts/sec", "recover (ms)"))
+    for fsync in policies:
+        directory = tempfile.mkdtemp(prefix="wal_", dir=args.directory)
+        try:
+            rate = bench_accepts(fsync, args.slots, args.depth, directory)
+            recover = "-"
+            if fsync:
+                elapsed, records = bench_recover(directory)
+                recover = "%.1f" % (1000 * elapsed)
+        finally:
+            shutil.rmtree(directory)
+        print("%-10s %15.0f %15s" % (fsync or "memory", rate, recover))
+
+if __name__ == '__main__':
+    main(parse_args())
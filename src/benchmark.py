@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import sys
+from env import Env
+from loadgen import LoadGenerator
+
+PARAMS = ["replicas", "leaders", "acceptors", "clients", "requests", "window",
+          "batch_size", "linger", "outstanding", "timeout", "phase2", "runtime",
+          "faults", "deadline", "election", "thrifty", "quorum"]
+DEFAULTS = {"replicas": 2, "leaders": 1, "acceptors": 3, "clients": 4, "requests": 2000,
+            "window": 0, "batch_size": 1, "linger": 0, "outstanding": 8, "timeout": 0,
+            "phase2": "leader", "runtime": "thread", "faults": "", "deadline": 0.0,
+            "election": "stable", "thrifty": 0, "quorum": "majority"}
+# Fault scenarios and quorum systems contain commas, so their values in a grid are separated by "|"
+SEPARATORS = {"faults": "|", "quorum": "|"}
+METRICS = ["throughput", "p50", "p95", "p99", "dip", "recovery"]
+TIMELINE = 0.05    # Seconds per window of the throughput around faults
+RECOVERED = 0.9    # Fraction of the throughput before the first fault that counts as recovered
+
+class BenchGenerator(LoadGenerator):
+    """ A load generator that keeps its latencies instead of writing them to files. """
+    def write_latencies(self):
+        pass
+
+def percentile(values, p):
+    """ Return the p-th percentile of the sorted list values. """
+    if len(values) == 0:
+        return float("nan")
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+def fault_impact(completions, started, end, faults):
+    """
+    Measure the effect of faults, the times at which fault events
+    fired, on the requests answered at the sorted times completions
+    of a run from started to end. The throughput in windows of
+    TIMELINE seconds from the first fault on is compared with the
+    throughput before it, excluding the partial window at the end.
+    Return (dip, recovery): the fraction of the
+    throughput lost in the worst window, and the seconds from the
+    first fault until the first window after the worst that reaches
+    RECOVERED of the throughput before, or nan if none does.
+    """
+    if not faults or faults[0] <= started:
+        return float("nan"), float("nan")
+    first = faults[0]
+    baseline = sum(1 for t in completions if t < first) / (first - started)
+    if baseline == 0:
+        return float("nan"), float("nan")
+    # Only whole windows count, so that the end of the run is no dip
+    counts = [0] * max(1, int((end - first) / TIMELINE))
+    for t in completions:
+        i = int((t - first) / TIMELINE) if t >= first else -1
+        if 0 <= i < len(counts):
+            counts[i] += 1
+    rates = [c / TIMELINE for c in counts]
+    worst = rates.index(min(rates))
+    if rates[worst] >= RECOVERED * baseline:
+        return max(0.0, 1 - rates[worst] / baseline), 0.0
+    recovery = next((i * TIMELINE for i in range(worst, len(rates))
+                     if rates[i] >= RECOVERED * baseline), float("nan"))
+    return max(0.0, 1 - rates[worst] / baseline), recovery
+
+def run_point(point, results=None):
+    """
+    Run one configuration in this process, with the parameters of
+    point completed from DEFAULTS. With a results directory, the
+    replicas append their measurements to it as env.py -O does.
+    Return a dict with the requests per second and the p50, p95 and
+    p99 latency in seconds, and with a fault scenario its dip and
+    recovery time (see fault_impact()).
+    """
+    p = dict(DEFAULTS, **point)
+    config = {"replicas": p["replicas"], "leaders": p["leaders"], "acceptors": p["acceptors"]}
+    env = Env(p["requests"], config, p["timeout"], p["clients"], runtime=p["runtime"],
+              phase2=p["phase2"], batch_size=p["batch_size"], linger=p["linger"],
+              window=p["window"], outstanding=p["outstanding"], faults=p["faults"],
+              deadline=p["deadline"], election=p["election"],
+              thrifty=p["thrifty"], quorum=p["quorum"], results=results)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        if results:
+            generator = env.execute()
+        else:
+            generator = env.runLoad(env.setup(), BenchGenerator)
+        end = generator.finished if generator.done else env.runtime.now()
+        env.shutdown()
+    latencies = sorted(l for client in generator.latencies for op, l in client)
+    faults = [t for t, action, arg in env.faults.log] if env.faults is not None else []
+    dip, recovery = fault_impact(generator.completions, generator.started, end, faults)
+    return {"throughput": generator.answered / (end - generator.started),
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99), "dip": dip, "recovery": recovery}
+
+def parse_grid(specs):
+    """
+    Turn specs such as ["clients=1,4,8", "batch_size=1,8"] into the
+    list of points of their cartesian product, in order. The values
+    of faults and quorum are separated by "|" instead.
+    """
+    names, values = [], []
+    for spec in specs:
+        name, _, vals = spec.partition("=")
+        name = name.replace("-", "_")
+        if name not in PARAMS:
+            raise ValueError("Unknown parameter '%s', expected one of: %s" %
+                             (name, ", ".join(PARAMS)))
+        kind = type(DEFAULTS[name])
+        names.append(name)
+        values.append([kind(v) for v in vals.split(SEPARATORS.get(name, ","))])
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+def point_key(point):
+    return json.dumps(dict(DEFAULTS, **point), sort_keys=True)
+
+def summarize(point, runs):
+    """
+    Return the result of a point: its parameters, every run and the
+    mean and deviation of each metric over the runs that measured it.
+    """
+    result = {"point": dict(DEFAULTS, **point), "runs": runs}
+    for m in METRICS:
+        values = [r[m] for r in runs if r[m] == r[m]]
+        result[m] = statistics.mean(values) if values else float("nan")
+        result[m + "_stdev"] = statistics.stdev(values) if len(values) > 1 else 0.0
+    return result
+
+def run_grid(points, repeats, workers):
+    """
+    Run every point repeats times, in this process when workers is 0
+    and otherwise in a pool of workers processes that each run a
+    single point, so that no run inherits the threads or memory of
+    another. Return one summarize() result per point.
+    """
+    jobs = [point for point in points for r in range(repeats)]
+    if workers == 0:
+        runs = []
+        for i, point in enumerate(jobs):
+            runs.append(run_point(point))
+            print("run %d/%d: %s" % (i + 1, len(jobs), format_run(point, runs[-1])), file=sys.stderr)
+    else:
+        with multiprocessing.Pool(workers, maxtasksperchild=1) as pool:
+            runs = pool.map(run_point, jobs, chunksize=1)
+    return [summarize(point, runs[i * repeats:(i + 1) * repeats]) for i, point in enumerate(points)]
+
+def compare(results, baseline, tolerance):
+    """
+    Compare results with the results of a baseline run. A point
+    regresses if its throughput fell, or its p99 latency rose, by more
+    than tolerance relative to the baseline. Return a list of
+    (result, baseline result, reasons) for every regressed point.
+    """
+    base = {point_key(b["point"]): b for b in baseline}
+    regressions = []
+    for r in results:
+        b = base.get(point_key(r["point"]))
+        if b is None:
+            continue
+        reasons = []
+        if r["throughput"] < b["throughput"] * (1 - tolerance):
+            reasons.append("throughput %.0f -> %.0f" % (b["throughput"], r["throughput"]))
+        if r["p99"] > b["p99"] * (1 + tolerance):
+            reasons.append("p99 %.2f -> %.2f ms" % (1000 * b["p99"], 1000 * r["p99"]))
+        if reasons:
+            regressions.append((r, b, reasons))
+    return regressions
+
+def format_run(point, run):
+    line = "%s: %.0f req/s, p50 %.2f ms, p99 %.2f ms" % (
+        " ".join("%s=%s" % kv for kv in sorted(point.items())),
+        run["throughput"], 1000 * run["p50"], 1000 * run["p99"])
+    if point.get("faults"):
+        line += ", dip %.0f%%, recovery %.2f s" % (100 * run["dip"], run["recovery"])
+    return line
+
+def write_csv(path, results):
+    """ Write one row per run, with the parameters of its point. """
+    with open(path, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(PARAMS + ["run"] + METRICS)
+        for r in results:
+            for i, run in enumerate(r["runs"]):
+                w.writerow([r["point"][p] for p in PARAMS] + [i] + [run[m] for m in METRICS])
+
+def print_table(points, results):
+    varied = sorted({name for point in points for name in point})
+    faults = any(r["point"]["faults"] for r in results)
+    print(" ".join("%10s" % n[:10] for n in varied) +
+          " %12s %10s %10s %10s %10s" % ("req/s", "stdev", "p50 (ms)", "p95 (ms)", "p99 (ms)") +
+          (" %8s %12s" % ("dip (%)", "recovery (s)") if faults else ""))
+    for r in results:
+        print(" ".join("%10s" % r["point"][n] for n in varied) +
+              " %12.0f %10.0f %10.3f %10.3f %10.3f" % (r["throughput"], r["throughput_stdev"],
+                                                       1000 * r["p50"], 1000 * r["p95"],
+                                                       1000 * r["p99"]) +
+              (" %8.0f %12.3f" % (100 * r["dip"], r["recovery"]) if faults else ""))
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run a grid of configurations in-process and report throughput and latency.")
+    p.add_argument("-g", "--grid", type=str, nargs="*", default=[],
+        help="Parameters to vary, as NAME=V1,V2,... One of: %s." % ", ".join(PARAMS))
+    p.add_argument("-s", "--set", type=str, nargs="*", default=[],
+        help="Parameters to fix for every point, as NAME=VALUE.")
+    p.add_argument("-n", "--repeats", type=int, default=3,
+        help="Number of runs of every point.")
+    p.add_argument("-j", "--workers", type=int, default=0,
+        help="Run points in a pool of this many worker processes, or 0 to run them in this process.")
+    p.add_argument("--json", type=str, default=None,
+        help="Write the results of every point to this file.")
+    p.add_argument("--csv", type=str, default=None,
+        help="Write one row per run to this file.")
+    p.add_argument("-B", "--baseline", type=str, default=None,
+        help="JSON results of an earlier run to compare with.")
+    p.add_argument("--tolerance", type=float, default=0.1,
+        help="Relative change of throughput or p99 latency that counts as a regression.")
+    return p.parse_args()
+
+def main(args):
+    fixed = parse_grid(args.set)[0] if args.set else {}
+    points = [dict(fixed, **point) for point in parse_grid(args.grid)]
+    results = run_grid(points, args.repeats, args.workers)
+    print_table(points, results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=1)
+    if args.csv:
+        write_csv(args.csv, results)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for r, b, reasons in regressions:
+            print("REGRESSION", " ".join("%s=%s" % kv for kv in sorted(r["point"].items())),
+                  ":", ", ".join(reasons))
+        if regressions:
+            sys.exit(1)
+        print("No regressions against", args.baseline)
+
+if __name__ == '__main__':
+    main(parse_args())
@@ -0,0 +1,110 @@
+from process import Process
+from message import CheckpointMessage, DigestRequestMessage, DigestsMessage
+from utils import CHECKPOINTINTERVAL
+
+class ConsensusChecker(Process):
+    """
+    Checks during a run that all replicas perform the same commands in
+    the same slots. Replicas send the digest of their hash chain every
+    CHECKPOINTINTERVAL slots (see Replica.chain). Since the digest of
+    a slot covers every slot before it, comparing checkpoints is
+    enough: the checker keeps only the checkpoints that some replica
+    has not reported yet, and its work grows with the number of
+    checkpoints instead of the length of the log. A replica restored
+    from a snapshot never reports the checkpoints it skipped, so the
+    checker also drops every checkpoint at or below the lowest of the
+    highest checkpoints of the replicas.
+
+    The first time two replicas report different digests for a
+    checkpoint, every earlier checkpoint has matched, so they diverged
+    within the interval before it. The checker then asks those
+    replicas for the digest of every slot of the interval and reports
+    the first slot at which they differ.
+
+    - agreed: the highest checkpoint every replica has reported with
+    the same digest.
+    - diverged: the first slot at which two replicas differ, once
+    known.
+    """
+    def __init__(self, env, id, replicas):
+        Process.__init__(self, env, id)
+        self.replicas = replicas
+        self.checkpoints = {}
+        self.reported = dict.fromkeys(replicas, 0)
+        self.passed = 0
+        self.agreed = 0
+        self.diverged = None
+        self.suspect = None
+        self.digests = {}
+        self.env.addProc(self)
+
+    def handle(self, msg):
+        """
+        - Checkpoint: Record the digest of a replica. Once every
+        replica agrees on a checkpoint, or every replica has reported
+        a later one, it is dropped; the first disagreement starts a
+        search for the divergent slot.
+
+        - Digests: The digests of the slots of the suspect interval
+        from one replica. Once both replicas have answered, the first
+        slot with different digests is reported.
+        """
+        if isinstance(msg, CheckpointMessage):
+            if self.diverged is not None:
+                return
+            seen = self.checkpoints.setdefault(msg.slot_number, {})
+            seen[msg.src] = msg.digest
+            if len(set(seen.values())) > 1:
+                if self.suspect is None:
+                    self.search(msg.slot_number, seen)
+            elif len(seen) == len(self.replicas):
+                del self.checkpoints[msg.slot_number]
+                self.agreed = max(self.agreed, msg.slot_number)
+            self.reported[msg.src] = max(self.reported.get(msg.src, 0), msg.slot_number)
+            passed = min(self.reported.values())
+            if passed > self.passed:
+                self.passed = passed
+                for slot_number in [s for s in self.checkpoints if s <= passed]:
+                    del self.checkpoints[slot_number]
+        elif isinstance(msg, DigestsMessage):
+            if self.suspect is None or msg.slot_number != self.suspect[0]:
+                return
+            self.digests[msg.src] = msg.digests
+            if len(self.digests) == len(self.suspect[1]):
+                self.locate()
+
+    def search(self, slot_number, seen):
+        """
+        Ask two replicas that disagree on slot_number for the digests
+        of the interval before it.
+        """
+        digests = list(seen.values())
+        first = [r for r, d in seen.items() if d == digests[0]][0]
+        other = [r for r, d in seen.items() if d != digests[0]][0]
+        start = max(1, slot_number - CHECKPOINTINTERVAL + 1)
+        self.suspect = (start, (first, other))
+        self.digests = {}
+        print("Checker: %s and %s disagree at checkpoint %d" %
+              (self.env.name(first), self.env.name(other), slot_number))
+        for r in (first, other):
+            self.sendMessage(r, DigestRequestMessage(self.id, start, slot_number - start + 1))
+
+    def locate(self):
+        start, (first, other) = self.suspect
+        a, b = self.digests[first], self.digests[other]
+        if a is None or b is None:
+            self.diverged = start
+            print("Checker: digests no longer kept, replicas diverge at or after slot", start)
+        else:
+            self.diverged = start + next(i for i in range(len(a)) if a[i] != b[i])
+            print("Checker: %s and %s diverge at slot %d" %
+                  (self.env.name(first), self.env.name(other), self.diverged))
+        self.suspect = None
+
+    def report(self):
+        """ Return a line describing what the checker found. """
+        if self.diverged is not None:
+            return "Checker: replicas diverge at slot %d" % self.diverged
+        if self.suspect is not None:
+            return "Checker: replicas disagree within the slots from %d" % self.suspect[0]
+        return "Checker: replicas agree up to slot %d" % self.agreed
@@ -0,0 +1,10 @@
+from loadgen import LoadGenerator
+
+# A client node of launcher.py is a load generator that plays one
+# closed-loop client, numbered after its name in the cluster file.
+if __name__ == '__main__':
+    from launcher import start_node
+    start_node(lambda env, pid: LoadGenerator(env, pid, env.config.replicas,
+                                              env.cluster["clients"][env.name(pid)],
+                                              outstanding=max(1, env.outstanding),
+                                              first=int(env.name(pid).split(" ")[-1])))
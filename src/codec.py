@@ -0,0 +1,441 @@
+"""
+A compact, versioned binary wire format for messages and the values
+they carry. Every encoded object starts with the format VERSION
+followed by one tagged value. A value is a one-byte tag followed by
+its payload:
+
+    N            None
+    T / F        True / False
+    b            int from 0 to 255 as one byte
+    i / q        int as 4 / 8 byte little-endian signed integer
+    I            int that does not fit in 8 bytes, as a decimal string
+    d            float as an 8 byte double
+    s            str (utf-8) shorter than 256 bytes, as a 1 byte length
+                 and the data
+    u / y        longer str (utf-8) / bytes, as a 4 byte length and the data
+    r            the n-th distinct str of this frame, as a 2 byte index
+    t / l / S    tuple / list / set, as a 4 byte count and the values
+    m            dict, as a 4 byte count and the key, value pairs
+    B            BallotNumber: round and leader id, interned on decoding
+    o            BallotNumber of an integer round and leader id, as a 4
+                 byte round and a 2 byte leader id
+    P            PValue: ballot number, slot number and command
+    C / R / K    Command / ReconfigCommand / BatchCommand
+    c            Command of an integer client and request id and a str
+                 operation shorter than 256 bytes, as a 4 byte client,
+                 4 byte request id, 1 byte length and the data
+    k            BatchCommand whose commands all fit the c layout, with
+                 the commands in bulk, see pack_commands()
+    G            Config: replicas, acceptors and leaders
+    V / W        a set of PValues in bulk, see Encoder.pvalues(), with the
+                 commands in bulk in W
+    M            a message: a one-byte message type and its fields
+
+Strings are written out once per frame and referred back to with r
+afterwards, since client, replica and leader names repeat in almost
+every command. Message types are numbered by their position in
+MESSAGES, so new message classes must be appended to keep the
+numbering stable.
+
+Decoding is dominated by the Python calls made per value, so the
+ballots and commands of the hot paths, whose processes are integer
+ids, get the fixed layouts o and c that one precompiled struct
+unpacks, the commands of batches and pvalue sets are unpacked in
+bulk, and Decoder.value() reads small ints and strings itself.
+"""
+
+import inspect
+import struct
+import sys
+from array import array
+import message
+from utils import BallotNumber, PValue, Command, ReconfigCommand, BatchCommand, Config
+from utils import intern_ballot, BALLOTS
+
+VERSION = 1
+MAXSTRINGS = 0x10000     # Number of distinct strings a frame can refer back to
+
+MESSAGES = [
+    message.P1aMessage, message.P1bMessage, message.P2aMessage,
+    message.P2bMessage, message.PreemptedMessage, message.AdoptedMessage,
+    message.DecisionMessage, message.RequestMessage, message.ProposeMessage,
+    message.DoneMessage, message.ExecutedMessage, message.CompactMessage,
+    message.TimerMessage, message.ResponseMessage, message.StateRequestMessage,
+    message.StateMessage, message.LeaseMessage, message.LeaseAckMessage,
+    message.ReadIndexMessage, message.ReadIndexReplyMessage,
+    message.CheckpointMessage, message.DigestRequestMessage, message.DigestsMessage,
+    message.HeartbeatMessage,
+]
+
+FIELDS = [[p for p in inspect.signature(cls.__init__).parameters if p != "self"]
+          for cls in MESSAGES]
+MESSAGE_TYPES = {cls: (n, FIELDS[n]) for n, cls in enumerate(MESSAGES)}
+
+I32 = struct.Struct("<i")
+I64 = struct.Struct("<q")
+U16 = struct.Struct("<H")
+U32 = struct.Struct("<I")
+F64 = struct.Struct("<d")
+BALLOT = struct.Struct("<IH")
+COMMAND = struct.Struct("<IIB")
+RECORD = struct.Struct("<IIH")
+
+SMALLINT, SHORTSTR, STRREF = ord("b"), ord("s"), ord("r")
+new_tuple = tuple.__new__   # Builds a namedtuple without the call to its __new__
+
+def pack_commands(commands):
+    """
+    Bulk encoding of commands: a 4 byte count, a RECORD with the
+    client, request id and operation length of every command, and
+    then the operations. Return the bytes, or None if some command
+    has no integer client and request id or no str operation.
+    """
+    records = bytearray(U32.pack(len(commands)))
+    ops = []
+    pack = RECORD.pack
+    for c in commands:
+        if type(c) is not Command:
+            return None
+        client, req_id, op = c
+        if type(op) is not str or type(client) is not int or type(req_id) is not int or \
+           not (0 <= client <= 0xffffffff and 0 <= req_id <= 0xffffffff):
+            return None
+        b = op.encode()
+        if len(b) > 0xffff:
+            return None
+        records += pack(client, req_id, len(b))
+        ops.append(b)
+    return records + b"".join(ops)
+
+class Encoder:
+    """ Appends tagged values to a bytearray. """
+    def __init__(self):
+        self.buf = bytearray([VERSION])
+        self.strings = {}
+
+    def value(self, v):
+        t = type(v)
+        buf = self.buf
+        if v is None:
+            buf += b"N"
+        elif t is bool:
+            buf += b"T" if v else b"F"
+        elif t is str:
+            ref = self.strings.get(v)
+            if ref is not None:
+                buf += b"r"
+                buf += U16.pack(ref)
+                return
+            if len(self.strings) < MAXSTRINGS:
+                self.strings[v] = len(self.strings)
+            b = v.encode()
+            if len(b) < 256:
+                buf += b"s"
+                buf.append(len(b))
+                buf += b
+            else:
+                buf += b"u"
+                self.bytes(b)
+        elif t is int:
+            if 0 <= v < 256:
+                buf += b"b"
+                buf.append(v)
+            elif -0x80000000 <= v < 0x80000000:
+                buf += b"i"
+                buf += I32.pack(v)
+            elif -0x8000000000000000 <= v < 0x8000000000000000:
+                buf += b"q"
+                buf += I64.pack(v)
+            else:
+                buf += b"I"
+                self.bytes(str(v).encode())
+        elif t is BallotNumber:
+            r, l = v
+            if type(r) is int and type(l) is int and 0 <= r <= 0xffffffff and 0 <= l <= 0xffff:
+                buf += b"o"
+                buf += BALLOT.pack(r, l)
+                return
+            buf += b"B"
+            self.value(r)
+            self.value(l)
+        elif t is Command:
+            client, req_id, op = v
+            if type(op) is str and type(client) is int and type(req_id) is int and \
+               0 <= client <= 0xffffffff and 0 <= req_id <= 0xffffffff:
+                b = op.encode()
+                if len(b) < 256:
+                    buf += b"c"
+                    buf += COMMAND.pack(client, req_id, len(b))
+                    buf += b
+                    return
+            buf += b"C"
+            self.value(client)
+            self.value(req_id)
+            self.value(op)
+        elif t is PValue:
+            buf += b"P"
+            self.value(v.ballot_number)
+            self.value(v.slot_number)
+            self.value(v.command)
+        elif t is ReconfigCommand:
+            buf += b"R"
+            self.value(v.client)
+            self.value(v.req_id)
+            self.value(v.config)
+        elif t is BatchCommand:
+            bulk = pack_commands(v.commands)
+            buf += b"K" if bulk is None else b"k"
+            self.value(v.client)
+            self.value(v.req_id)
+            if bulk is None:
+                self.sequence(v.commands)
+            else:
+                self.buf += bulk
+        elif t is Config:
+            buf += b"G"
+            self.sequence(v.replicas)
+            self.sequence(v.acceptors)
+            self.sequence(v.leaders)
+        elif t in MESSAGE_TYPES:
+            n, fields = MESSAGE_TYPES[t]
+            buf += b"M"
+            buf.append(n)
+            for field in fields:
+                self.value(getattr(v, field))
+        elif t is float:
+            buf += b"d"
+            buf += F64.pack(v)
+        elif t is bytes:
+            buf += b"y"
+            self.bytes(v)
+        elif t is tuple:
+            buf += b"t"
+            self.sequence(v)
+        elif t is list:
+            buf += b"l"
+            self.sequence(v)
+        elif t is set or t is frozenset:
+            if len(v) > 0 and all(type(pv) is PValue for pv in v):
+                self.pvalues(v)
+            else:
+                buf += b"S"
+                self.sequence(v)
+        elif t is dict:
+            buf += b"m"
+            buf += U32.pack(len(v))
+            for key, val in v.items():
+                self.value(key)
+                self.value(val)
+        else:
+            raise TypeError("Cannot encode %s" % t.__name__)
+
+    def bytes(self, b):
+        self.buf += U32.pack(len(b))
+        self.buf += b
+
+    def sequence(self, seq):
+        self.buf += U32.pack(len(seq))
+        for v in seq:
+            self.value(v)
+
+    def pvalues(self, pvalues):
+        """
+        Bulk encoding of a set of pvalues. The distinct ballot numbers
+        are written once as a table, followed by two arrays holding
+        the ballot index and slot number of every pvalue, and finally
+        the commands in the same order, in bulk if they all allow it.
+        """
+        ballots = {}
+        index = array("I")
+        slots = array("q")
+        commands = []
+        for pv in pvalues:
+            b = ballots.get(pv.ballot_number)
+            if b is None:
+                b = ballots[pv.ballot_number] = len(ballots)
+            index.append(b)
+            slots.append(pv.slot_number)
+            commands.append(pv.command)
+        bulk = pack_commands(commands)
+        self.buf += b"V" if bulk is None else b"W"
+        self.sequence(list(ballots))
+        if sys.byteorder != "little":
+            index.byteswap()
+            slots.byteswap()
+        self.buf += U32.pack(len(commands))
+        self.buf += index.tobytes()
+        self.buf += slots.tobytes()
+        if bulk is not None:
+            self.buf += bulk
+            return
+        for c in commands:
+            self.value(c)
+
+class Decoder:
+    """ Reads tagged values from a bytes-like object. """
+    def __init__(self, data):
+        self.data = data if type(data) is bytes else bytes(data)
+        self.pos = 0
+        self.strings = []
+
+    def value(self):
+        data = self.data
+        pos = self.pos
+        tag = data[pos]
+        if tag == SMALLINT:
+            self.pos = pos + 2
+            return data[pos + 1]
+        if tag == STRREF:
+            self.pos = pos + 3
+            return self.strings[U16.unpack_from(data, pos + 1)[0]]
+        if tag == SHORTSTR:
+            end = pos + 2 + data[pos + 1]
+            v = data[pos + 2:end].decode()
+            self.pos = end
+            if len(self.strings) < MAXSTRINGS:
+                self.strings.append(v)
+            return v
+        self.pos = pos + 1
+        f = DECODERS[tag]
+        if f is None:
+            raise ValueError("Unknown tag %r at offset %d" % (chr(tag), self.pos - 1))
+        return f(self)
+
+    def long_str(self):
+        v = self.bytes().decode()
+        if len(self.strings) < MAXSTRINGS:
+            self.strings.append(v)
+        return v
+
+    def ballot(self):
+        key = BALLOT.unpack_from(self.data, self.pos)
+        self.pos += 6
+        b = BALLOTS.get(key)
+        return b if b is not None else intern_ballot(*key)
+
+    def command(self):
+        client, req_id, n = COMMAND.unpack_from(self.data, self.pos)
+        start = self.pos + 9
+        self.pos = start + n
+        return new_tuple(Command, (client, req_id, self.data[start:self.pos].decode()))
+
+    def int32(self):
+        v = I32.unpack_from(self.data, self.pos)[0]
+        self.pos += 4
+        return v
+
+    def int64(self):
+        v = I64.unpack_from(self.data, self.pos)[0]
+        self.pos += 8
+        return v
+
+    def bigint(self):
+        return int(str(self.bytes(), "ascii"))
+
+    def float64(self):
+        v = F64.unpack_from(self.data, self.pos)[0]
+        self.pos += 8
+        return v
+
+    def message(self):
+        n = self.data[self.pos]
+        self.pos += 1
+        cls = MESSAGES[n]
+        msg = cls.__new__(cls)
+        for field in FIELDS[n]:
+            setattr(msg, field, self.value())
+        return msg
+
+    def dict(self):
+        n = self.count()
+        return {self.value(): self.value() for i in range(n)}
+
+    def count(self):
+        n = U32.unpack_from(self.data, self.pos)[0]
+        self.pos += 4
+        return n
+
+    def bytes(self):
+        n = self.count()
+        b = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return b
+
+    def sequence(self):
+        return [self.value() for i in range(self.count())]
+
+    def commands(self):
+        """ Decode commands written by pack_commands(). Return a list. """
+        n = self.count()
+        data = self.data
+        start = self.pos + RECORD.size * n
+        records = RECORD.iter_unpack(data[self.pos:start])
+        commands = []
+        append = commands.append
+        for client, req_id, length in records:
+            end = start + length
+            append(new_tuple(Command, (client, req_id, data[start:end].decode())))
+            start = end
+        self.pos = start
+        return commands
+
+    def pvalues(self, bulk=False):
+        ballots = self.sequence()
+        n = self.count()
+        index = array("I")
+        index.frombytes(self.data[self.pos:self.pos + 4 * n])
+        self.pos += 4 * n
+        slots = array("q")
+        slots.frombytes(self.data[self.pos:self.pos + 8 * n])
+        self.pos += 8 * n
+        if sys.byteorder != "little":
+            index.byteswap()
+            slots.byteswap()
+        if bulk:
+            commands = self.commands()
+            return set([new_tuple(PValue, (ballots[b], s, c)) for b, s, c in zip(index, slots, commands)])
+        value = self.value
+        return set([PValue(ballots[b], s, value()) for b, s in zip(index, slots)])
+
+DECODERS = [None] * 256
+for tag, f in [
+        ("N", lambda d: None),
+        ("T", lambda d: True),
+        ("F", lambda d: False),
+        ("i", Decoder.int32),
+        ("q", Decoder.int64),
+        ("I", Decoder.bigint),
+        ("d", Decoder.float64),
+        ("u", Decoder.long_str),
+        ("y", Decoder.bytes),
+        ("t", lambda d: tuple(d.sequence())),
+        ("l", Decoder.sequence),
+        ("S", lambda d: set(d.sequence())),
+        ("m", Decoder.dict),
+        ("B", lambda d: intern_ballot(d.value(), d.value())),
+        ("o", Decoder.ballot),
+        ("P", lambda d: PValue(d.value(), d.value(), d.value())),
+        ("C", lambda d: Command(d.value(), d.value(), d.value())),
+        ("c", Decoder.command),
+        ("R", lambda d: ReconfigCommand(d.value(), d.value(), d.value())),
+        ("K", lambda d: BatchCommand(d.value(), d.value(), tuple(d.sequence()))),
+        ("k", lambda d: BatchCommand(d.value(), d.value(), tuple(d.commands()))),
+        ("G", lambda d: Config(d.sequence(), d.sequence(), d.sequence())),
+        ("V", Decoder.pvalues),
+        ("W", lambda d: d.pvalues(True)),
+        ("M", Decoder.message)]:
+    DECODERS[ord(tag)] = f
+
+def dumps(obj):
+    """ Encode a message or value. Return bytes. """
+    e = Encoder()
+    e.value(obj)
+    return bytes(e.buf)
+
+def loads(data):
+    """ Decode bytes produced by dumps(). Return the message or value. """
+    if len(data) == 0 or data[0] != VERSION:
+        raise ValueError("Unsupported wire format version %r" % (data[:1],))
+    d = Decoder(data)
+    d.pos = 1
+    return d.value()
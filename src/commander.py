@@ -2,18 +2,26 @@
 #|                                             |
 #| From: https://github.com/denizalti/paxosmmc |
 #|_____________________________________________|
-from message import P2aMessage,P2bMessage,PreemptedMessage,DecisionMessage
+from message import P2aMessage,P2bMessage,PreemptedMessage,DecisionMessage,TimerMessage
 from process import Process
-from utils import Command
+from utils import Command, THRIFTYTIMEOUT, measure, penalize
+from quorum import Majority
 
 class Commander(Process):
     """
     The commander runs what is known as phase 2 of the Synod
     protocol.  Every commander is created for a specific ballot
-    number, slot number and command triple.
+    number, slot number and command triple, and waits for a phase 2
+    quorum of its leader's quorum system (see quorum.py), by default a
+    majority. A commander given the
+    latency map of a thrifty leader sends p2a messages to the first
+    phase 2 quorum of acceptors only, which the leader ranks by latency,
+    and to the others if they have not answered within
+    THRIFTYTIMEOUT seconds. It adds its replies to the map.
     """
     def __init__(self, env, id, leader, acceptors, replicas,
-                             ballot_number, slot_number, command):
+                             ballot_number, slot_number, command, latency=None,
+                             quorum=None):
         Process.__init__(self, env, id)
         self.leader = leader
         self.acceptors = acceptors
@@ -21,17 +29,41 @@ class Commander(Process):
         self.ballot_number = ballot_number
         self.slot_number = slot_number
         self.command = command
+        self.acceptor_latency = latency
+        self.quorum = quorum if quorum is not None else Majority(acceptors)
+        self.latency = env.metrics.histogram("paxos_p2a_quorum_seconds",
+            "Time from sending a p2a to a quorum of p2b replies.", role=self.role)
         self.env.addProc(self)
 
-    def body(self):
+    def onStart(self):
         """
-        A commander sends a p2a message to all acceptors, and waits
-        for p2b responses. In each such response the ballot number in the
-        message will be greater than the ballot number of the commander.
-        There are two cases:
+        A commander starts by sending a p2a message to all acceptors,
+        or to a quorum if it is thrifty.
+        """
+        self.waitfor = set(self.acceptors)
+        self.started = self.sent = self.now()
+        if self.acceptor_latency is None:
+            self.sendAll()
+            return
+        self.preferred = set(self.quorum.preferred2(self.acceptors))
+        for a in self.preferred:
+            self.sendMessage(a, P2aMessage(self.id, self.ballot_number, self.slot_number, self.command))
+        self.setTimer(THRIFTYTIMEOUT, TimerMessage(self.id, "fallback"))
+
+    def sendAll(self):
+        """ Send a p2a message to every acceptor that has not answered. """
+        for a in self.waitfor:
+            self.sendMessage(a, P2aMessage(self.id, self.ballot_number, self.slot_number, self.command))
+
+    def handle(self, msg):
+        """
+        A commander waits for p2b responses to its p2a messages. In
+        each such response the ballot number in the message will be
+        greater than the ballot number of the commander. There are two
+        cases:
 
         - If a commander receives p2b messages with its ballot number
-        from all acceptors in a majority of acceptors, then the
+        from all acceptors in a phase 2 quorum of acceptors, then the
         commander learns that the command has been chosen for the
         slot. In this case, the commander notifies all replicas and
         exits.
@@ -42,21 +74,37 @@ class Commander(Process):
         ballot number may no longer be able to make progress. In this
         case, the commander notifies its leader about the existence of
         the higher ballot number, and exits.
+
+        - If an acceptor refuses the p2a because the slot is below its
+        watermark, the slot has already been decided. The commander
+        passes the refusal on to its leader and exits.
+
+        - Timer: A thrifty commander has not heard from a quorum
+        within THRIFTYTIMEOUT seconds and sends its p2a message to
+        every acceptor that has not answered, again every
+        THRIFTYTIMEOUT seconds until it exits.
         """
-        waitfor = set()
-        for a in self.acceptors:
-            self.sendMessage(a, P2aMessage(self.id, self.ballot_number, self.slot_number, self.command))
-            waitfor.add(a)
-
-        while True:
-            msg = self.getNextMessage()
-            if isinstance(msg, P2bMessage):
-                if self.ballot_number == msg.ballot_number and msg.src in waitfor:
-                    waitfor.remove(msg.src)
-                    if len(waitfor) < float(len(self.acceptors))/2:
-                        for r in self.replicas:
-                            self.sendMessage(r, DecisionMessage(self.id, self.slot_number, self.command))
-                        return
-                else:
-                    self.sendMessage(self.leader, PreemptedMessage(self.id, msg.ballot_number))
+        if isinstance(msg, P2bMessage):
+            if msg.compacted:
+                self.sendMessage(self.leader, P2bMessage(self.id, msg.ballot_number,
+                                                         self.slot_number, True))
+                self.stop()
+            elif self.ballot_number == msg.ballot_number:
+                if msg.src not in self.waitfor:
                     return
+                if self.acceptor_latency is not None:
+                    measure(self.acceptor_latency, msg.src, self.now() - self.sent)
+                self.waitfor.remove(msg.src)
+                if self.quorum.phase2(self.waitfor):
+                    self.latency.record(self.now() - self.started)
+                    for r in self.replicas:
+                        self.sendMessage(r, DecisionMessage(self.id, self.slot_number, self.command))
+                    self.stop()
+            else:
+                self.sendMessage(self.leader, PreemptedMessage(self.id, msg.ballot_number))
+                self.stop()
+        elif isinstance(msg, TimerMessage):
+            penalize(self.acceptor_latency, self.waitfor & self.preferred, self.now() - self.sent)
+            self.sent = self.now()
+            self.sendAll()
+            self.setTimer(THRIFTYTIMEOUT, TimerMessage(self.id, "fallback"))
@@ -1,48 +1,43 @@
 #!/usr/bin/env python3
-import numpy as np
 import sys
+from analyze import load_all, divergence
 
 
 class ConfirmConsensus:
-    def __init__(self, n):
-        self.n = n
-        self.op = self.__get_ops__()
+    def __init__(self, results):
+        self.results = results
+        self.replicas = self.__get_replicas__()
         self.__confirm__()
 
-    def __get_ops__(self):
-        oplist = []
-        for i in range(int(self.n)):
-            file = "thr_replica_"+str(i)
-            tmp = []
-            try:
-                with open(file, mode='r') as f:
-                    next(f)
-                    for line in f:
-                        op = line.rstrip('\n').split(':')[0]
-                        tmp.append(op)
-                oplist.append(tmp)
-            except Exception as e:
-                print(e)
-                exit(0)
-        return oplist
+    def __get_replicas__(self):
+        try:
+            replicas = load_all(self.results)
+        except Exception as e:
+            print(e)
+            exit(0)
+        if not replicas:
+            print("No results in", self.results)
+            exit(0)
+        return replicas
 
     def __confirm__(self):
         is_ok = True
-        for i in range(len(self.op)):
-            consensus = self.op[0] == self.op[i]
-            if not consensus:
-                print("Consensus not reached between replica 0 and replica", i)
+        runs = max(len(meta) for columns, meta in self.replicas.values())
+        for run in range(runs):
+            slot = divergence(self.replicas, run)
+            if slot is not None:
+                print("Consensus not reached between replicas in run", run, "at slot", slot)
                 is_ok = False
         if is_ok:
             print("Ok")
 
 def main():
     try:
-        n = sys.argv[1]
+        results = sys.argv[1]
     except:
-        print("Please specify number of replicas")
+        print("Please specify the results directory")
         exit(0)
-    ConfirmConsensus(n)
+    ConfirmConsensus(results)
 
 
 
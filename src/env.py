@@ -2,112 +2,324 @@
 #|                                             |
 #| From: https://github.com/denizalti/paxosmmc |
 #|_____________________________________________|
-import os, signal, sys, time, threading
+import functools, itertools, os, signal, sys, time
 from acceptor import Acceptor
-from leader import Leader
-from message import RequestMessage, DoneMessage
+from checker import ConsensusChecker
+from faults import FaultInjector
+from leader import Leader, ELECTIONS
+from loadgen import LoadGenerator, Workload, MODES, WORKLOADS, DISTRIBUTIONS
+from message import DoneMessage
+from metrics import Registry, Exporter, FORMATS
 from process import Process
+from quorum import make_quorum
 from replica import Replica
+from runtime import get_runtime, RUNTIMES, SimRuntime
+from transport import get_transport, TRANSPORTS
+from statemachine import STATEMACHINES
+from wal import FSYNC
 from utils import *
 import argparse
 
 class Env:
     """
     This is the main code in which all processes are created and run. This
-    code also simulates a set of clients submitting requests.
+    code also simulates a set of clients submitting requests, see
+    loadgen.LoadGenerator.
+
+    Processes are addressed by integer ids. Named processes such as
+    replicas, acceptors, leaders and clients get consecutive ids from
+    register(), which also records their names for output. Scouts and
+    commanders get ids from childId(), whose low NODEBITS bits are the
+    id of the process that spawned them.
+
+    All processes record their metrics in the registry metrics (see
+    metrics.py). With a metrics path, a snapshot is written to it
+    every metrics_interval seconds and when the run ends. With check,
+    a ConsensusChecker compares the log digests of the replicas while
+    they run. With the sim runtime, all processes run in simulated
+    time with the link latencies latency and links (see
+    runtime.SimRuntime), and every wait for them handles their events.
+    With faults, a FaultInjector plays a scenario of faults on the
+    messages and processes (see faults.parse_event()). With a deadline
+    of more than zero seconds, a run stops waiting for the load after
+    that many seconds, whether or not every request was answered.
     """
-    def __init__(self, requests, config, timeout, clients):
+    def __init__(self, requests, config, timeout, clients, transport="local",
+                 runtime="thread", phase2="leader", batch_size=1, linger=0,
+                 window=0, outstanding=0, wal=None, fsync="group",
+                 state_machine="kv", lease=0, mode=None, rate=0, workload="plain",
+                 keys=1000, distribution="uniform", payload=16, reads=0,
+                 metrics=None, metrics_interval=1.0, metrics_format="json", results=None,
+                 check=False, latency="0.0005", links=(), seed=1, service=0,
+                 faults=(), deadline=0, election="stable", heartbeat=HEARTBEATINTERVAL,
+                 suspect=SUSPECTTIMEOUT, thrifty=False, quorum="majority"):
         self.procs = {}
+        self.names = []
+        self.ids = {}
+        self.children = itertools.count(1)
+        self.phase2 = phase2
+        self.batch_size = int(batch_size)
+        self.linger = float(linger)
+        self.window = int(window)
+        self.outstanding = int(outstanding)
+        self.wal = wal
+        self.fsync = fsync
+        self.state_machine = state_machine
+        self.lease = float(lease)
+        self.election = election
+        self.heartbeat = float(heartbeat)
+        self.suspect = float(suspect)
+        self.thrifty = bool(thrifty)
+        self.quorum = quorum
+        self.mode = mode
+        self.rate = float(rate)
+        self.workload = workload
+        self.keys = int(keys)
+        self.distribution = distribution
+        self.payload = int(payload)
+        self.reads = float(reads)
+        self.metrics = Registry()
+        self.metrics_path = metrics
+        self.metrics_interval = float(metrics_interval)
+        self.metrics_format = metrics_format
+        self.exporter = None
+        self.results = results
+        self.check = check
+        self.checker = None
+        self.scenario = faults
+        self.seed = seed
+        self.faults = None
+        self.deadline = float(deadline)
+        self.spawns = {}
+        self.transport = get_transport(transport)
+        options = {}
+        if runtime == SimRuntime.name:
+            options = {"latency": latency, "links": links, "seed": seed, "service": service}
+        self.runtime = get_runtime(runtime, **options)
         self.NACCEPTORS = int(config["acceptors"])
         self.NREPLICAS = int(config["replicas"])
         self.NLEADERS = int(config["leaders"])
+        # Reject quorums that need not intersect before any process starts
+        make_quorum(quorum, list(range(self.NACCEPTORS)))
         self.timeout = float(timeout)
         self.NCLIENTS = int(clients)
         self.NREQUESTS = int(requests/self.NCLIENTS)
         self.total_requests = requests
 
     def sendMessage(self, dst, msg):
-        if dst in self.procs:
-            self.procs[dst].deliver(msg)
+        proc = self.procs.get(dst)
+        if proc is not None:
+            if self.faults is not None:
+                self.faults.send(proc, msg)
+            else:
+                proc.deliver(msg)
+        else:
+            self.transport.send(dst, msg)
+
+    def register(self, name):
+        """ Return the process id of name, assigning the next free id to a new name. """
+        pid = self.ids.get(name)
+        if pid is None:
+            if len(self.names) > NODEMASK:
+                raise ValueError("Cannot register more than %d named processes" % (NODEMASK + 1))
+            pid = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return pid
+
+    def childId(self, owner):
+        """ Return a new process id for a process spawned by owner. """
+        return owner | (next(self.children) << NODEBITS)
+
+    def name(self, pid):
+        """ Return the name of a process id. """
+        node = pid & NODEMASK
+        name = self.names[node] if node < len(self.names) else str(node)
+        if pid > NODEMASK:
+            return "%s:%d" % (name, pid >> NODEBITS)
+        return name
+
+    def logPath(self, pid):
+        """
+        Return the path of the write-ahead log of acceptor pid, or
+        None without a log directory.
+        """
+        if self.wal is None:
+            return None
+        os.makedirs(self.wal, exist_ok=True)
+        return os.path.join(self.wal, self.name(pid).replace(" ", "_") + ".wal")
+
+    def resultsPath(self, pid):
+        """
+        Return the directory replica pid writes its results to, or
+        None without a results directory.
+        """
+        if self.results is None:
+            return None
+        return os.path.join(self.results, self.name(pid).replace(" ", "_"))
+
+    def exportMetrics(self, path):
+        """ Start writing the metrics to path every metrics_interval seconds. """
+        self.exporter = Exporter(self.metrics, path, self.metrics_interval, self.metrics_format)
+        self.exporter.start()
 
     def addProc(self, proc):
         self.procs[proc.id] = proc
-        proc.start()
+        self.runtime.start(proc)
 
-    def removeProc(self, pid):
-        del self.procs[pid]
+    def removeProc(self, pid, proc=None):
+        """ Forget process pid, unless it has been replaced by a process other than proc. """
+        if proc is None or self.procs.get(pid) is proc:
+            self.procs.pop(pid, None)
 
-    def sendClientRequest(self, i, c, r):
-        pid = "client %d.%d" % (c,i)
-        cmd = Command(pid, 0, "operation %d.%d" % (c, i))
-        self.sendMessage(r, RequestMessage(pid,cmd, str(time.time())))
-        print("Sent",cmd, "from", pid, "to", r)
+    def spawn(self, pid, role, *args, **kwargs):
+        """ Create the named process pid of class role, remembering how for restart(). """
+        self.spawns[pid] = functools.partial(role, self, pid, *args, **kwargs)
+        return self.spawns[pid]()
 
-    def run(self):
+    def crash(self, pid):
+        """ Stop the named process pid and every process it spawned, as if its node failed. """
+        for proc in list(self.procs.values()):
+            if proc.id & NODEMASK == pid:
+                self.removeProc(proc.id, proc)
+                proc.stop()
+                proc.deliver(None)
+
+    def restart(self, pid):
+        """
+        Create the named process pid again from the arguments it was
+        first created with. Return False if it is still running or was
+        not created by spawn().
+        """
+        if pid in self.procs or pid not in self.spawns:
+            print("Cannot restart", self.name(pid))
+            return False
+        self.spawns[pid]()
+        return True
+
+    def shutdown(self):
+        """
+        Stop every process, wait for the threads of the threaded
+        runtime to exit, and release the runtime and the transport.
+        """
+        procs = list(self.procs.values())
+        for proc in procs:
+            proc.stop()
+            proc.deliver(None)
+        for proc in procs:
+            if proc.is_alive():
+                proc.join(1.0)
+        self.runtime.close()
+        self.transport.close()
+        if self.exporter is not None:
+            self.exporter.stop()
+            self.exporter = None
+
+    def setup(self):
+        """ Create all replicas, acceptors and leaders. Return the initial Config. """
         initialconfig = Config([], [], [])
+        if self.check:
+            self.checker = self.register("checker")
         # Create replicas
         c = 0
         for i in range(self.NREPLICAS):
-            pid = "replica %d" % i
-            Replica(self, pid, initialconfig)
+            pid = self.register("replica %d" % i)
+            self.spawn(pid, Replica, initialconfig, self.batch_size, self.linger, self.window,
+                       self.state_machine, self.lease, self.resultsPath(pid),
+                       election=self.election)
             initialconfig.replicas.append(pid)
+        if self.check:
+            self.checker = ConsensusChecker(self, self.checker, list(initialconfig.replicas)).id
         # Create acceptors (initial configuration)
         for i in range(self.NACCEPTORS):
-            pid = "acceptor %d.%d" % (c,i)
-            Acceptor(self, pid)
+            pid = self.register("acceptor %d.%d" % (c,i))
+            self.spawn(pid, Acceptor, self.logPath(pid), self.fsync, self.lease)
             initialconfig.acceptors.append(pid)
         # Create leaders (initial configuration)
         for i in range(self.NLEADERS):
-            pid = "leader %d.%d" % (c,i)
-            Leader(self, pid, initialconfig)
+            pid = self.register("leader %d.%d" % (c,i))
+            self.spawn(pid, Leader, initialconfig, commanders=self.phase2 == "commander",
+                       lease=self.lease, election=self.election, heartbeat=self.heartbeat,
+                       suspect=self.suspect, thrifty=self.thrifty, quorum=self.quorum)
             initialconfig.leaders.append(pid)
-        # Send client requests to replicas
-        threads = []
-        for i in range(self.NREQUESTS):
-            for c in range(self.NCLIENTS):
-                for r in initialconfig.replicas:
-                    t = threading.Thread(target=self.sendClientRequest, args=[i,c,r])
-                    threads.append(t)
-                    for thread in threads:
-                        if not thread.is_alive():
-                            thread.start()
-                            time.sleep(self.timeout)
-                    threads.remove(thread)
-
-        # send equal amount of requests for each run divided amoung n clients.
-        if (self.total_requests % self.NCLIENTS != 0):
-            master = self.NCLIENTS + 1
-            diff = self.total_requests % self.NCLIENTS
-            for i in range(diff):
-                for r in initialconfig.replicas:
-                    t = threading.Thread(target=self.sendClientRequest, args=[i, master, r])
-                    threads.append(t)
-                    for thread in threads:
-                        if not thread.is_alive():
-                            thread.start()
-                            time.sleep(self.timeout)
-                    threads.remove(thread)
+        if self.scenario:
+            self.faults = FaultInjector(self, self.register("faults"), self.scenario, self.seed)
+        return initialconfig
+
+    def run(self):
+        self.execute()
+        self.shutdown()
+        self._graceexit()
+
+    def execute(self):
+        """
+        Run all requests against a new configuration and wait until
+        every replica has written its measurements. Return the
+        LoadGenerator.
+        """
+        if self.metrics_path:
+            self.exportMetrics(self.metrics_path)
+        initialconfig = self.setup()
+        generator = self.runLoad(initialconfig)
+        if not generator.done:
+            return generator
+        # Gets answered under a lease never reach the log
+        logged = self.total_requests
+        if self.lease > 0:
+            logged -= generator.workload.gets
 
         for r in initialconfig.replicas:
-            pid = "master"
-            cmd = Command(pid, self.NCLIENTS, str(self.total_requests))
+            pid = self.register("master")
+            cmd = Command(pid, self.NCLIENTS, str(logged))
             self.sendMessage(r, DoneMessage(pid,cmd))
-            print("Sent",cmd, "from", pid, "to", r)
+            print("Sent",cmd, "from", self.name(pid), "to", self.name(r))
 
-        done = 0
-        keylist = [i for i in self.procs.keys() if i.startswith("replica")]
-        while done < self.NREPLICAS:
-            for key in keylist:
-                if self.procs[key].written:
-                    done += 1
-            time.sleep(2)
+        # Replicas that crashed and were not restarted never write
+        self.runtime.wait(lambda: all(self.procs[r].written for r in initialconfig.replicas
+                                      if r in self.procs), 0.05)
+        if self.checker is not None:
+            checker = self.procs[self.checker]
+            self.runtime.wait(lambda: checker.queueDepth() == 0)
+            print(checker.report())
+        return generator
 
-        self._graceexit()
+    def runLoad(self, initialconfig, generator=LoadGenerator):
+        """
+        Drive the replicas with a LoadGenerator that plays NCLIENTS
+        clients, and wait until all requests have been answered.
+        Without an explicit mode, clients are closed-loop when
+        outstanding is set or timeout is 0, and otherwise send one
+        request every timeout seconds each. generator is the class of
+        the load generator. Return the load generator.
+        """
+        mode = self.mode
+        if mode is None:
+            mode = "closed" if self.outstanding > 0 or self.timeout == 0 else "fixed"
+        rate = self.rate or (self.NCLIENTS / self.timeout if self.timeout > 0 else 1000.0)
+        workload = Workload(self.workload, self.keys, self.distribution,
+                            payload=self.payload, reads=self.reads)
+        generator = generator(self, self.register("clients"), initialconfig.replicas,
+                              self.total_requests, self.NCLIENTS, mode,
+                              max(1, self.outstanding), rate, workload)
+        if self.deadline > 0:
+            deadline = self.runtime.now() + self.deadline
+            self.runtime.wait(lambda: generator.done or self.runtime.now() > deadline)
+        else:
+            self.runtime.wait(lambda: generator.done)
+        if not generator.done:
+            print("Load: %d of %d requests answered within the deadline of %.2f s" %
+                  (generator.answered, self.total_requests, self.deadline))
+            return generator
+        elapsed = generator.finished - generator.started
+        print("Load: %d requests in %.2f s, %.1f requests/sec" %
+              (self.total_requests, elapsed, self.total_requests / elapsed))
+        return generator
 
     def terminate_handler(self, signal, frame):
         self._graceexit()
 
     def _graceexit(self, exitcode=0):
+        if self.exporter is not None:
+            self.exporter.stop()
         print("\nExiting multi-paxos gracefully...\n")
         sys.stdout.flush()
         sys.stderr.flush()
@@ -121,9 +333,82 @@ def parse_args():
     p.add_argument("-C", "--config", required=True, type=str,
         help="Specify configuration of multi-paxos system.")
     p.add_argument("-T", "--timeout", required=True, type=float,
-        help="Timeout length before a client sends the next request.")
+        help="Seconds between the requests of each client in open-loop mode, unless --rate is given.")
     p.add_argument("-c", "--clients", required=True, type=int,
         help="Number of connecting clients.")
+    p.add_argument("-t", "--transport", required=False, type=str, default="local",
+        choices=sorted(TRANSPORTS),
+        help="Transport that carries messages between processes.")
+    p.add_argument("-R", "--runtime", required=False, type=str, default="thread",
+        choices=sorted(RUNTIMES),
+        help="Run every process as a thread, as a coroutine on one asyncio event loop, or in a discrete-event simulation.")
+    p.add_argument("-P", "--phase2", required=False, type=str, default="leader",
+        choices=["leader", "commander"],
+        help="Run phase 2 inside the leader, or in one Commander process per slot.")
+    p.add_argument("-b", "--batch-size", required=False, type=int, default=1,
+        help="Maximum number of client commands a replica decides in one slot.")
+    p.add_argument("-l", "--linger", required=False, type=float, default=0,
+        help="Milliseconds a replica waits for a batch to fill up.")
+    p.add_argument("-w", "--window", required=False, type=int, default=0,
+        help="Number of slots that can have proposals pending, or 0 to adapt it to decision latency.")
+    p.add_argument("-o", "--outstanding", required=False, type=int, default=0,
+        help="Outstanding requests of each closed-loop client.")
+    p.add_argument("-m", "--mode", required=False, type=str, default=None, choices=MODES,
+        help="Closed-loop clients, or open-loop requests at a fixed rate or with Poisson arrivals. "
+             "By default clients are closed-loop if -o is set or -T is 0, and fixed-rate otherwise.")
+    p.add_argument("--rate", required=False, type=float, default=0,
+        help="Requests per second of all clients together in open-loop mode.")
+    p.add_argument("--workload", required=False, type=str, default="plain", choices=WORKLOADS,
+        help="Plain string operations, or gets and puts of the key-value store.")
+    p.add_argument("--keys", required=False, type=int, default=1000,
+        help="Number of keys of the kv workload.")
+    p.add_argument("--distribution", required=False, type=str, default="uniform", choices=DISTRIBUTIONS,
+        help="Distribution of the keys of the kv workload.")
+    p.add_argument("--payload", required=False, type=int, default=16,
+        help="Bytes of the value of every put of the kv workload.")
+    p.add_argument("--reads", required=False, type=float, default=0,
+        help="Fraction of the kv workload that are gets.")
+    p.add_argument("-W", "--wal", required=False, type=str, default=None,
+        help="Directory for the write-ahead logs of the acceptors. Without it acceptors keep their state in memory only.")
+    p.add_argument("-F", "--fsync", required=False, type=str, default="group", choices=FSYNC,
+        help="When acceptors fsync their log: after every record, once per group of requests, or never.")
+    p.add_argument("-S", "--state-machine", required=False, type=str, default="kv",
+        choices=sorted(STATEMACHINES),
+        help="State machine the replicas apply decided commands to.")
+    p.add_argument("--lease", required=False, type=float, default=0,
+        help="Seconds of leader leases. Above 0, replicas serve reads without a consensus round.")
+    p.add_argument("-M", "--metrics", required=False, type=str, default=None,
+        help="File the metrics are written to.")
+    p.add_argument("--metrics-interval", required=False, type=float, default=1.0,
+        help="Seconds between two writes of the metrics.")
+    p.add_argument("--metrics-format", required=False, type=str, default="json", choices=FORMATS,
+        help="Write the metrics as JSON or in the Prometheus text format.")
+    p.add_argument("-O", "--results", required=False, type=str, default=None,
+        help="Directory every replica appends the columns of its results to, see analyze.py.")
+    p.add_argument("--check", required=False, action="store_true",
+        help="Compare the log digests of the replicas during the run.")
+    p.add_argument("--latency", required=False, type=str, default="0.0005",
+        help="Latency of links in the sim runtime: SECONDS, uniform:LOW,HIGH, exp:MEAN, normal:MEAN,STDEV or lognormal:MU,SIGMA.")
+    p.add_argument("--link", required=False, type=str, action="append", default=[],
+        help="Latency of the links matching SRC>DST=SPEC in the sim runtime, with fnmatch patterns on process names. Repeatable.")
+    p.add_argument("--seed", required=False, type=int, default=1,
+        help="Seed of the random latencies of the sim runtime.")
+    p.add_argument("--service", required=False, type=float, default=0,
+        help="Seconds every process of the sim runtime takes to handle a message.")
+    p.add_argument("--fault", required=False, type=str, action="append", default=[],
+        help="Fault event TIME:ACTION[:ARG], with ACTION one of crash, restart, partition, heal, link or clear, see faults.py. Repeatable.")
+    p.add_argument("--deadline", required=False, type=float, default=0,
+        help="Seconds to wait for the load before giving up, or 0 to wait until every request is answered.")
+    p.add_argument("-E", "--election", required=False, type=str, default="stable", choices=ELECTIONS,
+        help="Elect one leader with heartbeats and a failure detector, or let leaders back off after preemption.")
+    p.add_argument("--heartbeat", required=False, type=float, default=HEARTBEATINTERVAL,
+        help="Seconds between the heartbeats of leaders.")
+    p.add_argument("--suspect", required=False, type=float, default=SUSPECTTIMEOUT,
+        help="Seconds without a heartbeat before a leader suspects another has failed.")
+    p.add_argument("--thrifty", required=False, action="store_true",
+        help="Send p1a and p2a messages to the fastest quorum of acceptors only.")
+    p.add_argument("-Q", "--quorum", required=False, type=str, default="majority",
+        help="Quorum system of the acceptors: majority, flexible:Q1,Q2 or grid:ROWS, see quorum.py.")
 
     return p.parse_args()
 
@@ -131,7 +416,15 @@ def main(args):
 
     args.config = parse_config(args.config)
 
-    e = Env(args.requests, args.config, args.timeout, args.clients)
+    e = Env(args.requests, args.config, args.timeout, args.clients, args.transport,
+            args.runtime, args.phase2, args.batch_size, args.linger,
+            args.window, args.outstanding, args.wal, args.fsync,
+            args.state_machine, args.lease, args.mode, args.rate, args.workload,
+            args.keys, args.distribution, args.payload, args.reads,
+            args.metrics, args.metrics_interval, args.metrics_format, args.results,
+            args.check, args.latency, args.link, args.seed, args.service,
+            args.fault, args.deadline, args.election, args.heartbeat, args.suspect,
+            args.thrifty, args.quorum)
     e.run()
     signal.signal(signal.SIGINT, e.terminate_handler)
     signal.signal(signal.SIGTERM, e.terminate_handler)
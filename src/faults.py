@@ -0,0 +1,213 @@
+import fnmatch
+import random
+from process import Process
+from message import TimerMessage
+from utils import NODEMASK
+
+ACTIONS = ["crash", "restart", "partition", "heal", "link", "clear"]
+CONDITIONS = ["delay", "jitter", "loss", "dup", "reorder"]
+REORDERHOLD = 0.001   # Least number of seconds a reordered message is held back
+
+class LinkConditions:
+    """
+    The conditions of a link, parsed from a spec such as
+    "delay=0.01,jitter=0.005,loss=0.1,dup=0.01,reorder=0.1":
+
+    - delay: seconds every message is held before it is delivered.
+    - jitter: up to this many seconds more, drawn uniformly, so that
+    messages may overtake each other.
+    - loss: fraction of messages dropped.
+    - dup: fraction of messages delivered twice.
+    - reorder: fraction of messages held back by another delay +
+    jitter seconds, at least REORDERHOLD, so that later messages
+    overtake them.
+    """
+    def __init__(self, spec):
+        values = dict.fromkeys(CONDITIONS, 0.0)
+        for item in spec.split(","):
+            key, _, value = item.partition("=")
+            key = key.strip()
+            if key not in values:
+                raise ValueError("Unknown link condition '%s', expected one of: %s" %
+                                 (key, ", ".join(CONDITIONS)))
+            values[key] = float(value)
+        self.delay = values["delay"]
+        self.jitter = values["jitter"]
+        self.loss = values["loss"]
+        self.dup = values["dup"]
+        self.reorder = values["reorder"]
+
+def parse_event(event):
+    """
+    Turn "TIME:ACTION[:ARG]" into (time, action, arg). ACTION is one of:
+
+    - crash:NAME / restart:NAME: stop, or start again, the named
+    processes matching the fnmatch pattern NAME.
+    - partition:A,B/C,D: split the matching processes into the groups
+    separated by "/", each a list of patterns. Messages between
+    processes of different groups are dropped. Processes that match
+    no group reach every group.
+    - heal: remove the partition.
+    - link:SRC>DST:CONDITIONS: apply LinkConditions to the links
+    between processes matching SRC and DST. The latest rule for a
+    link wins.
+    - clear: remove all link rules.
+    """
+    at, _, rest = event.partition(":")
+    action, _, arg = rest.partition(":")
+    action = action.strip()
+    if action not in ACTIONS:
+        raise ValueError("Unknown fault action '%s' in '%s', expected one of: %s" %
+                         (action, event, ", ".join(ACTIONS)))
+    if action == "link":
+        pattern, _, spec = arg.partition(":")
+        src, sep, dst = pattern.partition(">")
+        if not sep:
+            raise ValueError("Expected SRC>DST in link event '%s'" % event)
+        arg = (src, dst, LinkConditions(spec))
+    elif action == "partition":
+        arg = [group.split(",") for group in arg.split("/")]
+    return float(at), action, arg
+
+def parse_scenario(scenario):
+    """
+    Turn a list of events, or a string of events separated by ";",
+    into a list of parse_event() results ordered by time.
+    """
+    if isinstance(scenario, str):
+        scenario = scenario.split(";")
+    return sorted((parse_event(e) for e in scenario if e.strip()), key=lambda e: e[0])
+
+class FaultInjector(Process):
+    """
+    Sits between Env.sendMessage and the inboxes of the processes and
+    plays a scenario of faults (see parse_event()). Every event fires
+    on a timer at its time in seconds after the injector starts, so
+    scenarios run in virtual time under the sim runtime.
+
+    A crashed named process is stopped together with the scouts and
+    commanders it spawned, and every message from or to its node is
+    dropped until it is restarted. A restart creates the process again
+    from the arguments it was first created with (see Env.restart), so
+    it comes back with empty state: acceptors recover from their
+    write-ahead log with -W, and replicas catch up by state transfer.
+
+    Delayed messages are delivered by the timers of the runtime; under
+    the sim runtime their delay replaces the simulated link latency.
+    Every event is recorded in log as (time, action, arg) with the
+    time of the runtime clock, so that its effect on the load can be
+    measured.
+    """
+    def __init__(self, env, id, scenario, seed=1):
+        Process.__init__(self, env, id)
+        self.scenario = parse_scenario(scenario)
+        self.rng = random.Random(seed)
+        self.links = []
+        self.link_conditions = {}
+        self.groups = {}
+        self.down = set()
+        self.log = []
+        self.started = None
+        self.faulted = {}
+        self.env.addProc(self)
+
+    def onStart(self):
+        self.started = self.now()
+        for i, (at, action, arg) in enumerate(self.scenario):
+            self.setTimer(at, TimerMessage(self.id, i))
+
+    def handle(self, msg):
+        """
+        - Timer: The time of an event of the scenario has come, and
+        the injector applies it.
+        """
+        if isinstance(msg, TimerMessage):
+            at, action, arg = self.scenario[msg.tag]
+            self.apply(action, arg)
+        else:
+            print("FaultInjector: unknown msg type")
+
+    def apply(self, action, arg):
+        self.log.append((self.now(), action, arg))
+        print("Fault:", action, arg if not isinstance(arg, tuple) else "%s>%s" % arg[:2])
+        if action == "crash":
+            for pid in self.match(arg):
+                self.down.add(pid)
+                self.env.crash(pid)
+        elif action == "restart":
+            for pid in self.match(arg):
+                self.down.discard(pid)
+                self.env.restart(pid)
+        elif action == "partition":
+            self.groups = {}
+            for i, patterns in enumerate(arg):
+                for pattern in patterns:
+                    for pid in self.match(pattern):
+                        self.groups[pid] = i
+        elif action == "heal":
+            self.groups = {}
+        elif action == "link":
+            self.links.insert(0, arg)
+            self.link_conditions = {}
+        elif action == "clear":
+            self.links = []
+            self.link_conditions = {}
+
+    def match(self, pattern):
+        """ Return the ids of the named processes whose name matches pattern. """
+        return [pid for pid, name in enumerate(self.env.names)
+                if fnmatch.fnmatch(name, pattern.strip())]
+
+    def conditions(self, src, dst):
+        """ Return the LinkConditions of the link from node src to node dst, or None. """
+        key = (src, dst)
+        if key not in self.link_conditions:
+            conditions = None
+            for s, d, rule in self.links:
+                if fnmatch.fnmatch(self.env.name(src), s.strip()) and \
+                      fnmatch.fnmatch(self.env.name(dst), d.strip()):
+                    conditions = rule
+                    break
+            self.link_conditions[key] = conditions
+        return self.link_conditions[key]
+
+    def count(self, fault):
+        counter = self.faulted.get(fault)
+        if counter is None:
+            counter = self.faulted[fault] = self.env.metrics.counter(
+                "paxos_messages_faulted_total", "Messages dropped, duplicated or delayed by the fault injector.",
+                fault=fault)
+        counter.inc()
+
+    def send(self, proc, msg):
+        """ Deliver msg to proc under the faults in effect. """
+        src, dst = msg.src & NODEMASK, proc.id & NODEMASK
+        if src in self.down or dst in self.down:
+            self.count("down")
+            return
+        if self.groups:
+            a, b = self.groups.get(src), self.groups.get(dst)
+            if a is not None and b is not None and a != b:
+                self.count("partition")
+                return
+        c = self.conditions(src, dst) if self.links else None
+        if c is None:
+            proc.deliver(msg)
+            return
+        rng = self.rng
+        if c.loss > 0 and rng.random() < c.loss:
+            self.count("loss")
+            return
+        copies = 1
+        if c.dup > 0 and rng.random() < c.dup:
+            self.count("dup")
+            copies = 2
+        for i in range(copies):
+            delay = c.delay + (rng.uniform(0, c.jitter) if c.jitter > 0 else 0.0)
+            if c.reorder > 0 and rng.random() < c.reorder:
+                self.count("reorder")
+                delay += max(c.delay + c.jitter, REORDERHOLD)
+            if delay > 0:
+                self.env.runtime.setTimer(delay, proc, msg)
+            else:
+                proc.deliver(msg)
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from env import Env
+from metrics import FORMATS
+from transport import TcpTransport, CODECS
+from leader import ELECTIONS
+from utils import Config, parse_config, HEARTBEATINTERVAL, SUSPECTTIMEOUT
+from statemachine import STATEMACHINES
+from wal import FSYNC
+
+ROLES = [("acceptors", "acceptor.py"), ("replicas", "replica.py"), ("leaders", "leader.py")]
+
+def make_cluster(config, clients, requests, host, port, options, codec="binary"):
+    """
+    Assign a TCP address to every role and client. Return the cluster
+    description that is written to the cluster file.
+    """
+    roles = {
+        "replicas": ["replica %d" % i for i in range(config["replicas"])],
+        "acceptors": ["acceptor 0.%d" % i for i in range(config["acceptors"])],
+        "leaders": ["leader 0.%d" % i for i in range(config["leaders"])],
+    }
+    client_requests = {}
+    for c in range(clients):
+        n = requests // clients
+        if c == clients - 1:
+            n += requests % clients
+        client_requests["client %d" % c] = n
+    addresses = {}
+    for name in roles["replicas"] + roles["acceptors"] + roles["leaders"] + list(client_requests):
+        addresses[name] = [host, port]
+        port += 1
+    return {"config": roles, "clients": client_requests, "codec": codec,
+            "addresses": addresses, "options": options}
+
+class NodeEnv(Env):
+    """
+    The environment of one role running in its own OS process. It
+    hosts that role and the scouts and commanders it spawns, and
+    reaches every other role of the cluster through a TcpTransport.
+    Every node registers the names of the cluster file in the same
+    order, so that all nodes agree on the process id of every role.
+    """
+    def __init__(self, cluster, name, runtime="thread"):
+        config = cluster["config"]
+        counts = {role: len(names) for role, names in config.items()}
+        transport = TcpTransport(codec=cluster.get("codec", "binary"))
+        Env.__init__(self, 1, counts, 0, 1, transport, runtime, **cluster["options"])
+        for n, addr in cluster["addresses"].items():
+            self.transport.addresses[self.register(n)] = tuple(addr)
+        self.cluster = cluster
+        self.config = Config([self.ids[n] for n in config["replicas"]],
+                             [self.ids[n] for n in config["acceptors"]],
+                             [self.ids[n] for n in config["leaders"]])
+        self.transport.listen(self, cluster["addresses"][name])
+
+def start_node(create):
+    """
+    Entry point of acceptor.py, leader.py, replica.py and client.py
+    when they are run as programs. Reads the cluster file, calls
+    create(env, id) to create the role named by --id, and serves
+    until the role is done or the process is terminated.
+    """
+    p = argparse.ArgumentParser(description="Run a single multi-paxos role.")
+    p.add_argument("--cluster", required=True, type=str,
+        help="Cluster file written by launcher.py.")
+    p.add_argument("--id", required=True, type=str,
+        help="Name of the role to run, as listed in the cluster file.")
+    p.add_argument("-R", "--runtime", required=False, type=str, default="thread",
+        help="Runtime to run the processes of this node in.")
+    args = p.parse_args()
+    with open(args.cluster) as f:
+        cluster = json.load(f)
+    env = NodeEnv(cluster, args.id, args.runtime)
+    if env.metrics_path:
+        env.exportMetrics("%s.%s" % (env.metrics_path, args.id.replace(" ", "_")))
+    signal.signal(signal.SIGTERM, lambda signum, frame: env._graceexit())
+    proc = create(env, env.ids[args.id])
+    while not proc.stopped and not getattr(proc, "done", False):
+        time.sleep(0.05)
+    env._graceexit()
+
+def launch(cluster, path, runtime, logs):
+    """
+    Start every role and client of cluster as its own OS process and
+    wait for the clients to finish. Return the elapsed time in seconds.
+    """
+    with open(path, "w") as f:
+        json.dump(cluster, f, indent=1)
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def spawn(script, name):
+        out = subprocess.DEVNULL
+        if logs:
+            out = open("log_" + name.replace(" ", "_"), "w")
+        return subprocess.Popen([sys.executable, os.path.join(here, script),
+                                 "--cluster", path, "--id", name, "-R", runtime],
+                                stdout=out, stderr=subprocess.STDOUT)
+
+    servers = [spawn(script, name) for role, script in ROLES
+                                   for name in cluster["config"][role]]
+    t0 = time.time()
+    clients = [spawn("client.py", name) for name in cluster["clients"]]
+    for c in clients:
+        c.wait()
+    elapsed = time.time() - t0
+    for s in servers:
+        s.terminate()
+    for s in servers:
+        s.wait()
+    return elapsed
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run every multi-paxos role as its own OS process over TCP.")
+    p.add_argument("-C", "--config", required=False, type=str, default="2,2,3",
+        help="Configuration (REPLICAS,LEADERS,ACCEPTORS).")
+    p.add_argument("-c", "--clients", required=False, type=int, default=3,
+        help="Number of client processes.")
+    p.add_argument("-r", "--requests", required=False, type=int, default=1000,
+        help="Total requests sent by all clients.")
+    p.add_argument("-o", "--outstanding", required=False, type=int, default=8,
+        help="Outstanding requests per client.")
+    p.add_argument("-b", "--batch-size", required=False, type=int, default=1,
+        help="Maximum number of client commands a replica decides in one slot.")
+    p.add_argument("-l", "--linger", required=False, type=float, default=0,
+        help="Milliseconds a replica waits for a batch to fill up.")
+    p.add_argument("-w", "--window", required=False, type=int, default=0,
+        help="Number of slots that can have proposals pending, or 0 to adapt it.")
+    p.add_argument("-W", "--wal", required=False, type=str, default=None,
+        help="Directory for the write-ahead logs of the acceptors.")
+    p.add_argument("-F", "--fsync", required=False, type=str, default="group", choices=FSYNC,
+        help="When acceptors fsync their log.")
+    p.add_argument("-S", "--state-machine", required=False, type=str, default="kv",
+        choices=sorted(STATEMACHINES),
+        help="State machine the replicas apply decided commands to.")
+    p.add_argument("--lease", required=False, type=float, default=0,
+        help="Seconds of leader leases. Above 0, replicas serve reads without a consensus round.")
+    p.add_argument("-E", "--election", required=False, type=str, default="stable", choices=ELECTIONS,
+        help="Elect one leader with heartbeats and a failure detector, or let leaders back off after preemption.")
+    p.add_argument("--heartbeat", required=False, type=float, default=HEARTBEATINTERVAL,
+        help="Seconds between the heartbeats of leaders.")
+    p.add_argument("--suspect", required=False, type=float, default=SUSPECTTIMEOUT,
+        help="Seconds without a heartbeat before a leader suspects another has failed.")
+    p.add_argument("--thrifty", required=False, action="store_true",
+        help="Send p1a and p2a messages to the fastest quorum of acceptors only.")
+    p.add_argument("-Q", "--quorum", required=False, type=str, default="majority",
+        help="Quorum system of the acceptors: majority, flexible:Q1,Q2 or grid:ROWS, see quorum.py.")
+    p.add_argument("-M", "--metrics", required=False, type=str, default=None,
+        help="Every role writes its metrics to this path, followed by its name.")
+    p.add_argument("--metrics-interval", required=False, type=float, default=1.0,
+        help="Seconds between two writes of the metrics.")
+    p.add_argument("--metrics-format", required=False, type=str, default="json", choices=FORMATS,
+        help="Write the metrics as JSON or in the Prometheus text format.")
+    p.add_argument("-R", "--runtime", required=False, type=str, default="thread",
+        help="Runtime used inside every OS process.")
+    p.add_argument("--codec", required=False, type=str, default="binary", choices=sorted(CODECS),
+        help="Wire format of messages between roles.")
+    p.add_argument("--host", required=False, type=str, default="127.0.0.1",
+        help="Host every role listens on.")
+    p.add_argument("-p", "--port", required=False, type=int, default=9000,
+        help="First port; roles listen on consecutive ports from here.")
+    p.add_argument("--cluster", required=False, type=str, default="cluster.json",
+        help="Path of the cluster file to write.")
+    p.add_argument("--logs", required=False, action="store_true",
+        help="Write the output of every role to log_NAME.")
+    return p.parse_args()
+
+def main(args):
+    options = {"batch_size": args.batch_size, "linger": args.linger,
+               "window": args.window, "outstanding": args.outstanding,
+               "wal": args.wal, "fsync": args.fsync,
+               "state_machine": args.state_machine, "lease": args.lease,
+               "election": args.election, "heartbeat": args.heartbeat,
+               "suspect": args.suspect, "thrifty": args.thrifty,
+               "quorum": args.quorum,
+               "metrics": args.metrics, "metrics_interval": args.metrics_interval,
+               "metrics_format": args.metrics_format}
+    cluster = make_cluster(parse_config(args.config), args.clients, args.requests,
+                           args.host, args.port, options, args.codec)
+    elapsed = launch(cluster, args.cluster, args.runtime, args.logs)
+    print("%d requests in %.2f s: %.1f requests/sec" % (args.requests, elapsed,
+                                                         args.requests / elapsed))
+
+if __name__ == '__main__':
+    main(parse_args())
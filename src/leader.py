@@ -6,8 +6,13 @@ from utils import *
 from process import Process
 from commander import Commander
 from scout import Scout
+from quorum import make_quorum
 from message import ProposeMessage, AdoptedMessage, PreemptedMessage
-from time import sleep
+from message import P2aMessage, P2bMessage, DecisionMessage, TimerMessage
+from message import ExecutedMessage, CompactMessage, LeaseMessage, LeaseAckMessage
+from message import ReadIndexMessage, ReadIndexReplyMessage, HeartbeatMessage
+
+ELECTIONS = ["stable", "backoff"]
 
 class Leader(Process):
     """
@@ -18,91 +23,434 @@ class Leader(Process):
     - proposals: a map of slot numbers to proposed commands in the form
     of a set of (slot number, command) pairs, initially empty. At any
     time, there is at most one entry per slot number in the set.
-    - timeout: time in seconds the leader waits between operations
+    - timeout: time in seconds the leader waits before retrying phase 1
+    after it has been preempted
+    - phase2: a map of slot numbers to the ballot number and command
+    being decided, the set of acceptors that have not yet
+    accepted it, the time phase 2 started and the time its p2a
+    messages were last sent. This table replaces one Commander per slot unless
+    the leader is created with commanders=True.
+    - executed: a map of replicas to the first slot number they have
+    not yet executed. The lowest of these is the watermark below which
+    the leader and the acceptors forget their proposals and pvalues.
+    - lease_expiry: with a lease of more than zero seconds, the time
+    until which a phase 2 quorum of acceptors has promised not to adopt a
+    ballot of another leader. While it holds, the leader answers read
+    index requests of replicas with highest, the highest slot number
+    it has a proposal for.
+
+    Leaders elect one of them to run phase 1 in one of two ways:
+    - backoff: the original scheme. Every leader runs phase 1, and a
+    preempted leader waits timeout seconds before it tries again,
+    growing timeout while a leader with a higher id preempts it.
+    - stable: leaders send each other heartbeats every heartbeat
+    seconds, with their ballot number and whether they are active.
+    A leader not heard from for suspect seconds is suspected to have
+    failed, and suspect grows whenever a suspected leader turns out
+    to be alive. After every suspect seconds without such a mistake,
+    suspect shrinks by TIMEOUTSUBTRACT back toward the value it was
+    configured with, as timeout does in backoff. A passive leader
+    runs phase 1 only when no leader it trusts is active and it is
+    the trusted leader with the lowest id, so that a working leader
+    is never preempted by the others. A leader that becomes active
+    tells the replicas with a heartbeat.
+    - leading: the leader last known to be active, from heartbeats
+    and preemptions.
+
+    - quorum: the quorum system of the acceptors (see quorum.py), by
+    default any majority. A phase 2 quorum meets every phase 1 quorum,
+    so it also holds a lease.
+
+    A thrifty leader sends p1a and p2a messages only to a quorum of
+    acceptors, preferring those with the lowest latency, smoothed
+    over their p1b and p2b replies. Acceptors that have not answered within
+    THRIFTYTIMEOUT seconds have the wait added to their latency, and the
+    message is sent to every acceptor that has not answered yet,
+    again every THRIFTYTIMEOUT seconds, which also recovers lost
+    messages. Scouts and commanders rank the acceptors by the latency
+    map of their leader, and update it with the replies they receive.
+    - latency: a map of acceptors to their smoothed latency.
     """
-    def __init__(self, env, id, config):
+    def __init__(self, env, id, config, commanders=False, lease=0, election="stable",
+                 heartbeat=HEARTBEATINTERVAL, suspect=SUSPECTTIMEOUT, thrifty=False,
+                 quorum="majority"):
         Process.__init__(self, env, id)
-        self.ballot_number = BallotNumber(0, self.id)
+        self.ballot_number = intern_ballot(0, self.id)
         self.active = False
         self.proposals = {}
+        self.commanders = commanders
+        self.phase2 = {}
         self.timeout = 1.0
+        self.scout_timer = False
+        self.executed = {}
+        self.watermark = 1
+        self.highest = 0
+        self.scout = None
+        self.scout_started = 0
+        self.lease = lease
+        self.lease_expiry = 0
+        self.lease_sent = None
+        self.lease_acks = set()
+        self.lease_timer = False
         self.config = config
+        self.quorum = make_quorum(quorum, config.acceptors)
+        self.election = election
+        self.heartbeat = heartbeat
+        self.suspect = suspect
+        self.min_suspect = suspect
+        self.calm_since = 0.0
+        self.heard = {}
+        self.suspected = set()
+        self.leading = None
+        self.thrifty = thrifty
+        self.thrifty_timer = False
+        self.latency = {}
+        self.phase1_latency = env.metrics.histogram("paxos_p1a_adopted_seconds",
+            "Time from starting phase 1 to the adoption of the ballot.", role=self.role)
+        self.phase2_latency = env.metrics.histogram("paxos_p2a_quorum_seconds",
+            "Time from sending a p2a to a quorum of p2b replies.", role=self.role)
+        env.metrics.gauge("paxos_phase2_slots", lambda: len(self.phase2),
+            "Slots waiting for a quorum of p2b replies in the phase2 table.",
+            role=self.role, process=self.name)
         self.env.addProc(self)
 
-    def body(self):
+    def onStart(self):
         """
         The leader starts by spawning a scout for its initial ballot
-        number, and then enters into a loop awaiting messages. There
-        are three types of messages that cause transitions:
+        number, or with stable election by sending its first heartbeat.
+        """
+        print("Here I am: ", self.name)
+        if self.election == "stable":
+            self.tick()
+        else:
+            self.startScout()
+
+    def handle(self, msg):
+        """
+        There are three types of messages that cause transitions:
 
         - Propose: A replica proposes given command for given slot number
 
         - Adopted: Sent by a scout, this message signifies that the
-        current ballot number has been adopted by a majority of
+        current ballot number has been adopted by a phase 1 quorum of
         acceptors. (If an adopted message arrives for an old ballot
         number, it is ignored.) The set pvalues contains all pvalues
         accepted by these acceptors prior to the adopted ballot
         number.
 
+        - P2b: Sent by an acceptor in reply to a p2a message of the
+        leader. If the slot and ballot number match an entry in phase2, the
+        acceptor is removed from its waitfor set, and once a phase 2
+        quorum of acceptors have accepted, the command is decided and all
+        replicas are notified. A p2b message carrying a higher ballot
+        number is handled as a preemption. A compacted p2b, from an
+        acceptor or passed on by a commander, means the slot was
+        decided and compacted before: the leader forgets it.
+
         - Preempted: Sent by either a scout or a commander, it means
         that some acceptor has adopted the ballot number that is
         included in the message. If this ballot number is higher than
         the current ballot number of the leader, it may no longer be
         possible to use the current ballot number to choose a command.
-        """
-        print("Here I am: ", self.id)
-        Scout(self.env, "scout:%s:%s" % (str(self.id), str(self.ballot_number)),
-                    self.id, self.config.acceptors, self.ballot_number)
-        while True:
-            msg = self.getNextMessage()
-            if isinstance(msg, ProposeMessage):
-                if msg.slot_number not in self.proposals:
-                    self.proposals[msg.slot_number] = msg.command
-                    if self.active:
-                        Commander(self.env,"commander:%s:%s:%s" % (str(self.id),
-                                                                   str(self.ballot_number),
-                                                                   str(msg.slot_number)),
-                                  self.id, self.config.acceptors, self.config.replicas,
-                                  self.ballot_number, msg.slot_number, msg.command)
-            elif isinstance(msg, AdoptedMessage):
-                # Decrease timeout since the leader does not seem to
-                # be competing with another leader.
-                if self.timeout > TIMEOUTSUBTRACT:
-                    self.timeout = self.timeout - TIMEOUTSUBTRACT
-                    print(self.id, "Timeout decreased: ", self.timeout)
-                if self.ballot_number == msg.ballot_number:
-                    pmax = {}
-                    # For every slot number add the proposal with
-                    # the highest ballot number to proposals
-                    for pv in msg.accepted:
-                        if pv.slot_number not in pmax or \
-                              pmax[pv.slot_number] < pv.ballot_number:
-                            pmax[pv.slot_number] = pv.ballot_number
-                            self.proposals[pv.slot_number] = pv.command
-                    # Start a commander (i.e. run Phase 2) for every
-                    # proposal (from the beginning)
-                    for sn in self.proposals:
-                        Commander(self.env,
-                                  "commander:%s:%s:%s" % (str(self.id),
-                                                          str(self.ballot_number),
-                                                          str(sn)),
-                                  self.id, self.config.acceptors, self.config.replicas,
-                                  self.ballot_number, sn, self.proposals.get(sn))
-                    self.active = True
-            elif isinstance(msg, PreemptedMessage):
-                # The leader is competing with another leader
-                if msg.ballot_number.leader_id > self.id:
-                    # Increase timeout because the other leader has priority
-                    self.timeout = self.timeout * TIMEOUTMULTIPLY
-                    print(self.id, "Timeout increased: ", self.timeout)
-                if msg.ballot_number > self.ballot_number:
-                    self.active = False
-                    self.ballot_number = BallotNumber(msg.ballot_number.round+1,
-                                                      self.id)
-                    Scout(self.env, "scout:%s:%s" % (str(self.id),
-                                                     str(self.ballot_number)),
-                          self.id, self.config.acceptors, self.ballot_number)
 
+        - Executed: Sent periodically by a replica with the first slot
+        it has not yet executed. Once every replica has executed a
+        slot, the leader moves its watermark past it and tells the
+        acceptors to compact.
+
+        - Timer: The backoff after a preemption has expired, and the
+        leader retries phase 1 with its new ballot number. Or it is
+        time to renew the lease, to send the next heartbeat, or to
+        send the p2a messages of a thrifty leader to the acceptors
+        that have not answered.
+
+        - Heartbeat: Another leader is alive. If it was suspected, the
+        suspicion was wrong and the leader waits longer before
+        suspecting again.
+
+        - Lease ack: An acceptor has renewed the lease. Once a phase 2
+        quorum has renewed it, the lease is extended.
+
+        - Read index: A replica asks for the slot it must have executed
+        before it may serve reads. The leader answers with highest
+        while it holds a lease, and with None otherwise.
+        """
+        if isinstance(msg, ProposeMessage):
+            if msg.slot_number not in self.proposals and msg.slot_number >= self.watermark:
+                self.proposals[msg.slot_number] = msg.command
+                self.highest = max(self.highest, msg.slot_number)
+                if self.active:
+                    self.startPhase2(msg.slot_number, msg.command)
+        elif isinstance(msg, AdoptedMessage):
+            # Decrease timeout since the leader does not seem to
+            # be competing with another leader.
+            if self.timeout > TIMEOUTSUBTRACT:
+                self.timeout = self.timeout - TIMEOUTSUBTRACT
+                print(self.name, "Timeout decreased: ", self.timeout)
+            if msg.src == self.scout:
+                self.scout = None
+            if self.ballot_number == msg.ballot_number:
+                self.phase1_latency.record(self.now() - self.scout_started)
+                pmax = {}
+                # For every slot number add the proposal with
+                # the highest ballot number to proposals
+                for pv in msg.accepted:
+                    if pv.slot_number < self.watermark:
+                        continue
+                    if pv.slot_number not in pmax or \
+                          pmax[pv.slot_number] < pv.ballot_number:
+                        pmax[pv.slot_number] = pv.ballot_number
+                        self.proposals[pv.slot_number] = pv.command
+                        self.highest = max(self.highest, pv.slot_number)
+                # Run Phase 2 for every proposal (from the beginning)
+                for sn in self.proposals:
+                    self.startPhase2(sn, self.proposals.get(sn))
+                self.active = True
+                if self.election == "stable":
+                    # Replicas send their proposals to the active leader only
+                    msg = HeartbeatMessage(self.id, self.ballot_number, True)
+                    for r in self.config.replicas:
+                        self.sendMessage(r, msg)
+                if self.lease > 0:
+                    # The acceptors promised the lease when they
+                    # received the p1a, after the scout was started.
+                    self.lease_expiry = self.scout_started + self.lease * (1 - LEASEDRIFT)
+                    if not self.lease_timer:
+                        self.renewLease()
+        elif isinstance(msg, P2bMessage):
+            if msg.compacted:
+                self.phase2.pop(msg.slot_number, None)
+                self.proposals.pop(msg.slot_number, None)
+                return
+            entry = self.phase2.get(msg.slot_number)
+            if entry is not None and entry[0] == msg.ballot_number:
+                ballot_number, command, waitfor, started, sent = entry
+                if self.thrifty and msg.src in waitfor:
+                    measure(self.latency, msg.src, self.now() - sent)
+                waitfor.discard(msg.src)
+                if self.quorum.phase2(waitfor):
+                    del self.phase2[msg.slot_number]
+                    self.phase2_latency.record(self.now() - started)
+                    for r in self.config.replicas:
+                        self.sendMessage(r, DecisionMessage(self.id, msg.slot_number, command))
+            elif msg.ballot_number > self.ballot_number:
+                self.preempted(msg.ballot_number)
+        elif isinstance(msg, PreemptedMessage):
+            if msg.src == self.scout:
+                self.scout = None
+                if msg.ballot_number <= self.ballot_number and not self.scout_timer and \
+                      self.election == "backoff":
+                    # The scout was turned down without a higher ballot, by
+                    # an acceptor that holds a lease of another leader.
+                    self.setTimer(self.timeout, TimerMessage(self.id, "scout"))
+                    self.scout_timer = True
+            self.preempted(msg.ballot_number)
+        elif isinstance(msg, ExecutedMessage):
+            self.executed[msg.src] = max(msg.slot_number, self.executed.get(msg.src, 1))
+            self.compact()
+        elif isinstance(msg, TimerMessage):
+            if msg.tag == "lease":
+                self.lease_timer = False
+                if self.active:
+                    self.renewLease()
+            elif msg.tag == "heartbeat":
+                self.tick()
+            elif msg.tag == "thrifty":
+                self.thrifty_timer = False
+                self.fallback()
             else:
-                print("Leader: unknown msg type")
-            sleep(self.timeout)
+                self.scout_timer = False
+                if not self.active:
+                    self.startScout()
+        elif isinstance(msg, LeaseAckMessage):
+            if msg.ballot_number == self.ballot_number and msg.time == self.lease_sent:
+                self.lease_acks.add(msg.src)
+                if self.quorum.phase2(set(self.config.acceptors) - self.lease_acks):
+                    self.lease_expiry = max(self.lease_expiry,
+                                            self.lease_sent + self.lease * (1 - LEASEDRIFT))
+        elif isinstance(msg, ReadIndexMessage):
+            slot_number = None
+            if self.active and self.now() < self.lease_expiry:
+                slot_number = self.highest
+            self.sendMessage(msg.src, ReadIndexReplyMessage(self.id, msg.read_id, slot_number))
+        elif isinstance(msg, HeartbeatMessage):
+            self.heard[msg.src] = self.now()
+            if msg.src in self.suspected:
+                self.suspected.discard(msg.src)
+                self.suspect = self.suspect * TIMEOUTMULTIPLY
+                self.calm_since = self.now()
+                print(self.name, "Suspicion timeout increased: ", self.suspect)
+            if msg.active:
+                self.leading = msg.src
+            elif self.leading == msg.src:
+                self.leading = None
+        else:
+            print("Leader: unknown msg type")
+
+    def startPhase2(self, slot_number, command):
+        """
+        Run phase 2 for a command in a slot with the current ballot
+        number, either in a Commander process or in the phase2 table.
+        """
+        if self.commanders:
+            Commander(self.env, self.env.childId(self.id), self.id,
+                      self.ranked(), self.config.replicas,
+                      self.ballot_number, slot_number, command,
+                      self.latency if self.thrifty else None, self.quorum)
+            return
+        now = self.now()
+        self.phase2[slot_number] = (self.ballot_number, command, set(self.config.acceptors),
+                                    now, now)
+        msg = P2aMessage(self.id, self.ballot_number, slot_number, command)
+        if not self.thrifty:
+            for a in self.config.acceptors:
+                self.sendMessage(a, msg)
+            return
+        for a in self.quorum.preferred2(self.ranked()):
+            self.sendMessage(a, msg)
+        if not self.thrifty_timer:
+            self.setTimer(THRIFTYTIMEOUT, TimerMessage(self.id, "thrifty"))
+            self.thrifty_timer = True
+
+    def ranked(self):
+        """ Return the acceptors, ordered by smoothed latency if the leader is thrifty. """
+        if not self.thrifty:
+            return self.config.acceptors
+        return rank(self.config.acceptors, self.latency)
+
+    def fallback(self):
+        """
+        Send the p2a messages that have waited THRIFTYTIMEOUT seconds
+        to every acceptor that has not answered them, and add the wait
+        to the latency of the preferred acceptors among those, so that
+        an acceptor that has stopped answering sinks in the ranking.
+        Check again after THRIFTYTIMEOUT
+        seconds while phase 2 is running for any slot.
+        """
+        now = self.now()
+        preferred = set(self.quorum.preferred2(self.ranked()))
+        for slot_number, entry in list(self.phase2.items()):
+            ballot_number, command, waitfor, started, sent = entry
+            if now - sent < THRIFTYTIMEOUT:
+                continue
+            penalize(self.latency, waitfor & preferred, now - sent)
+            msg = P2aMessage(self.id, ballot_number, slot_number, command)
+            for a in waitfor:
+                self.sendMessage(a, msg)
+            self.phase2[slot_number] = (ballot_number, command, waitfor, started, now)
+        if self.phase2:
+            self.setTimer(THRIFTYTIMEOUT, TimerMessage(self.id, "thrifty"))
+            self.thrifty_timer = True
+
+    def preempted(self, ballot_number):
+        """
+        Some acceptor has adopted ballot_number. If it is higher than
+        the ballot number of the leader, the leader becomes passive,
+        drops its pending phase 2 entries and, after waiting timeout
+        seconds, spawns a scout for a higher ballot number. With stable
+        election it waits for its next heartbeat to decide whether to
+        run phase 1 again instead.
+        """
+        if self.election == "stable":
+            if ballot_number > self.ballot_number:
+                self.active = False
+                self.lease_expiry = 0
+                self.phase2 = {}
+                self.ballot_number = intern_ballot(ballot_number.round+1, self.id)
+                self.leading = ballot_number.leader_id
+            return
+        # The leader is competing with another leader
+        if ballot_number.leader_id > self.id:
+            # Increase timeout because the other leader has priority
+            self.timeout = self.timeout * TIMEOUTMULTIPLY
+            print(self.name, "Timeout increased: ", self.timeout)
+        if ballot_number > self.ballot_number:
+            self.active = False
+            self.lease_expiry = 0
+            self.phase2 = {}
+            self.ballot_number = intern_ballot(ballot_number.round+1, self.id)
+            if not self.scout_timer:
+                self.setTimer(self.timeout, TimerMessage(self.id, "scout"))
+                self.scout_timer = True
+
+    def tick(self):
+        """
+        Send a heartbeat to the other leaders, suspect those not heard
+        from for suspect seconds, and run phase 1 if this leader
+        should lead. Do so again after heartbeat seconds.
+        """
+        now = self.now()
+        if self.suspect > self.min_suspect and now - self.calm_since > self.suspect:
+            self.suspect = max(self.min_suspect, self.suspect - TIMEOUTSUBTRACT)
+            self.calm_since = now
+            print(self.name, "Suspicion timeout decreased: ", self.suspect)
+        msg = HeartbeatMessage(self.id, self.ballot_number, self.active)
+        for l in self.config.leaders:
+            if l == self.id:
+                continue
+            self.sendMessage(l, msg)
+            if now - self.heard.setdefault(l, now) > self.suspect and l not in self.suspected:
+                self.suspected.add(l)
+                print(self.name, "suspects", self.env.name(l))
+        self.elect()
+        self.setTimer(self.heartbeat, TimerMessage(self.id, "heartbeat"))
+
+    def elect(self):
+        """
+        Run phase 1 if no trusted leader is active and this leader is
+        the trusted leader with the lowest id, unless it is active or
+        its scout has been waiting for less than suspect seconds.
+        """
+        if self.active:
+            return
+        if self.scout is not None and self.now() - self.scout_started < self.suspect:
+            return
+        if self.leading not in (None, self.id) and self.leading not in self.suspected:
+            return
+        # The configuration may still be filling in while leaders start
+        if min([self.id] + [l for l in self.config.leaders if l not in self.suspected]) == self.id:
+            self.startScout()
+
+    def startScout(self):
+        """ Run phase 1 for the current ballot number. """
+        self.scout = self.env.childId(self.id)
+        self.scout_started = self.now()
+        Scout(self.env, self.scout, self.id,
+              self.ranked(), self.ballot_number, self.watermark,
+              self.latency if self.thrifty else None, self.quorum)
+
+    def renewLease(self):
+        """
+        Ask the acceptors to renew the lease of the current ballot
+        number, and do so again after a third of the lease.
+        """
+        self.lease_sent = self.now()
+        self.lease_acks = set()
+        msg = LeaseMessage(self.id, self.ballot_number, self.lease_sent)
+        for a in self.config.acceptors:
+            self.sendMessage(a, msg)
+        self.setTimer(self.lease / 3, TimerMessage(self.id, "lease"))
+        self.lease_timer = True
+
+    def compact(self):
+        """
+        Advance the watermark to the lowest slot not yet executed by
+        every replica, drop the proposals below it and send it to all
+        acceptors.
+        """
+        watermark = min(self.executed.get(r, 1) for r in self.config.replicas)
+        if watermark <= self.watermark:
+            return
+        for s in range(self.watermark, watermark):
+            self.proposals.pop(s, None)
+        self.watermark = watermark
+        for a in self.config.acceptors:
+            self.sendMessage(a, CompactMessage(self.id, watermark))
+
+if __name__ == '__main__':
+    from launcher import start_node
+    start_node(lambda env, pid: Leader(env, pid, env.config,
+                                       commanders=env.phase2 == "commander",
+                                       lease=env.lease, election=env.election,
+                                       heartbeat=env.heartbeat, suspect=env.suspect,
+                                       thrifty=env.thrifty, quorum=env.quorum))
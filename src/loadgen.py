@@ -0,0 +1,187 @@
+import bisect
+import random
+from process import Process
+from message import RequestMessage, ResponseMessage, TimerMessage
+from utils import Command
+
+MODES = ["closed", "fixed", "poisson"]
+WORKLOADS = ["plain", "kv"]
+DISTRIBUTIONS = ["uniform", "zipf"]
+
+class Workload:
+    """
+    Generates the operation of every request. The plain workload
+    produces the strings "operation <client>.<n>" of the original
+    clients. The kv workload produces gets and puts of
+    statemachine.KVStore: a fraction reads of the requests are gets,
+    keys are drawn from keys keys with a uniform or zipf distribution
+    (with exponent skew), and every put carries payload bytes. gets
+    counts the gets generated so far.
+    """
+    def __init__(self, workload="plain", keys=1000, distribution="uniform",
+                 skew=0.99, payload=16, reads=0.0, seed=1):
+        if workload not in WORKLOADS:
+            raise ValueError("Unknown workload '%s', expected one of: %s" %
+                             (workload, ", ".join(WORKLOADS)))
+        if distribution not in DISTRIBUTIONS:
+            raise ValueError("Unknown key distribution '%s', expected one of: %s" %
+                             (distribution, ", ".join(DISTRIBUTIONS)))
+        self.workload = workload
+        self.keys = ["key %d" % k for k in range(keys)]
+        self.reads = reads
+        self.value = b"x" * payload
+        self.rng = random.Random(seed)
+        self.gets = 0
+        self.cdf = None
+        if distribution == "zipf":
+            self.cdf = []
+            total = 0.0
+            for k in range(keys):
+                total += 1.0 / (k + 1) ** skew
+                self.cdf.append(total)
+
+    def key(self):
+        if self.cdf is None:
+            return self.keys[self.rng.randrange(len(self.keys))]
+        k = bisect.bisect_left(self.cdf, self.rng.random() * self.cdf[-1])
+        return self.keys[min(k, len(self.keys) - 1)]
+
+    def op(self, client, n):
+        """ Return the operation of the n-th request of client. """
+        if self.workload == "plain":
+            return "operation %d.%d" % (client, n)
+        if self.rng.random() < self.reads:
+            self.gets += 1
+            return ("get", self.key())
+        return ("put", self.key(), self.value)
+
+class LoadGenerator(Process):
+    """
+    Drives all the clients of a run from a single process, so that
+    thousands of requests per second come from one thread or one
+    coroutine. Every request is sent to all replicas, and all carry
+    the id of the load generator as client, with request identifiers
+    that are unique across the clients of the generator.
+
+    - closed: each of clients clients keeps outstanding requests in
+      flight, and sends the next as soon as one is answered.
+    - fixed / poisson: requests are sent at rate requests per second
+      in total, with fixed or exponentially distributed gaps,
+      whatever the responses. On every timer the generator sends
+      the requests that are due, so it keeps up with the rate even
+      when timers fire late.
+
+    Send times are taken from the monotonic clock of the runtime. In
+    the open-loop modes the latency of a request is measured from the
+    time it was due, not from when it was sent, so that a generator
+    falling behind does not hide queueing. Requests not answered
+    within retry seconds are sent again. The time every request was
+    answered is kept in completions. Once all requests are answered
+    the latencies are written to lat_client_N, one file per client,
+    and done is set. Clients are numbered from first, so that the
+    generators of several nodes (see launcher.py) write to different
+    files and generate different operations.
+    """
+    def __init__(self, env, id, replicas, requests, clients=1, mode="closed",
+                 outstanding=1, rate=1000.0, workload=None, retry=5.0, seed=1, first=0):
+        Process.__init__(self, env, id)
+        if mode not in MODES:
+            raise ValueError("Unknown mode '%s', expected one of: %s" % (mode, ", ".join(MODES)))
+        self.replicas = replicas
+        self.requests = requests
+        self.clients = clients
+        self.first = first
+        self.mode = mode
+        self.outstanding = outstanding
+        self.rate = float(rate)
+        self.workload = workload or Workload()
+        self.retry = retry
+        self.rng = random.Random(seed)
+        self.req_id = 0
+        self.counts = [0] * clients
+        self.sent = {}
+        self.latencies = [[] for c in range(clients)]
+        self.answered = 0
+        self.completions = []
+        self.next_due = None
+        self.started = self.finished = None
+        self.done = False
+        env.metrics.gauge("paxos_inflight_requests", lambda: len(self.sent),
+            "Requests sent but not yet answered.", role=self.role, process=self.name)
+        self.env.addProc(self)
+
+    def onStart(self):
+        self.started = self.now()
+        if self.mode == "closed":
+            for i in range(min(self.clients * self.outstanding, self.requests)):
+                self.sendRequest(i % self.clients, self.now())
+        else:
+            self.next_due = self.started
+            self.sendDue()
+        self.setTimer(self.retry, TimerMessage(self.id, "retry"))
+
+    def handle(self, msg):
+        """
+        - Response: The first response to an outstanding request
+        completes it. In closed-loop mode, its client sends the next
+        request.
+
+        - Timer: Send the requests that are due, or resend the requests
+        that have waited retry seconds.
+        """
+        if isinstance(msg, ResponseMessage):
+            entry = self.sent.pop(msg.command.req_id, None)
+            if entry is None:
+                return
+            client, due, cmd = entry
+            now = self.now()
+            self.latencies[client].append((cmd.op, now - due))
+            self.completions.append(now)
+            self.answered += 1
+            if self.mode == "closed" and self.req_id < self.requests:
+                self.sendRequest(client, now)
+            if self.answered == self.requests:
+                self.finished = now
+                self.write_latencies()
+                self.done = True
+                self.stop()
+        elif isinstance(msg, TimerMessage):
+            if msg.tag == "send":
+                self.sendDue()
+            elif msg.tag == "retry":
+                now = self.now()
+                for client, due, cmd in list(self.sent.values()):
+                    if now - due > self.retry:
+                        self.resend(cmd)
+                self.setTimer(self.retry, TimerMessage(self.id, "retry"))
+
+    def sendDue(self):
+        """ Send every open-loop request that is due, and set a timer for the next one. """
+        now = self.now()
+        while self.req_id < self.requests and self.next_due <= now:
+            self.sendRequest(self.req_id % self.clients, self.next_due)
+            if self.mode == "poisson":
+                self.next_due += self.rng.expovariate(self.rate)
+            else:
+                self.next_due += 1.0 / self.rate
+        if self.req_id < self.requests:
+            self.setTimer(self.next_due - now, TimerMessage(self.id, "send"))
+
+    def sendRequest(self, client, due):
+        self.req_id += 1
+        self.counts[client] += 1
+        cmd = Command(self.id, self.req_id, self.workload.op(self.first + client, self.counts[client]))
+        self.sent[self.req_id] = (client, due, cmd)
+        self.resend(cmd)
+
+    def resend(self, cmd):
+        msg = RequestMessage(self.id, cmd, str(self.wallclock()))
+        for r in self.replicas:
+            self.sendMessage(r, msg)
+
+    def write_latencies(self):
+        for client, latencies in enumerate(self.latencies):
+            with open("lat_client_%d" % (self.first + client), "a") as f:
+                f.write("mode:%s|requests:%d\n" % (self.mode, len(latencies)))
+                for op, latency in latencies:
+                    f.write(str(op) + ": " + str(latency) + "\n")
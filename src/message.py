@@ -5,28 +5,38 @@
 class Message:
     """
     Base class for all messages used in Paxos.
-    Every message has a source.
+    Every message has a source, the process id of its sender.
+    Messages declare their fields in __slots__, so that they are
+    allocated without a per-instance __dict__.
     """
+    __slots__ = ("src",)
+
     def __init__(self, src):
         self.src = src
 
     def __str__(self):
-        return str(self.__dict__)
+        return str({f: getattr(self, f) for cls in reversed(type(self).__mro__)
+                                        for f in getattr(cls, "__slots__", ())})
 
 class P1aMessage(Message):
     """
     Sent by Scouts to Acceptors in Phase 1 of Paxos.
-    Carries a ballot number.
+    Carries a ballot number and the watermark of the leader.
     """
-    def __init__(self, src, ballot_number):
+    __slots__ = ("ballot_number", "watermark")
+
+    def __init__(self, src, ballot_number, watermark):
         Message.__init__(self, src)
         self.ballot_number = ballot_number
+        self.watermark = watermark
 
 class P1bMessage(Message):
     """
     Sent by Acceptors to Scouts in Phase 1 of Paxos.
     Carries a ballot number and the set of accepted pvalues.
     """
+    __slots__ = ("ballot_number", "accepted")
+
     def __init__(self, src, ballot_number, accepted):
         Message.__init__(self, src)
         self.ballot_number = ballot_number
@@ -37,6 +47,8 @@ class P2aMessage(Message):
     Sent by Commanders to Acceptors in Phase 2 of Paxos.
     Carries a ballot number, a slot number and a command.
     """
+    __slots__ = ("ballot_number", "slot_number", "command")
+
     def __init__(self, src, ballot_number, slot_number, command):
         Message.__init__(self, src)
         self.ballot_number = ballot_number
@@ -46,18 +58,25 @@ class P2aMessage(Message):
 class P2bMessage(Message):
     """
     Sent by Acceptors to Commanders in Phase 2 of Paxos.
-    Carries a ballot number and a slot number.
+    Carries a ballot number and a slot number, and whether the slot
+    is below the watermark of the acceptor, so that the acceptor
+    refused the p2a and the reply must not count as an accept.
     """
-    def __init__(self, src, ballot_number, slot_number):
+    __slots__ = ("ballot_number", "slot_number", "compacted")
+
+    def __init__(self, src, ballot_number, slot_number, compacted=False):
         Message.__init__(self, src)
         self.ballot_number = ballot_number
         self.slot_number = slot_number
+        self.compacted = compacted
 
 class PreemptedMessage(Message):
     """
     Sent by Scouts or Commanders to Leaders.
     Carries a ballot number.
     """
+    __slots__ = ("ballot_number",)
+
     def __init__(self, src, ballot_number):
         Message.__init__(self, src)
         self.ballot_number = ballot_number
@@ -67,6 +86,8 @@ class AdoptedMessage(Message):
     Sent by Scouts to Leaders.
     Carries a ballot number and the set of accepted pvalues.
     """
+    __slots__ = ("ballot_number", "accepted")
+
     def __init__(self, src, ballot_number, accepted):
         Message.__init__(self, src)
         self.ballot_number = ballot_number
@@ -77,6 +98,8 @@ class DecisionMessage(Message):
     Sent by Commanders to Replicas.
     Carries a slot number and a command.
     """
+    __slots__ = ("slot_number", "command")
+
     def __init__(self, src, slot_number, command):
         Message.__init__(self, src)
         self.slot_number = slot_number
@@ -87,6 +110,8 @@ class RequestMessage(Message):
     Sent by Clients to Replicas.
     Carries a command.
     """
+    __slots__ = ("command", "time")
+
     def __init__(self, src, command, time):
         Message.__init__(self, src)
         self.command = command
@@ -97,6 +122,8 @@ class ProposeMessage(Message):
     Sent by Replicas to Leaders.
     Carries a slot number and a command.
     """
+    __slots__ = ("slot_number", "command")
+
     def __init__(self, src, slot_number, command):
         Message.__init__(self, src)
         self.slot_number = slot_number
@@ -107,6 +134,180 @@ class DoneMessage(Message):
     Sent by Clients to Replicas.
     Carries a done command.
     """
+    __slots__ = ("command",)
+
     def __init__(self, src, command):
         Message.__init__(self, src)
         self.command = command
+
+class ExecutedMessage(Message):
+    """
+    Sent by Replicas to Leaders.
+    Carries the first slot number the replica has not yet executed.
+    """
+    __slots__ = ("slot_number",)
+
+    def __init__(self, src, slot_number):
+        Message.__init__(self, src)
+        self.slot_number = slot_number
+
+class CompactMessage(Message):
+    """
+    Sent by Leaders to Acceptors.
+    Carries a watermark below which every slot has been executed by
+    all replicas.
+    """
+    __slots__ = ("watermark",)
+
+    def __init__(self, src, watermark):
+        Message.__init__(self, src)
+        self.watermark = watermark
+
+class TimerMessage(Message):
+    """
+    Sent by a process to itself when a timer set with setTimer expires.
+    Carries a tag naming the timer.
+    """
+    __slots__ = ("tag",)
+
+    def __init__(self, src, tag):
+        Message.__init__(self, src)
+        self.tag = tag
+
+class ResponseMessage(Message):
+    """
+    Sent by Replicas to Clients.
+    Carries a performed command and its result.
+    """
+    __slots__ = ("command", "result")
+
+    def __init__(self, src, command, result):
+        Message.__init__(self, src)
+        self.command = command
+        self.result = result
+
+class StateRequestMessage(Message):
+    """
+    Sent by a lagging Replica to another Replica.
+    Carries the first slot number the replica has not yet executed.
+    """
+    __slots__ = ("slot_number",)
+
+    def __init__(self, src, slot_number):
+        Message.__init__(self, src)
+        self.slot_number = slot_number
+
+class StateMessage(Message):
+    """
+    Sent by Replicas in reply to a state request.
+    Carries a snapshot of replica state, or None if the requesting
+    replica is not behind the latest snapshot, and a map of slot
+    numbers to the decisions that follow it.
+    """
+    __slots__ = ("snapshot", "decisions")
+
+    def __init__(self, src, snapshot, decisions):
+        Message.__init__(self, src)
+        self.snapshot = snapshot
+        self.decisions = decisions
+
+class LeaseMessage(Message):
+    """
+    Sent by Leaders to Acceptors to renew the lease of their ballot.
+    Carries a ballot number and the time the leader sent it, in the
+    leader's clock.
+    """
+    __slots__ = ("ballot_number", "time")
+
+    def __init__(self, src, ballot_number, time):
+        Message.__init__(self, src)
+        self.ballot_number = ballot_number
+        self.time = time
+
+class LeaseAckMessage(Message):
+    """
+    Sent by Acceptors to Leaders in reply to a lease message.
+    Carries the renewed ballot number and the time of the lease message.
+    """
+    __slots__ = ("ballot_number", "time")
+
+    def __init__(self, src, ballot_number, time):
+        Message.__init__(self, src)
+        self.ballot_number = ballot_number
+        self.time = time
+
+class ReadIndexMessage(Message):
+    """
+    Sent by Replicas to Leaders to serve reads outside the log.
+    Carries a replica-local request identifier.
+    """
+    __slots__ = ("read_id",)
+
+    def __init__(self, src, read_id):
+        Message.__init__(self, src)
+        self.read_id = read_id
+
+class ReadIndexReplyMessage(Message):
+    """
+    Sent by Leaders to Replicas in reply to a read index message.
+    Carries the request identifier and the highest slot number the
+    leader has a proposal for, or None if the leader holds no lease.
+    """
+    __slots__ = ("read_id", "slot_number")
+
+    def __init__(self, src, read_id, slot_number):
+        Message.__init__(self, src)
+        self.read_id = read_id
+        self.slot_number = slot_number
+
+class CheckpointMessage(Message):
+    """
+    Sent by Replicas to the consensus checker every CHECKPOINTINTERVAL
+    slots. Carries the slot number and the digest of the hash chain
+    over every command the replica has performed up to that slot.
+    """
+    __slots__ = ("slot_number", "digest")
+
+    def __init__(self, src, slot_number, digest):
+        Message.__init__(self, src)
+        self.slot_number = slot_number
+        self.digest = digest
+
+class DigestRequestMessage(Message):
+    """
+    Sent by the consensus checker to Replicas whose checkpoints
+    disagree. Asks for the digests of count slots from slot_number.
+    """
+    __slots__ = ("slot_number", "count")
+
+    def __init__(self, src, slot_number, count):
+        Message.__init__(self, src)
+        self.slot_number = slot_number
+        self.count = count
+
+class DigestsMessage(Message):
+    """
+    Sent by Replicas in reply to a digest request. Carries the first
+    slot number and the digest of every slot asked for, or None if
+    the replica no longer keeps them.
+    """
+    __slots__ = ("slot_number", "digests")
+
+    def __init__(self, src, slot_number, digests):
+        Message.__init__(self, src)
+        self.slot_number = slot_number
+        self.digests = digests
+
+class HeartbeatMessage(Message):
+    """
+    Sent by Leaders to the other leaders every heartbeat interval, so
+    that they can tell which leaders are alive, and to the replicas
+    when a leader becomes active. Carries the ballot number of the
+    leader and whether it is active.
+    """
+    __slots__ = ("ballot_number", "active")
+
+    def __init__(self, src, ballot_number, active):
+        Message.__init__(self, src)
+        self.ballot_number = ballot_number
+        self.active = active
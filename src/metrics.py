@@ -0,0 +1,230 @@
+import json
+import os
+import threading
+import time
+
+FORMATS = ["json", "prometheus"]
+QUANTILES = [0.5, 0.9, 0.99, 0.999]
+
+class Counter:
+    """
+    A value that only goes up. Counters are updated without a lock:
+    every counter is owned by one role, and an increment under the
+    GIL is lost only if two threads of that role race on it.
+    """
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def export(self):
+        return self.value
+
+class Gauge:
+    """ A value read from fn when a snapshot is taken. """
+    kind = "gauge"
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def export(self):
+        return self.fn()
+
+class Histogram:
+    """
+    A histogram of durations with HDR-style buckets. Durations are
+    recorded as integer multiples of unit seconds. Values below
+    2**(SUBBITS+1) units get a bucket each. Above that, every power of
+    two is split into 2**SUBBITS buckets, so that any recorded value
+    is known to within 1/2**SUBBITS of itself, whatever its
+    magnitude. Recording is an integer division, a bit_length() and a
+    dict update.
+    """
+    kind = "histogram"
+    SUBBITS = 7
+    SUB = 1 << SUBBITS
+
+    def __init__(self, unit=1e-6):
+        self.unit = unit
+        self.counts = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        v = int(seconds / self.unit)
+        if v < 2 * self.SUB:
+            i = v if v > 0 else 0
+        else:
+            shift = v.bit_length() - self.SUBBITS - 1
+            i = (shift + 1) * self.SUB + (v >> shift) - self.SUB
+        self.counts[i] = self.counts.get(i, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def bounds(self, i):
+        """ Return the lowest and highest value in seconds of bucket i. """
+        if i < 2 * self.SUB:
+            return i * self.unit, (i + 1) * self.unit
+        shift = i // self.SUB - 1
+        mantissa = i % self.SUB + self.SUB
+        return (mantissa << shift) * self.unit, ((mantissa + 1) << shift) * self.unit
+
+    def quantiles(self, qs=QUANTILES):
+        """
+        Return the value in seconds at every quantile in qs, taken at
+        the middle of its bucket.
+        """
+        counts = sorted(dict(self.counts).items())
+        total = sum(c for i, c in counts)
+        result = []
+        for q in qs:
+            if total == 0:
+                result.append(0.0)
+                continue
+            rank = q * total
+            seen = 0
+            for i, c in counts:
+                seen += c
+                if seen >= rank:
+                    low, high = self.bounds(i)
+                    result.append(min((low + high) / 2, self.max))
+                    break
+        return result
+
+    def export(self):
+        return {"count": self.count, "sum": self.sum, "max": self.max,
+                "quantiles": dict(zip(map(str, QUANTILES), self.quantiles())),
+                "buckets": {"%g" % self.bounds(i)[1]: c for i, c in sorted(dict(self.counts).items())}}
+
+class Registry:
+    """
+    The metrics of all processes of an environment. A metric is
+    identified by its name and labels, and is created on first use
+    by counter(), histogram() or gauge(), which return the same
+    object for the same name and labels. Roles look up their metrics
+    once and keep them, so that the hot path only updates a field.
+
+    snapshot() returns every metric as a JSON-compatible dict, and
+    prometheus() in the Prometheus text exposition format, with
+    histograms exported as summaries.
+    """
+    def __init__(self):
+        self.metrics = {}
+        self.help = {}
+        self.tables = {}
+        self.lock = threading.Lock()
+
+    def get(self, cls, name, help, labels, *args):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self.lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = cls(*args)
+                    self.help.setdefault(name, (cls.kind, help))
+        return metric
+
+    def counter(self, name, help="", **labels):
+        return self.get(Counter, name, help, labels)
+
+    def histogram(self, name, help="", **labels):
+        return self.get(Histogram, name, help, labels)
+
+    def gauge(self, name, fn, help="", **labels):
+        """
+        Register fn as the gauge name with labels. A later gauge with
+        the same name and labels replaces it.
+        """
+        with self.lock:
+            self.metrics[(name, tuple(sorted(labels.items())))] = Gauge(fn)
+            self.help.setdefault(name, (Gauge.kind, help))
+
+    def messages(self, direction, role):
+        """
+        Return the table of message counters of role for direction,
+        "received" or "sent", shared by all processes of the role. It
+        maps message classes to counters and is filled by
+        messageCounter().
+        """
+        return self.tables.setdefault((direction, role), {})
+
+    def messageCounter(self, direction, role, cls):
+        counter = self.counter("paxos_messages_%s_total" % direction,
+                               "Messages %s, by role and message type." % direction,
+                               role=role, type=cls.__name__)
+        self.messages(direction, role)[cls] = counter
+        return counter
+
+    def items(self):
+        with self.lock:
+            return sorted(self.metrics.items(), key=lambda kv: kv[0])
+
+    def snapshot(self):
+        metrics = []
+        for (name, labels), metric in self.items():
+            metrics.append({"name": name, "type": metric.kind, "labels": dict(labels),
+                            "value": metric.export()})
+        return {"time": time.time(), "metrics": metrics}
+
+    def prometheus(self):
+        lines = []
+        last = None
+        for (name, labels), metric in self.items():
+            if name != last:
+                kind, help = self.help[name]
+                if help:
+                    lines.append("# HELP %s %s" % (name, help))
+                lines.append("# TYPE %s %s" % (name, "summary" if kind == "histogram" else kind))
+                last = name
+            if metric.kind == "histogram":
+                for q, v in zip(QUANTILES, metric.quantiles()):
+                    lines.append("%s%s %r" % (name, format_labels(labels + (("quantile", str(q)),)), v))
+                lines.append("%s_sum%s %r" % (name, format_labels(labels), metric.sum))
+                lines.append("%s_count%s %d" % (name, format_labels(labels), metric.count))
+            else:
+                lines.append("%s%s %r" % (name, format_labels(labels), metric.export()))
+        return "\n".join(lines) + "\n"
+
+    def write(self, path, format="json"):
+        """ Write a snapshot to path, replacing it atomically. """
+        if format not in FORMATS:
+            raise ValueError("Unknown metrics format '%s', expected one of: %s" %
+                             (format, ", ".join(FORMATS)))
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            if format == "json":
+                json.dump(self.snapshot(), f)
+            else:
+                f.write(self.prometheus())
+        os.replace(tmp, path)
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\").replace('"', '\\"'))
+                          for k, v in labels) + "}"
+
+class Exporter(threading.Thread):
+    """ Writes a snapshot of registry to path every interval seconds, and once more on stop(). """
+    def __init__(self, registry, path, interval=1.0, format="json"):
+        super(Exporter, self).__init__(daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.format = format
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.registry.write(self.path, self.format)
+
+    def stop(self):
+        self.stopped.set()
+        self.registry.write(self.path, self.format)
@@ -1,24 +1,15 @@
 #!/usr/bin/env python3
-from cProfile import label
 import numpy as np
 import matplotlib.pyplot as plt
 import sys
+from analyze import load_all, run_latencies
 plt.rcParams['axes.linewidth'] = 0.1
 
-def parse_data(n, increment, start):
-    """ Parse data stored in n replica files """
+def parse_data(results, increment, start):
+    """ Latencies of every run in the results directory, keyed by start plus increment per run """
     data = {}
-    for i in range(0, int(n)):
-        entry = start - increment
-        with open("thr_replica_"+str(i), mode='r') as f:
-            for line in f:
-                if line.startswith('clients'):
-                    entry += increment
-                    if entry not in data.keys():
-                        data[entry] = []
-                else:
-                    value = line.rstrip('\n').split(': ')[1]
-                    data[entry].append(float(value))
+    for run, latency in run_latencies(load_all(results)):
+        data[start + run["run"] * increment] = latency
     return data
 
 
@@ -40,32 +31,32 @@ def create_plot(labels, avgs, stds, title, xlabel):
 
 def main():
     try:
-        n = sys.argv[1]
+        results = sys.argv[1]
     except:
-        print("Please specify number of replicas. Example: Python3 plot_throughput.py NREPLICAS TITLE XLABEL START INCREMENT")
+        print("Please specify the results directory. Example: Python3 plot_data.py RESULTS TITLE XLABEL START INCREMENT")
         exit(0)
     try:
         title = sys.argv[2]
     except:
-        print("Please specify plot title. Example: Python3 plot_throughput.py NREPLICAS TITLE XLABEL START INCREMENT")
+        print("Please specify plot title. Example: Python3 plot_data.py RESULTS TITLE XLABEL START INCREMENT")
         exit(0)
     try:
         xlabel = sys.argv[3]
     except:
-        print("please specify plot xlabel. Example: Python3 plot_throughput.py NREPLICAS TITLE XLABEL START INCREMENT")
+        print("please specify plot xlabel. Example: Python3 plot_data.py RESULTS TITLE XLABEL START INCREMENT")
         exit(0)
     try:
         start = int(sys.argv[4])
     except:
-        print("please specify initial value. Example: Python3 plot_throughput.py NREPLICAS TITLE XLABEL START INCREMENT")
+        print("please specify initial value. Example: Python3 plot_data.py RESULTS TITLE XLABEL START INCREMENT")
         exit(0)
     try:
         increment = int(sys.argv[5])
     except:
-        print("please specify increment. Example: Python3 plot_throughput.py NREPLICAS TITLE XLABEL START INCREMENT")
+        print("please specify increment. Example: Python3 plot_data.py RESULTS TITLE XLABEL START INCREMENT")
         exit(0)
 
-    data = parse_data(n, increment, start)
+    data = parse_data(results, increment, start)
     label = []
     avgs = []
     stds = []
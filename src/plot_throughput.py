@@ -1,24 +1,16 @@
 #!/usr/bin/env python3
 import numpy as np
 import matplotlib.pyplot as plt
-import csv
 import sys
-import random
+from analyze import load_all, run_latencies
 plt.rcParams['axes.linewidth'] = 0.1
 
-def parse_data(n):
-    """ Parse data stored in replica files """
+def parse_data(results):
+    """ Latencies of every run in the results directory, keyed by its number of clients """
     val_store = {}
-    for i in range(0, int(n)):
-        with open("thr_replica_"+str(i), mode='r') as f:
-            for line in f:
-                if line.startswith('clients'):
-                    clients = line.split('|')[0].split(':')[1]
-                    if i == 0:
-                        val_store[clients] = []
-                else:
-                    value = line.rstrip('\n').split(': ')[1]
-                    val_store[clients].append(float(value))
+    for run, latency in run_latencies(load_all(results)):
+        clients = str(run["clients"])
+        val_store[clients] = np.concatenate([val_store.get(clients, []), latency])
     return val_store
 
 
@@ -40,16 +32,16 @@ def create_plot(labels, avgs, stds, title):
 
 def main():
     try:
-        n = sys.argv[1]
+        results = sys.argv[1]
     except:
-        print("Please specify number of replicas. Example: Python3 plot_throughput.py NREPLICAS TITLE")
+        print("Please specify the results directory. Example: Python3 plot_throughput.py RESULTS TITLE")
         exit(0)
     try:
         title = sys.argv[2]
     except:
-        print("Please specify plot title. Example: Python3 plot_throughput.py NREPLICAS TITLE")
+        print("Please specify plot title. Example: Python3 plot_throughput.py RESULTS TITLE")
         exit(0)
-    data = parse_data(n)
+    data = parse_data(results)
 
     label = []
     avgs = []
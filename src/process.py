@@ -2,32 +2,120 @@
 #|                                             |
 #| From: https://github.com/denizalti/paxosmmc |
 #|_____________________________________________|
-import multiprocessing
+import queue
 from threading import Thread
+from utils import NODEMASK
 
 class Process(Thread):
     """
     A process is a thread with a queue of incoming messages, and an
-    "environment" that keeps track of all processes and queues.
+    "environment" that keeps track of all processes and queues. The
+    queue is created by the runtime of the environment.
+
+    Subclasses implement onStart() and handle(), which are driven
+    either by body() in the threaded runtime or by a coroutine in the
+    asyncio runtime. A process calls stop() to exit after the current
+    message. Delivering None wakes a process up without a message, so
+    that a process stopped from the outside can exit. onIdle() is
+    called whenever the inbox has been drained, before the process
+    blocks waiting for the next message, and onStop() once the process
+    has stopped.
+
+    A process is addressed by its integer id. Its name, used for
+    output only, is looked up once in the environment.
+
+    Every message a process handles or sends is counted in the
+    metrics registry of the environment, by role and message type.
+    Named processes also report the depth of their inbox.
     """
     def __init__(self, env, id):
-        super(Process, self).__init__()
-        self.inbox = multiprocessing.Manager().Queue()
+        super(Process, self).__init__(name=env.name(id))
+        self.inbox = env.runtime.inbox(env.transport)
         self.env = env
         self.id = id
+        self.stopped = False
+        self.role = type(self).__name__.lower()
+        self.msgs_received = env.metrics.messages("received", self.role)
+        self.msgs_sent = env.metrics.messages("sent", self.role)
+        if id <= NODEMASK:
+            env.metrics.gauge("paxos_queue_depth", self.queueDepth,
+                              "Messages waiting in the inbox.", role=self.role, process=self.name)
 
     def run(self):
         try:
             self.body()
-            self.env.removeProc(self.id)
+            self.env.removeProc(self.id, self)
         except EOFError:
             print("Exiting..")
 
+    def body(self):
+        self.onStart()
+        while not self.stopped:
+            try:
+                msg = self.inbox.get_nowait()
+            except queue.Empty:
+                self.onIdle()
+                msg = self.getNextMessage()
+            if msg is None:
+                continue
+            self.dispatch(msg)
+        self.onStop()
+
+    def onStart(self):
+        """ Called once before the first message is handled. """
+        pass
+
+    def handle(self, msg):
+        """ Called for every message received. """
+        raise NotImplementedError
+
+    def dispatch(self, msg):
+        """ Count msg and handle it. """
+        counter = self.msgs_received.get(msg.__class__)
+        if counter is None:
+            counter = self.env.metrics.messageCounter("received", self.role, msg.__class__)
+        counter.value += 1
+        self.handle(msg)
+
+    def onIdle(self):
+        """ Called when there are no more messages waiting in the inbox. """
+        pass
+
+    def onStop(self):
+        """ Called once after the last message has been handled. """
+        pass
+
+    def stop(self):
+        self.stopped = True
+
+    def now(self):
+        """ Current time in seconds according to the runtime. """
+        return self.env.runtime.now()
+
+    def wallclock(self):
+        """
+        Wall clock time in seconds according to the runtime, for
+        timestamps shared between processes.
+        """
+        return self.env.runtime.wallclock()
+
+    def setTimer(self, delay, msg):
+        """ Deliver msg to this process after delay seconds. """
+        self.env.runtime.setTimer(delay, self, msg)
+
     def getNextMessage(self):
         return self.inbox.get()
 
     def sendMessage(self, dst, msg):
+        counter = self.msgs_sent.get(msg.__class__)
+        if counter is None:
+            counter = self.env.metrics.messageCounter("sent", self.role, msg.__class__)
+        counter.value += 1
         self.env.sendMessage(dst, msg)
 
+    def queueDepth(self):
+        qsize = getattr(self.inbox, "qsize", None)
+        return qsize() if qsize is not None else 0
+
     def deliver(self, msg):
         self.inbox.put(msg)
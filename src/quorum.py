@@ -0,0 +1,120 @@
+QUORUMS = ["majority", "flexible", "grid"]
+
+class Flexible:
+    """
+    Flexible Paxos quorums: any q1 acceptors form a phase 1 quorum and
+    any q2 acceptors a phase 2 quorum. Every phase 1 quorum must share
+    an acceptor with every phase 2 quorum, so that a new leader learns
+    of every value that may have been chosen, which holds if and only
+    if q1 + q2 exceeds the number of acceptors. Phase 2, run for every
+    decision, can then wait for fewer acceptors than phase 1, run only
+    when a leader takes over.
+
+    Quorums are tested on waitfor, the set of acceptors that have not
+    answered yet, as scouts, commanders and leaders keep it.
+    """
+    def __init__(self, acceptors, q1, q2):
+        n = len(acceptors)
+        if not (0 < q1 <= n and 0 < q2 <= n):
+            raise ValueError("Quorum sizes %d and %d must be between 1 and the %d acceptors"
+                             % (q1, q2, n))
+        if q1 + q2 <= n:
+            raise ValueError("Phase 1 quorums of %d and phase 2 quorums of %d acceptors"
+                             " need not intersect among %d acceptors" % (q1, q2, n))
+        self.acceptors = acceptors
+        self.q1 = q1
+        self.q2 = q2
+
+    def phase1(self, waitfor):
+        """ Return True if the acceptors not in waitfor form a phase 1 quorum. """
+        return len(self.acceptors) - len(waitfor) >= self.q1
+
+    def phase2(self, waitfor):
+        """ Return True if the acceptors not in waitfor form a phase 2 quorum. """
+        return len(self.acceptors) - len(waitfor) >= self.q2
+
+    def preferred1(self, ranked):
+        """
+        Return the phase 1 quorum that comes first in ranked, a list of
+        the acceptors ordered by preference.
+        """
+        return ranked[:self.q1]
+
+    def preferred2(self, ranked):
+        """
+        Return the phase 2 quorum that comes first in ranked, a list of
+        the acceptors ordered by preference.
+        """
+        return ranked[:self.q2]
+
+    def __str__(self):
+        return "flexible:%d,%d" % (self.q1, self.q2)
+
+class Majority(Flexible):
+    """
+    The quorums of the original protocol: any majority of the
+    acceptors, in both phases. Majorities always intersect, so unlike
+    other quorum systems a majority needs no check, and may be taken
+    of no acceptors, as the benchmarks that run a leader alone do.
+    """
+    def __init__(self, acceptors):
+        self.acceptors = acceptors
+        self.q1 = self.q2 = len(acceptors) // 2 + 1
+
+    def __str__(self):
+        return "majority"
+
+class Grid:
+    """
+    The acceptors, in order, fill a grid of the given number of rows.
+    A phase 2 quorum is a full row, and a phase 1 quorum holds one
+    acceptor of every row, so that every phase 1 quorum meets every
+    phase 2 quorum. With 9 acceptors in 3 rows, each decision waits
+    for 3 acceptors instead of 5.
+    """
+    def __init__(self, acceptors, rows):
+        if not 0 < rows <= len(acceptors):
+            raise ValueError("A grid of %d rows needs between 1 and %d rows"
+                             % (rows, len(acceptors)))
+        self.acceptors = acceptors
+        columns = -(-len(acceptors) // rows)
+        self.rows = [acceptors[i:i + columns] for i in range(0, len(acceptors), columns)]
+
+    def phase1(self, waitfor):
+        """ Return True if the acceptors not in waitfor form a phase 1 quorum. """
+        return all(any(a not in waitfor for a in row) for row in self.rows)
+
+    def phase2(self, waitfor):
+        """ Return True if the acceptors not in waitfor form a phase 2 quorum. """
+        return any(all(a not in waitfor for a in row) for row in self.rows)
+
+    def preferred1(self, ranked):
+        """ Return the first acceptor in ranked of every row. """
+        position = {a: i for i, a in enumerate(ranked)}
+        return [min(row, key=position.get) for row in self.rows]
+
+    def preferred2(self, ranked):
+        """ Return the row whose last acceptor in ranked comes first. """
+        position = {a: i for i, a in enumerate(ranked)}
+        return min(self.rows, key=lambda row: max(position[a] for a in row))
+
+    def __str__(self):
+        return "grid:%d" % len(self.rows)
+
+def make_quorum(spec, acceptors):
+    """
+    Return the quorum system described by spec over the list of
+    acceptors: "majority", "flexible:Q1,Q2" for phase 1 quorums of Q1
+    and phase 2 quorums of Q2 acceptors, or "grid:ROWS". Raise
+    ValueError if the quorums of the two phases need not intersect.
+    """
+    name, _, arg = spec.partition(":")
+    if name == "majority":
+        return Majority(acceptors)
+    if name == "flexible":
+        q1, _, q2 = arg.partition(",")
+        return Flexible(acceptors, int(q1), int(q2))
+    if name == "grid":
+        return Grid(acceptors, int(arg))
+    raise ValueError("Unknown quorum system '%s', expected one of: %s"
+                     % (spec, ", ".join(QUORUMS)))
@@ -3,26 +3,117 @@
 #| From: https://github.com/denizalti/paxosmmc |
 #|_____________________________________________|
 from process import Process
-from message import ProposeMessage,DecisionMessage,RequestMessage,DoneMessage
+from message import ProposeMessage,DecisionMessage,RequestMessage,DoneMessage,TimerMessage
+from message import ExecutedMessage,ResponseMessage,StateRequestMessage,StateMessage
+from message import ReadIndexMessage,ReadIndexReplyMessage
+from message import CheckpointMessage,DigestRequestMessage,DigestsMessage,HeartbeatMessage
+from results import ResultWriter, empty_rows
+from statemachine import get_state_machine
 from utils import *
+from window import AdaptiveWindow, FixedWindow
+from hashlib import blake2b
+import codec
+import collections
 import time
 import json
 
+GENESIS = bytes(16)     # Digest of the empty log
+
 class Replica(Process):
-    def __init__(self, env, id, config):
+    """
+    Replicas receive requests from clients, propose them to leaders
+    and perform decided commands in slot order. With batch_size above
+    one, a replica packs up to batch_size pending commands into one
+    BatchCommand per slot, waiting at most linger milliseconds for a
+    batch to fill up. The number of slots that can have proposals
+    pending is fixed when window is above zero, and adapts to the
+    decision latency otherwise.
+
+    Every SNAPSHOTINTERVAL slots a replica takes a snapshot of its
+    state and forgets the decisions before it. A replica that starts,
+    or finds itself lagging behind the decisions it receives, fetches
+    the latest snapshot and the decisions after it from another
+    replica instead of replaying every decision from slot 1.
+
+    Decided commands are applied to a state machine, named by
+    state_machine (see statemachine.py). When leaders hold leases of
+    more than zero seconds, read-only commands skip the log: the
+    replica asks the leaders for a read index, the highest slot the
+    leader holding the lease has a proposal for, and answers the
+    reads from its state machine once it has performed that slot.
+    Reads that no leader can give an index for within READTIMEOUT
+    seconds are ordered through Paxos like any other command.
+
+    Every replica keeps a hash chain over the commands it performs:
+    the digest of a slot hashes the digest of the slot before it with
+    the slot number and its command, so two replicas with the same
+    digest for a slot have performed the same commands in all slots
+    up to it. When the environment has a consensus checker, the
+    replica sends it the digest every CHECKPOINTINTERVAL slots, and
+    keeps the digests of its last DIGESTHISTORY slots so that the
+    checker can find the slot at which replicas diverged.
+
+    With a results directory, every performed command is also
+    recorded as a row of the columns of results.ResultWriter, which
+    are appended to that directory at the end of every run.
+
+    With stable leader election (see Leader), a replica sends its
+    proposals only to leader, the leader that decided its latest
+    slot, or that announced it has become active, so that passive
+    leaders do no work. A newly active leader is sent every pending
+    proposal. Proposals that have waited PROPOSETIMEOUT seconds for a
+    decision are sent to every leader, and so are new proposals until
+    a leader is known again, in case the leader has failed.
+    """
+    def __init__(self, env, id, config, batch_size=1, linger=0, window=0,
+                 state_machine="kv", lease=0, results=None, election="stable"):
         Process.__init__(self, env, id)
         self.slot_in = self.slot_out = 1
         self.proposals = {}
         self.decisions = {}
         self.requests = []
         self.config = config
-        self.env.addProc(self)
+        self.batch_size = batch_size
+        self.linger = linger / 1000.0
+        self.batch_start = None
+        self.batch_timer = False
+        self.batch_due = False
+        self.batches = 0
+        self.window = FixedWindow(window) if window > 0 else AdaptiveWindow()
+        self.proposed_at = {}
+        self.executed = {}
+        self.pending = {}
+        self.state = get_state_machine(state_machine)
+        self.lease = lease
+        self.reads = []
+        self.read_id = 0
+        self.read_batch = None
+        self.read_refused = 0
+        self.ready = []
+        self.snapshot = None
+        self.pruned = 1
+        self.highest = 0
+        self.state_timer = False
+        self.state_peer = 0
+        self.election = election
+        self.leader = None
+        self.propose_timer = False
+        self.decision_latency = env.metrics.histogram("paxos_propose_decision_seconds",
+            "Time from proposing a command to its decision.", role=self.role)
+        env.metrics.gauge("paxos_inflight_slots", lambda: self.slot_in - self.slot_out,
+            "Slots proposed but not yet performed.", role=self.role, process=self.name)
 
         self.times = {}
         self.decs_made = 0
         self.total_reqs = -1
         self.written = False
         self.n_clients = 0
+        self.digest = GENESIS
+        self.digests = collections.deque(maxlen=DIGESTHISTORY)
+        self.checker = env.checker
+        self.results = ResultWriter(results) if results else None
+        self.rows = empty_rows()
+        self.env.addProc(self)
 
     def propose(self):
         """
@@ -31,29 +122,74 @@ class Replica(Process):
         the window of slots with known configurations. For each such
         slot, it first checks if the configuration for that slot is
         different from the prior slot by checking if the decision in
-        (slot_in - WINDOW) is a reconfiguration command. If so, the
+        (slot_in - MAXWINDOW) is a reconfiguration command. If so, the
         function updates the configuration for slot s. Then the
         function pops a request from requests and adds it as a
         proposal for slot_in to the set proposals. Finally, it sends a
         Propose message to all leaders in the configuration of
         slot_in.
         """
-        while len(self.requests) != 0 and self.slot_in < self.slot_out+WINDOW:
+        while len(self.requests) != 0 and self.slot_in < self.slot_out+self.window.size:
             # A reconfiguration command is decided in a slot just like
             # any other command.  However, it does not take effect
-            # until WINDOW slots later. This allows up to WINDOW slots
-            # to have proposals pending.
-            if self.slot_in > WINDOW and self.slot_in-WINDOW in self.decisions:
-                if isinstance(self.decisions[self.slot_in-WINDOW], ReconfigCommand):
-                    r,a,l = self.decisions[self.slot_in-WINDOW].config.split(';')
-                    self.config = Config(r.split(','), a.split(','), l.split(','))
-                    print(self.id, ": new config:", self.config)
+            # until MAXWINDOW slots later. This allows up to MAXWINDOW
+            # slots to have proposals pending, whatever the current
+            # size of the window.
+            if self.slot_in > MAXWINDOW and self.slot_in-MAXWINDOW in self.decisions:
+                if isinstance(self.decisions[self.slot_in-MAXWINDOW], ReconfigCommand):
+                    r,a,l = self.decisions[self.slot_in-MAXWINDOW].config.split(';')
+                    self.config = Config([int(p) for p in r.split(',')],
+                                         [int(p) for p in a.split(',')],
+                                         [int(p) for p in l.split(',')])
+                    print(self.name, ": new config:", self.config)
             if self.slot_in not in self.decisions:
-                cmd = self.requests.pop(0)
+                cmd = self.next_command()
+                if cmd is None:
+                    break
                 self.proposals[self.slot_in] = cmd
-                for ldr in self.config.leaders:
+                self.proposed_at[self.slot_in] = self.now()
+                leaders = self.config.leaders
+                if self.leader in leaders:
+                    leaders = [self.leader]
+                for ldr in leaders:
                     self.sendMessage(ldr, ProposeMessage(self.id, self.slot_in, cmd))
             self.slot_in +=1
+        if self.election == "stable" and self.proposals and not self.propose_timer:
+            self.setTimer(PROPOSETIMEOUT, TimerMessage(self.id, "propose"))
+            self.propose_timer = True
+
+    def next_command(self):
+        """
+        Pop the next command to propose from requests. Without
+        batching this is the oldest request. With batching, up to
+        batch_size consecutive client commands are packed into a
+        BatchCommand once the batch is full or the oldest of them has
+        waited linger seconds, which the batch timer set for it tells.
+        Return None while the batch lingers.
+        """
+        if self.batch_size <= 1 or not isinstance(self.requests[0], Command):
+            return self.requests.pop(0)
+        n = 0
+        while n < len(self.requests) and n < self.batch_size and \
+              isinstance(self.requests[n], Command):
+            n += 1
+        now = self.now()
+        if self.batch_start is None:
+            self.batch_start = now
+        if n < self.batch_size and not self.batch_due and now - self.batch_start < self.linger:
+            if not self.batch_timer:
+                self.setTimer(self.linger - (now - self.batch_start),
+                              TimerMessage(self.id, ("batch", self.batch_start)))
+                self.batch_timer = True
+            return None
+        commands = tuple(self.requests[:n])
+        del self.requests[:n]
+        self.batch_start = now if len(self.requests) != 0 else None
+        self.batch_due = False
+        if n == 1:
+            return commands[0]
+        self.batches += 1
+        return BatchCommand(self.id, self.batches, commands)
 
     def perform(self, cmd):
         """
@@ -64,99 +200,413 @@ class Replica(Process):
         command may be decided multiple times. The corresponding
         operation is evaluated only if the command is new and it is
         not a reconfiguration request. If so, perform() applies the
-        requested operation to the application state. In either case,
-        the function increments slot out.
-        """
-        t2 = time.time()
-        self.record_decision_time(t2, cmd)
-        for s in range(1, self.slot_out):
-            if self.decisions[s] == cmd:
-                self.slot_out += 1
-                return
-        if isinstance(cmd, ReconfigCommand):
-            self.slot_out += 1
-            return
-        print(self.id, ": perform", self.slot_out, ":", cmd)
-        self.decs_made += 1
+        requested operation to the application state. The commands of
+        a batch are treated in order, each with its own check. In
+        either case, the function increments slot out, and every
+        COMPACTINTERVAL slots reports it to the leaders so that they
+        can compact the acceptors.
+
+        Whether a command was performed before is looked up in the
+        reply cache of its client (see lookup()), so every check costs
+        O(1) however long the log grows. The first time a command is
+        performed its result is sent to the client in a response
+        message, and retransmitted requests are answered from the
+        cache.
+        """
+        t2 = self.wallclock()
+        if isinstance(cmd, BatchCommand):
+            commands = cmd.commands
+        else:
+            commands = [cmd]
+        for c in commands:
+            if self.lookup(c)[0]:
+                continue
+            result = None
+            if not isinstance(c, ReconfigCommand):
+                print(self.name, ": perform", self.slot_out, ":", c)
+                self.decs_made += 1
+                result = self.state.apply(c.op)
+                if self.results is not None:
+                    self.record_row(c, t2)
+            self.cache(c, result)
+            self.sendMessage(c.client, ResponseMessage(self.id, c, result))
+        self.chain(cmd)
         self.slot_out += 1
+        if self.slot_out % COMPACTINTERVAL == 0:
+            for ldr in self.config.leaders:
+                self.sendMessage(ldr, ExecutedMessage(self.id, self.slot_out))
+        if self.slot_out % SNAPSHOTINTERVAL == 0:
+            self.take_snapshot()
+
+    def lookup(self, cmd):
+        """
+        Look cmd up in the reply cache of its client. Return
+        (performed, result), where result is None if cmd has not been
+        performed or its result is no longer kept.
+        """
+        low, result = self.executed.get(cmd.client, (0, None))
+        if cmd.req_id <= low:
+            return True, result if cmd.req_id == low else None
+        pending = self.pending.get(cmd.client)
+        if pending is not None and cmd.req_id in pending:
+            return True, pending[cmd.req_id]
+        return False, None
+
+    def cache(self, cmd, result):
+        """
+        Add the result of cmd to the reply cache of its client. The
+        request ids of a client count up from 1, and executed maps the
+        client to the highest req_id up to which all its requests have
+        been performed, with the result of that request. A client may
+        have several requests outstanding, which can be decided out of
+        order: pending holds the results of the requests performed
+        beyond that req_id until the requests before them have been
+        performed. The cache grows with the clients and their
+        outstanding requests instead of the length of the log.
+        """
+        low, low_result = self.executed.get(cmd.client, (0, None))
+        if cmd.req_id != low + 1:
+            self.pending.setdefault(cmd.client, {})[cmd.req_id] = result
+            return
+        low, low_result = cmd.req_id, result
+        pending = self.pending.get(cmd.client)
+        if pending is not None:
+            while low + 1 in pending:
+                low += 1
+                low_result = pending.pop(low)
+            if len(pending) == 0:
+                del self.pending[cmd.client]
+        self.executed[cmd.client] = (low, low_result)
+
+    def chain(self, cmd):
+        """
+        Extend the hash chain with cmd decided in slot_out, and send a
+        checkpoint if one is due.
+        """
+        self.digest = blake2b(self.digest + codec.dumps((self.slot_out, cmd)), digest_size=16).digest()
+        if self.checker is not None:
+            self.digests.append(self.digest)
+            if self.slot_out % CHECKPOINTINTERVAL == 0:
+                self.sendMessage(self.checker, CheckpointMessage(self.id, self.slot_out, self.digest))
+
+    def sendDigests(self, dst, slot_number, count):
+        """
+        Send dst the digests of count slots from slot_number, or None
+        if they are no longer kept.
+        """
+        first = self.slot_out - len(self.digests)
+        digests = None
+        if slot_number >= first and slot_number + count <= self.slot_out:
+            digests = [self.digests[s - first] for s in range(slot_number, slot_number + count)]
+        self.sendMessage(dst, DigestsMessage(self.id, slot_number, digests))
+
+    def execute(self):
+        """
+        Perform decisions in slot order for as long as the decision
+        for slot_out is known. If the replica has proposed a different
+        command for a slot, that command is returned to requests so it
+        can be proposed again at a later time.
+        """
+        while self.slot_out in self.decisions:
+            if self.slot_out in self.proposals:
+                if self.proposals[self.slot_out] != self.decisions[self.slot_out]:
+                    self.requests.append(self.proposals[self.slot_out])
+                del self.proposals[self.slot_out]
+            self.perform(self.decisions[self.slot_out])
+
+    def take_snapshot(self):
+        """
+        Record the state of the replica after performing every slot
+        below slot_out, and forget the decisions before it. The
+        MAXWINDOW decisions just before the snapshot are kept, since
+        they determine the configuration of the slots after it. Only
+        the reply cache, one entry per client (see cache()), goes into
+        the snapshot with the state machine, so its size does not grow
+        with the length of the log.
+        """
+        self.snapshot = {"slot": self.slot_out, "config": self.config,
+                         "executed": dict(self.executed), "performed": self.decs_made,
+                         "pending": {c: dict(p) for c, p in self.pending.items()},
+                         "state": self.state.snapshot(), "digest": self.digest}
+        for s in range(self.pruned, self.slot_out - MAXWINDOW):
+            self.decisions.pop(s, None)
+        self.pruned = max(self.pruned, self.slot_out - MAXWINDOW)
 
-    def body(self):
+    def install(self, snapshot):
         """
-        A replica runs in an infinite loop, receiving
-        messages. Replicas receive two kinds of messages:
+        Replace the state of the replica with a snapshot taken by
+        another replica at a later slot. Proposals for slots before
+        the snapshot are returned to requests, and requests the
+        snapshot has already performed are dropped.
+        """
+        self.slot_out = snapshot["slot"]
+        self.slot_in = max(self.slot_in, self.slot_out)
+        self.config = snapshot["config"]
+        self.executed = dict(snapshot["executed"])
+        self.pending = {c: dict(p) for c, p in snapshot["pending"].items()}
+        self.decs_made = snapshot["performed"]
+        self.state.restore(snapshot["state"])
+        self.digest = snapshot["digest"]
+        self.digests.clear()
+        self.snapshot = snapshot
+        for s in [s for s in self.proposals if s < self.slot_out]:
+            self.requests.append(self.proposals.pop(s))
+            self.proposed_at.pop(s, None)
+        self.requests = [c for c in self.requests if not self.lookup(c)[0]]
+        self.pruned = max(self.pruned, self.slot_out - MAXWINDOW)
+        self.decisions = {s: c for s, c in self.decisions.items() if s >= self.pruned}
+        print(self.name, ": installed snapshot at slot", self.slot_out)
+
+    def lagging(self):
+        """
+        Return True if decisions well past slot_out have arrived but
+        not the one for slot_out.
+        """
+        return self.slot_out not in self.decisions and self.highest >= self.slot_out + MAXWINDOW
+
+    def requestState(self):
+        """
+        Ask another replica for its latest snapshot and the decisions
+        after slot_out, unless a request is already pending. Every
+        retry after STATETIMEOUT asks the next replica.
+        """
+        peers = [r for r in self.config.replicas if r != self.id]
+        if self.state_timer or len(peers) == 0:
+            return
+        self.state_peer = (self.state_peer + 1) % len(peers)
+        self.sendMessage(peers[self.state_peer], StateRequestMessage(self.id, self.slot_out))
+        self.setTimer(STATETIMEOUT, TimerMessage(self.id, "state"))
+        self.state_timer = True
+
+    def sendState(self, dst, slot_number):
+        """
+        Answer a state request for the slots from slot_number on. If
+        slot_number is before the latest snapshot, send the snapshot
+        and the decisions kept with it, otherwise only the decisions
+        from slot_number on.
+        """
+        snapshot = None
+        start = slot_number
+        if self.snapshot is not None and self.snapshot["slot"] > slot_number:
+            snapshot = self.snapshot
+            start = max(slot_number, self.pruned)
+        decisions = {s: c for s, c in self.decisions.items() if s >= start}
+        if snapshot is not None or len(decisions) != 0:
+            self.sendMessage(dst, StateMessage(self.id, snapshot, decisions))
+
+    def requestReadIndex(self):
+        """
+        Ask the leaders for a read index for the reads received so
+        far, unless a request is already outstanding.
+        """
+        if self.read_batch is not None or len(self.reads) == 0:
+            return
+        self.read_id += 1
+        self.read_batch, self.reads = self.reads, []
+        self.read_refused = 0
+        for ldr in self.config.leaders:
+            self.sendMessage(ldr, ReadIndexMessage(self.id, self.read_id))
+        self.setTimer(READTIMEOUT, TimerMessage(self.id, ("read", self.read_id)))
+
+    def orderReads(self):
+        """ Propose the reads of the outstanding read index request like other commands. """
+        self.requests.extend(self.read_batch)
+        self.read_batch = None
+        self.requestReadIndex()
+
+    def serveReads(self):
+        """ Answer the reads whose read index has been performed. """
+        while len(self.ready) != 0 and self.ready[0][0] < self.slot_out:
+            slot_number, reads = self.ready.pop(0)
+            for c in reads:
+                result = self.state.read(c.op)
+                self.cache(c, result)
+                self.sendMessage(c.client, ResponseMessage(self.id, c, result))
+
+    def onStart(self):
+        print("Here I am: ", self.name)
+        self.requestState()
+
+    def handle(self, msg):
+        """
+        Replicas receive two kinds of messages:
 
         - Requests: When it receives a request from a client, the
         replica adds the request to set requests. Next, the replica
-        invokes the function propose().
+        invokes the function propose(). If the command has already
+        been performed, the replica instead responds to the client
+        with the cached result.
 
         - Decisions: Decisions may arrive out-of-order and multiple
-        times. For each decision message, the replica adds the
-        decision to the set decisions. Then, in a loop, it considers
-        which decisions are ready for execution before trying to
-        receive more messages. If there is a decision corresponding to
-        the current slot out, the replica first checks to see if it
-        has proposed a different command for that slot. If so, the
-        replica removes that command from the set proposals and
-        returns it to set requests so it can be proposed again at a
-        later time. Next, the replica invokes perform().
-        """
-        print("Here I am: ", self.id)
-        while True:
-            msg = self.getNextMessage()
-            if isinstance(msg, RequestMessage):
+        times. Decisions for slots below slot out, which the replica
+        has performed already, are ignored. For each other decision
+        message, the replica adds the decision to the set decisions.
+        Then, in a loop, it considers which decisions are ready for
+        execution before trying to receive more messages. If there is
+        a decision corresponding to the current slot out, the replica
+        first checks to see if it has proposed a different command for
+        that slot. If so, the replica removes that command from the
+        set proposals and returns it to set requests so it can be
+        proposed again at a later time. Next, the replica invokes
+        perform(). If decisions keep arriving for later slots only,
+        the replica has missed some and requests a state transfer.
+
+        - State requests and states: A replica answers a state request
+        with its latest snapshot and the decisions after it, see
+        sendState(). A replica receiving a state installs the snapshot
+        if it is ahead of slot_out, adds the decisions and performs
+        those that are ready.
+
+        - Read index replies: The reads of the request are answered
+        once slot_out has passed the read index. If every leader
+        declines, the reads are proposed instead.
+
+        - Digest requests: The consensus checker asks for the digests
+        of the slots in which replicas may have diverged.
+
+        - Heartbeats: A leader has become active, and is sent the
+        proposals still waiting for a decision.
+        """
+        if isinstance(msg, RequestMessage):
+            performed, result = self.lookup(msg.command)
+            if performed:
+                self.sendMessage(msg.src, ResponseMessage(self.id, msg.command, result))
+            elif self.lease > 0 and isinstance(msg.command, Command) and \
+                  self.state.is_read(msg.command.op):
+                self.reads.append(msg.command)
+                self.requestReadIndex()
+            else:
                 self.record_msg(msg)
                 self.requests.append(msg.command)
-            elif isinstance(msg, DecisionMessage):
-                self.decisions[msg.slot_number] = msg.command
-                while self.slot_out in self.decisions:
-                    if self.slot_out in self.proposals:
-                        if self.proposals[self.slot_out] != self.decisions[self.slot_out]:
-                            self.requests.append(self.proposals[self.slot_out])
-                        del self.proposals[self.slot_out]
-                    self.perform(self.decisions[self.slot_out])
-            elif isinstance(msg, DoneMessage):
-                self.total_reqs = int(msg.command[2])
-                self.n_clients = int(msg.command[1])
-            else:
-                print("Replica: unknown msg type")
+        elif isinstance(msg, DecisionMessage):
+            if msg.slot_number < self.slot_out:
+                return
+            self.decisions[msg.slot_number] = msg.command
+            if self.election == "stable":
+                self.leader = msg.src & NODEMASK
+            if msg.slot_number in self.proposed_at:
+                latency = self.now() - self.proposed_at.pop(msg.slot_number)
+                self.window.update(latency, self.wallclock())
+                self.decision_latency.record(latency)
+            self.highest = max(self.highest, msg.slot_number)
+            self.execute()
+            if self.lagging():
+                self.requestState()
+        elif isinstance(msg, DigestRequestMessage):
+            self.sendDigests(msg.src, msg.slot_number, msg.count)
+        elif isinstance(msg, HeartbeatMessage):
+            if msg.active and self.election == "stable" and self.leader != msg.src:
+                self.leader = msg.src
+                for s, cmd in self.proposals.items():
+                    if s not in self.decisions:
+                        self.sendMessage(msg.src, ProposeMessage(self.id, s, cmd))
+        elif isinstance(msg, StateRequestMessage):
+            self.sendState(msg.src, msg.slot_number)
+        elif isinstance(msg, StateMessage):
+            if msg.snapshot is not None and msg.snapshot["slot"] > self.slot_out:
+                self.install(msg.snapshot)
+            for s, c in msg.decisions.items():
+                if s >= self.pruned and s not in self.decisions:
+                    self.decisions[s] = c
+                    self.highest = max(self.highest, s)
+            self.execute()
+        elif isinstance(msg, DoneMessage):
+            self.total_reqs = int(msg.command[2])
+            self.n_clients = int(msg.command[1])
+        elif isinstance(msg, ReadIndexReplyMessage):
+            if msg.read_id == self.read_id and self.read_batch is not None:
+                if msg.slot_number is None:
+                    self.read_refused += 1
+                    if self.read_refused >= len(self.config.leaders):
+                        self.orderReads()
+                else:
+                    self.ready.append((msg.slot_number, self.read_batch))
+                    self.read_batch = None
+                    self.requestReadIndex()
+        elif isinstance(msg, TimerMessage):
+            if msg.tag == "state":
+                self.state_timer = False
+                if self.lagging():
+                    self.requestState()
+            elif msg.tag == ("read", self.read_id):
+                if self.read_batch is not None:
+                    self.orderReads()
+            elif isinstance(msg.tag, tuple) and msg.tag[0] == "batch":
+                # The batch the timer was set for is due, even if the
+                # clock reads a hair less than linger later.
+                self.batch_timer = False
+                if msg.tag[1] == self.batch_start:
+                    self.batch_due = True
+            elif msg.tag == "propose":
+                self.propose_timer = False
+                self.resendProposals()
+        else:
+            print("Replica: unknown msg type")
 
-            self.propose()
-            if self.decs_made == self.total_reqs and not self.written:
-                self.write_times()
-                self.written =  True
+        self.propose()
+        self.serveReads()
+        if self.total_reqs >= 0 and self.decs_made >= self.total_reqs and not self.written:
+            self.write_times()
+            self.written =  True
+
+    def resendProposals(self):
+        """
+        Send the proposals that have waited PROPOSETIMEOUT seconds for
+        a decision to every leader, and forget the leader so that new
+        proposals go to every leader as well.
+        """
+        now = self.now()
+        for s, cmd in self.proposals.items():
+            if now - self.proposed_at.get(s, now) > PROPOSETIMEOUT:
+                self.leader = None
+                for ldr in self.config.leaders:
+                    self.sendMessage(ldr, ProposeMessage(self.id, s, cmd))
 
     def record_msg(self,msg):
-        """ Record message recieved time """
-        if isinstance(msg.command, ReconfigCommand):
+        """ Record the time a client sent a request, for the results of the current run. """
+        if self.results is None or isinstance(msg.command, ReconfigCommand):
             return
-
-        key = msg.command[2]
         if isinstance(msg, RequestMessage):
-            if "client" in msg.src:
-                if key not in self.times:
-                    self.times[key] = [float(msg.time), False]
-                else:
-                    self.times[key][0] = float(msg.time)
+            if self.env.name(msg.src).startswith("client"):
+                self.times[(msg.command.client, msg.command.req_id)] = float(msg.time)
 
+    def record_row(self, cmd, decided):
+        """ Add the row of a performed command to the columns of the current run. """
+        rows = self.rows
+        rows["slot"].append(self.slot_out)
+        rows["client"].append(cmd.client)
+        rows["req_id"].append(cmd.req_id)
+        rows["sent"].append(self.times.get((cmd.client, cmd.req_id), float("nan")))
+        rows["decided"].append(decided)
 
-    def record_decision_time(self, time, cmd):
-        if not isinstance(cmd, ReconfigCommand):
-            key = cmd[2]
-            if key not in self.times:
-                self.times[key] = [False, time]
-            else:
-                self.times[key][1] = time
+    def write_times(self):
+        """
+        End the current run: append its rows to the results, if the
+        replica has a results directory, and write the window sizes.
+        """
+        print("Replica", self.name, "writing results")
+        self.times = {}
+        self.write_window("clients:" + str(self.n_clients) + "|requests:" + str(self.total_reqs) + "\n")
+        if self.results is not None:
+            self.results.append_run(self.rows, replica=self.name, clients=self.n_clients,
+                                    requests=self.total_reqs, time=time.time())
+            self.rows = empty_rows()
 
+    def onStop(self):
+        if self.results is not None:
+            self.results.close()
 
-    def write_times(self):
-        print("Replica", str(self.id), "writing to file")
-        file = "thr_" + str(self.id).replace(" ","_")
-        run_config = "clients:" + str(self.n_clients) + "|requests:" + str(self.total_reqs) + "\n"
+    def write_window(self, run_config):
+        """ Write every change of the window size to win_replica_N. """
+        file = "win_" + self.name.replace(" ","_")
         with open(file, "a") as f:
             f.write(run_config)
-            #f.write("_______")
-            for key in self.times:
-                diff = float(self.times[key][1]) - float(self.times[key][0])
-                txt = str(key) + ": " + str(diff) + "\n"
-                f.write(txt)
-        self.times = {}
+            for t, size in self.window.history:
+                f.write(str(t) + ": " + str(size) + "\n")
+        self.window.history = []
+
+if __name__ == '__main__':
+    from launcher import start_node
+    start_node(lambda env, pid: Replica(env, pid, env.config, env.batch_size,
+                                        env.linger, env.window, env.state_machine,
+                                        env.lease, election=env.election))
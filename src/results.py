@@ -0,0 +1,136 @@
+import array
+import ast
+import json
+import os
+import sys
+
+# Columns written by every replica, with their array typecodes: the run,
+# the slot a command was performed in, its client and request id, the
+# wall clock time its request reached the replica (nan if it did not)
+# and the time it was performed.
+COLUMNS = [("run", "q"), ("slot", "q"), ("client", "q"), ("req_id", "q"),
+           ("sent", "d"), ("decided", "d")]
+DESCR = {"q": "i8", "d": "f8"}
+ENDIAN = "<" if sys.byteorder == "little" else ">"
+
+class Column:
+    """
+    One column of values stored as a NumPy .npy file (format 1.0), so
+    that numpy.load() can map it without parsing. The header is padded
+    to HEADER bytes, which leaves room for the shape to grow, so that
+    append() adds values at the end of the file and then rewrites the
+    length in the header in place. Bytes beyond the length in the
+    header, left by an append that did not finish, are cut off when
+    the column is opened again.
+    """
+    MAGIC = b"\x93NUMPY\x01\x00"
+    HEADER = 128
+
+    def __init__(self, path, typecode):
+        self.path = path
+        self.typecode = typecode
+        self.itemsize = array.array(typecode).itemsize
+        self.descr = ENDIAN + DESCR[typecode]
+        if os.path.exists(path):
+            self.f = open(path, "r+b")
+            descr, self.length = read_header(self.f)
+            if descr != self.descr:
+                raise ValueError("%s holds %s values, expected %s" % (path, descr, self.descr))
+            self.f.truncate(self.HEADER + self.length * self.itemsize)
+        else:
+            self.f = open(path, "w+b")
+            self.length = 0
+            self.write_header()
+
+    def write_header(self):
+        header = "{'descr': '%s', 'fortran_order': False, 'shape': (%d,), }" % (self.descr, self.length)
+        header = header.ljust(self.HEADER - len(self.MAGIC) - 2 - 1) + "\n"
+        self.f.seek(0)
+        self.f.write(self.MAGIC + len(header).to_bytes(2, "little") + header.encode("latin1"))
+
+    def append(self, values):
+        """ Append values, an array.array of the typecode of the column. """
+        self.f.seek(self.HEADER + self.length * self.itemsize)
+        values.tofile(self.f)
+        self.f.flush()
+        self.length += len(values)
+        self.write_header()
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+def read_header(f):
+    """ Read the header of an .npy file. Return (descr, length). """
+    f.seek(0)
+    magic = f.read(8)
+    if magic[:6] != Column.MAGIC[:6]:
+        raise ValueError("Not an .npy file")
+    size = int.from_bytes(f.read(2), "little")
+    header = ast.literal_eval(f.read(size).decode("latin1"))
+    return header["descr"], header["shape"][0]
+
+def read_column(path):
+    """ Read a column without NumPy. Return an array.array. """
+    with open(path, "rb") as f:
+        descr, length = read_header(f)
+        typecode = {v: k for k, v in DESCR.items()}[descr[1:]]
+        values = array.array(typecode)
+        values.fromfile(f, length)
+    if descr[0] != ENDIAN:
+        values.byteswap()
+    return values
+
+class ResultWriter:
+    """
+    The measurements of one replica in directory: a Column for each
+    of COLUMNS and meta.json, which lists every run with its
+    parameters and the rows it covers. Every call to append_run()
+    adds a run to the end of the columns, so the results of several
+    runs collect in the same files.
+    """
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.meta_path = os.path.join(directory, "meta.json")
+        self.meta = {"columns": dict(COLUMNS), "runs": []}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.meta = json.load(f)
+        self.columns = {name: Column(os.path.join(directory, name + ".npy"), typecode)
+                        for name, typecode in COLUMNS}
+        # Rows of a run that did not finish writing its meta data are dropped.
+        rows = self.meta["runs"][-1]["rows"][1] if self.meta["runs"] else 0
+        for column in self.columns.values():
+            if column.length > rows:
+                column.length = rows
+                column.f.truncate(Column.HEADER + rows * column.itemsize)
+                column.write_header()
+
+    def append_run(self, rows, **meta):
+        """
+        Append a run. rows maps every column name to an array.array
+        of its values, all of the same length. meta is stored with
+        the run in meta.json.
+        """
+        start = self.columns["run"].length
+        n = len(rows["slot"])
+        run = len(self.meta["runs"])
+        rows["run"] = array.array("q", [run]) * n
+        for name, column in self.columns.items():
+            column.append(rows[name])
+        meta.update({"run": run, "rows": [start, start + n]})
+        self.meta["runs"].append(meta)
+        tmp = self.meta_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.meta, f, indent=1)
+        os.replace(tmp, self.meta_path)
+        return run
+
+    def close(self):
+        for column in self.columns.values():
+            column.close()
+
+def empty_rows():
+    """ Return a dict of empty arrays for the columns a replica fills. """
+    return {name: array.array(typecode) for name, typecode in COLUMNS if name != "run"}
@@ -1,23 +1,31 @@
 #!/usr/bin/env python3
-import numpy as np
 import re
 import sys
 import os
+import shutil
 from argparse import RawTextHelpFormatter
 import argparse
+from benchmark import run_point, format_run
 from utils import parse_config, create_config
 
+RESULTS = "results"   # Directory the replicas of every run write their results to
+
 
 class TestRunner:
     "Runs tests"
     def __init__(self, test, config, fails,
-                 clients, requests, timeout, runs, increment, debug):
+                 clients, requests, timeout, runs, increment, debug,
+                 batch_size=1, linger=0, window=0, outstanding=0):
         self.cfg = str(config)
         self.cli = str(clients)
         self.req = str(requests)
         self.tout = str(timeout)
         self.runs = runs
         self.i = increment
+        self.batch = str(batch_size)
+        self.linger = str(linger)
+        self.window = str(window)
+        self.outstanding = str(outstanding)
 
         if fails:
             fails = int(fails)
@@ -26,11 +34,9 @@ class TestRunner:
             a = str((2 * fails) + 1)
             self.cfg = r+l+a
 
-        self.cfg_dict = parse_config(self.cfg)
-
         if debug:
             print("Test: %s, runs: %d (increment %d)" % (test, self.runs, self.i))
-            print("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
+            print(self.env_cmd())
             exit(0)
 
         self.clean_data_files()
@@ -54,31 +60,57 @@ class TestRunner:
             print("No such test:", test)
 
 
+    def point(self):
+        """ Parameters of a single run with the current parameters, see benchmark.run_point. """
+        point = dict(parse_config(self.cfg))
+        point.update({"clients": int(self.cli), "requests": int(self.req),
+                      "timeout": float(self.tout), "batch_size": int(self.batch),
+                      "linger": float(self.linger), "window": int(self.window),
+                      "outstanding": int(self.outstanding)})
+        return point
+
+
+    def run_env(self):
+        """
+        Run env.py with the current parameters inside this process. The
+        replicas append their measurements to RESULTS.
+        """
+        point = self.point()
+        print(format_run(point, run_point(point, results=RESULTS)))
+
+
+    def env_cmd(self):
+        """ Command line for a single run of env.py with the current parameters. """
+        return "python3 env.py -r%s -C%s -T%s -c%s -b%s -l%s -w%s -o%s -O%s" % (self.req, self.cfg, self.tout,
+                                                                            self.cli, self.batch, self.linger,
+                                                                            self.window, self.outstanding, RESULTS)
+
+
     def _simple_test_(self):
         """ Simple run of the multi-paxos algorithm. Confirms that the replicas reached a consensus. """
-        os.system("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
-        os.system("python3 confirm_consensus.py %s" % (str(self.cfg_dict["replicas"])))
+        self.run_env()
+        os.system("python3 confirm_consensus.py %s" % RESULTS)
 
 
     def _thr_inc_clients_(self):
         """ Multiple runs of the multi-paxos algorithm. Plots throughput as a function of clients. """
         for n in range(self.runs):
-            os.system("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
+            self.run_env()
             self.cli = str(int(self.cli)+self.i)
 
         title = "'Throughput as as function of clients\ntimeout %s secs, config (%s)'" % (self.tout, self.cfg)
-        os.system("python3 plot_throughput.py %s %s" % (str(self.cfg_dict["replicas"]), title))
+        os.system("python3 plot_throughput.py %s %s" % (RESULTS, title))
 
 
     def _thr_inc_req_(self):
         """ Multiple runs of the multi-paxos algorithm. Plots throughput as a function of requests. """
         start = int(self.req)
         for n in range(self.runs):
-            os.system("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
+            self.run_env()
             self.req = str(int(self.req)+self.i)
 
         title = "'Throughput as as function of requests\ntimeout %s secs, config (%s)'" % (self.tout, self.cfg)
-        os.system("python3 plot_data.py %s %s %s %d %d" % (self.cfg_dict["replicas"], title, "'number of requests'", start, self.i))
+        os.system("python3 plot_data.py %s %s %s %d %d" % (RESULTS, title, "'number of requests'", start, self.i))
 
 
     def _thr_inc_replicas_(self):
@@ -88,7 +120,7 @@ class TestRunner:
         """
         start = parse_config(self.cfg)["replicas"]
         for n in range(self.runs):
-            os.system("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
+            self.run_env()
             # Update config
             d = parse_config(self.cfg)
             self.cfg = create_config(d["replicas"]+self.i, d["leaders"], d["acceptors"])
@@ -98,14 +130,14 @@ class TestRunner:
         d["replicas"] = "X"
         self.cfg = create_config(d["replicas"], d["leaders"], d["acceptors"])
         title = "'Throughput as as function of replicas\ntimeout %s secs, config (%s)'" % (self.tout, self.cfg)
-        os.system("python3 plot_data.py %s %s %s %d %d" % (self.cfg_dict["replicas"], title, "'number of replicas'", start, self.i))
+        os.system("python3 plot_data.py %s %s %s %d %d" % (RESULTS, title, "'number of replicas'", start, self.i))
 
 
     def _thr_inc_leaders_(self):
         """ Multiple runs of the multi-paxos algorithm. Plots throughput as a function of leaders. """
         start = parse_config(self.cfg)['leaders']
         for n in range(self.runs):
-            os.system("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
+            self.run_env()
             # Update config
             d = parse_config(self.cfg)
             self.cfg = create_config(d["replicas"], d["leaders"]+self.i, d["acceptors"])
@@ -115,14 +147,14 @@ class TestRunner:
         d['leaders'] = "X"
         self.cfg = create_config(d["replicas"], d["leaders"], d["acceptors"])
         title = "'Throughput as as function of leaders\ntimeout %s secs, config (%s)'" % (self.tout, self.cfg)
-        os.system("python3 plot_data.py %s %s %s %d %d" % (self.cfg_dict["replicas"], title, "'number of leaders'", start, self.i))
+        os.system("python3 plot_data.py %s %s %s %d %d" % (RESULTS, title, "'number of leaders'", start, self.i))
 
 
     def _thr_inc_acceptors_(self):
         """ Multiple runs of the multi-paxos algorithm. Plots throughput as a function of acceptors. """
         start = parse_config(self.cfg)["acceptors"]
         for n in range(self.runs):
-            os.system("python3 env.py -r%s -C%s -T%s -c%s" % (self.req, self.cfg, self.tout ,self.cli))
+            self.run_env()
             # Update config
             d = parse_config(self.cfg)
             self.cfg = create_config(d["replicas"], d["leaders"], d["acceptors"]+self.i)
@@ -132,15 +164,12 @@ class TestRunner:
         d["acceptors"] = "X"
         self.cfg = create_config(d["replicas"], d["leaders"], d["acceptors"])
         title = "'Throughput as as function of acceptors\ntimeout %s secs, config (%s)'" % (self.tout, self.cfg)
-        os.system("python3 plot_data.py %s %s %s %d %d" % (self.cfg_dict["replicas"], title, "'number of acceptors'", start, self.i))
+        os.system("python3 plot_data.py %s %s %s %d %d" % (RESULTS, title, "'number of acceptors'", start, self.i))
 
 
     def clean_data_files(self):
-        """ Creates (and empties) the throughput data files. """
-        for r in range(self.cfg_dict["replicas"]):
-            file = "thr_replica_" + str(r)
-            with open(file, "w") as f:
-                f.write("")
+        """ Removes the results of earlier tests. """
+        shutil.rmtree(RESULTS, ignore_errors=True)
 
 
 def parse_args():
@@ -173,6 +202,19 @@ def parse_args():
     p.add_argument("-T", "--timeout", required=False, type=float, default=1.0,
         help="Default: 1.0 \nTimeout length before a client sends the next request.")
 
+    p.add_argument("-b", "--batch-size", required=False, type=int, default=1,
+        help="Default: 1 \nMaximum number of client commands a replica decides in one slot.")
+
+    p.add_argument("-L", "--linger", required=False, type=float, default=0,
+        help="Default: 0 \nMilliseconds a replica waits for a batch to fill up.")
+
+    p.add_argument("-w", "--window", required=False, type=int, default=0,
+        help="Default: 0 \nNumber of slots that can have proposals pending, or 0 to adapt it to decision latency.")
+
+    p.add_argument("-o", "--outstanding", required=False, type=int, default=0,
+        help="Default: 0 \nRun closed-loop clients with this many outstanding requests each,\n" +
+             "or 0 to send one request per client every timeout seconds.")
+
     p.add_argument("-n", "--runs", required=False, type=int, default=3,
         help="Default: 3\nNumber of tests to run.")
 
@@ -189,4 +231,5 @@ def parse_args():
 if __name__=='__main__':
     args = parse_args()
     TestRunner(args.test, args.config, args.fails, args.clients, args.requests,
-               args.timeout, args.runs, args.increment, args.debug)
+               args.timeout, args.runs, args.increment, args.debug,
+               args.batch_size, args.linger, args.window, args.outstanding)
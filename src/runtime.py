@@ -0,0 +1,389 @@
+import asyncio
+import fnmatch
+import heapq
+import itertools
+import math
+import queue
+import random
+import threading
+import time
+import traceback
+from utils import NODEMASK
+
+class TimerThread(threading.Thread):
+    """
+    A single thread that delivers the timer messages of all processes
+    in the threaded runtime, kept in a heap ordered by deadline.
+    """
+    def __init__(self):
+        super(TimerThread, self).__init__(daemon=True)
+        self.heap = []
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.stopped = False
+
+    def add(self, delay, proc, msg):
+        with self.cond:
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.seq), proc, msg))
+            self.cond.notify()
+
+    def run(self):
+        while True:
+            with self.cond:
+                while len(self.heap) == 0 or self.heap[0][0] > time.monotonic():
+                    if self.stopped:
+                        return
+                    if len(self.heap) == 0:
+                        self.cond.wait()
+                    else:
+                        self.cond.wait(self.heap[0][0] - time.monotonic())
+                deadline, seq, proc, msg = heapq.heappop(self.heap)
+            proc.deliver(msg)
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+
+class ThreadRuntime:
+    """
+    The original execution mode. Every process is a thread that blocks
+    on its own inbox, created by the transport of the environment.
+    """
+    name = "thread"
+
+    def __init__(self):
+        self.timers = TimerThread()
+        self.timers.start()
+
+    def inbox(self, transport):
+        return transport.inbox()
+
+    def start(self, proc):
+        proc.start()
+
+    def now(self):
+        return time.monotonic()
+
+    def wallclock(self):
+        return time.time()
+
+    def wait(self, predicate, interval=0.01):
+        """ Return once predicate() holds, checking every interval seconds. """
+        while not predicate():
+            time.sleep(interval)
+
+    def setTimer(self, delay, proc, msg):
+        """ Deliver msg to proc after delay seconds. """
+        self.timers.add(delay, proc, msg)
+
+    def close(self):
+        """ Stop delivering timers. """
+        self.timers.stop()
+
+class AsyncInbox:
+    """
+    An inbox backed by an asyncio.Queue. Messages put from threads
+    other than the event loop thread (such as client threads in Env)
+    are handed over to the loop with call_soon_threadsafe.
+    """
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.queue = asyncio.Queue()
+
+    def put(self, msg):
+        if threading.get_ident() == self.runtime.thread.ident:
+            self.queue.put_nowait(msg)
+        else:
+            self.runtime.loop.call_soon_threadsafe(self.queue.put_nowait, msg)
+
+    def get(self):
+        """ Return a coroutine that waits for the next message. """
+        return self.queue.get()
+
+    def get_nowait(self):
+        try:
+            return self.queue.get_nowait()
+        except asyncio.QueueEmpty:
+            raise queue.Empty
+
+    def qsize(self):
+        return self.queue.qsize()
+
+class AsyncioRuntime:
+    """
+    Runs every process as a coroutine on a single event loop, which
+    itself runs in one background thread. Processes are driven through
+    the same onStart() and handle() methods as in the threaded mode,
+    so both modes execute the same protocol code. The transport is
+    not used for inboxes since all processes share the loop.
+    """
+    name = "asyncio"
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+
+    def inbox(self, transport):
+        return AsyncInbox(self)
+
+    def start(self, proc):
+        if threading.get_ident() == self.thread.ident:
+            self.loop.create_task(self.drive(proc))
+        else:
+            asyncio.run_coroutine_threadsafe(self.drive(proc), self.loop)
+
+    def now(self):
+        return time.monotonic()
+
+    def wallclock(self):
+        return time.time()
+
+    def wait(self, predicate, interval=0.01):
+        """ Return once predicate() holds, checking every interval seconds. """
+        while not predicate():
+            time.sleep(interval)
+
+    def setTimer(self, delay, proc, msg):
+        """ Deliver msg to proc after delay seconds. """
+        if threading.get_ident() == self.thread.ident:
+            self.loop.call_later(delay, proc.deliver, msg)
+        else:
+            self.loop.call_soon_threadsafe(self.loop.call_later, delay, proc.deliver, msg)
+
+    def close(self, timeout=1.0):
+        """
+        Stop the event loop once every process has exited, cancelling
+        the processes still running after timeout seconds.
+        """
+        asyncio.run_coroutine_threadsafe(self.drain(timeout), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    async def drain(self, timeout):
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    async def drive(self, proc):
+        """
+        Coroutine equivalent of Process.body(). Nothing waits for the
+        result of the coroutine, so an exception that ends a process is
+        printed here, as the threaded runtime does for a thread.
+        """
+        try:
+            proc.onStart()
+            while not proc.stopped:
+                if proc.inbox.qsize() == 0:
+                    proc.onIdle()
+                msg = await proc.inbox.get()
+                if msg is None:
+                    continue
+                proc.dispatch(msg)
+            proc.onStop()
+            proc.env.removeProc(proc.id, proc)
+        except Exception:
+            print("Exception in process", proc.name)
+            traceback.print_exc()
+
+def parse_distribution(spec):
+    """
+    Turn spec into a function that draws a duration in seconds from
+    a random.Random. spec is a number of seconds, or one of
+    const:S, uniform:LOW,HIGH, exp:MEAN, normal:MEAN,STDEV and
+    lognormal:MU,SIGMA. Normal durations below zero are drawn as zero.
+    """
+    kind, _, args = str(spec).partition(":")
+    if not args:
+        kind, args = "const", kind
+    try:
+        a = [float(x) for x in args.split(",")]
+    except ValueError:
+        a = None
+    if kind == "const" and a and len(a) == 1:
+        return lambda rng: a[0]
+    elif kind == "uniform" and a and len(a) == 2:
+        return lambda rng: rng.uniform(a[0], a[1])
+    elif kind == "exp" and a and len(a) == 1:
+        return lambda rng: rng.expovariate(1.0 / a[0])
+    elif kind == "normal" and a and len(a) == 2:
+        return lambda rng: max(0.0, rng.gauss(a[0], a[1]))
+    elif kind == "lognormal" and a and len(a) == 2:
+        return lambda rng: rng.lognormvariate(a[0], a[1])
+    raise ValueError("Unknown latency distribution '%s'" % spec)
+
+class SimInbox:
+    """
+    The inbox of a process in the simulated runtime. Putting a message
+    schedules its delivery after the latency of the link it crosses.
+    qsize() counts the messages scheduled but not yet handled.
+    """
+    def __init__(self, runtime):
+        self.runtime = runtime
+        self.proc = None
+        self.pending = 0
+
+    def put(self, msg):
+        self.runtime.send(self, msg)
+
+    def qsize(self):
+        return self.pending
+
+class SimRuntime:
+    """
+    A deterministic discrete-event simulation. Processes run on a
+    single thread against a virtual clock: every message and timer is
+    an event in a heap ordered by virtual time, and wait() handles
+    events in order until its condition holds. Nothing runs between
+    calls to wait(), so a run with the same seed and the same calls
+    gives the same results, and virtual time runs as fast as the
+    events can be handled.
+
+    A message between two named processes (scouts and commanders
+    share the node of their owner) is delivered after a latency drawn
+    from the distribution of its link, see parse_distribution().
+    links is a list of "SRC>DST=SPEC" rules, where SRC and DST are
+    fnmatch patterns on process names, and the first matching rule
+    sets the distribution of a link. Other links use latency.
+    Messages on a link are delivered in the order they were sent, as
+    over TCP. With service above zero, a process takes that many
+    seconds to handle each message, and messages wait while it is
+    busy.
+    """
+    name = "sim"
+
+    def __init__(self, latency="0.0005", links=(), seed=1, service=0.0):
+        self.rng = random.Random(seed)
+        self.latency = parse_distribution(latency)
+        self.links = []
+        for rule in links:
+            pattern, _, spec = rule.partition("=")
+            src, _, dst = pattern.partition(">")
+            self.links.append((src, dst, parse_distribution(spec)))
+        self.service = float(service)
+        self.clock = 0.0
+        self.heap = []
+        self.seq = itertools.count()
+        self.link_delay = {}
+        self.link_last = {}
+        self.busy = {}
+        self.events = 0
+        self.running = set()
+
+    def inbox(self, transport):
+        return SimInbox(self)
+
+    def start(self, proc):
+        proc.inbox.proc = proc
+        self.running.add(proc)
+        self.push(self.clock, proc, START)
+
+    def now(self):
+        return self.clock
+
+    def wallclock(self):
+        return self.clock
+
+    def setTimer(self, delay, proc, msg):
+        """
+        Deliver msg to proc after delay seconds of virtual time, and at
+        least one step of the clock later, so that a timer too short to
+        move the clock cannot keep the simulation at the same time.
+        """
+        self.push(max(self.clock + delay, math.nextafter(self.clock, math.inf)), proc, msg)
+
+    def push(self, t, proc, msg, counted=False):
+        heapq.heappush(self.heap, (t, next(self.seq), proc, msg, counted))
+
+    def delay(self, src, dst, env):
+        """ Return the latency distribution of the link from node src to node dst. """
+        key = (src, dst)
+        dist = self.link_delay.get(key)
+        if dist is None:
+            dist = self.latency
+            for s, d, rule in self.links:
+                if fnmatch.fnmatch(env.name(src), s) and fnmatch.fnmatch(env.name(dst), d):
+                    dist = rule
+                    break
+            self.link_delay[key] = dist
+        return dist
+
+    def send(self, inbox, msg):
+        proc = inbox.proc
+        if msg is None:
+            self.push(self.clock, proc, None)
+            return
+        inbox.pending += 1
+        src, dst = msg.src & NODEMASK, proc.id & NODEMASK
+        if src == dst:
+            self.push(self.clock, proc, msg, True)
+            return
+        t = self.clock + self.delay(src, dst, proc.env)(self.rng)
+        # Keep the order of messages on the link.
+        t = max(t, self.link_last.get((src, dst), 0.0))
+        self.link_last[(src, dst)] = t
+        self.push(t, proc, msg, True)
+
+    def wait(self, predicate, interval=None):
+        """
+        Handle events in virtual time order until predicate() holds.
+        Raise RuntimeError if the events run out first.
+        """
+        heap = self.heap
+        while not predicate():
+            if not heap:
+                raise RuntimeError("Simulation ran out of events at %.6f s" % self.clock)
+            t, seq, proc, msg, counted = heapq.heappop(heap)
+            if proc.stopped:
+                continue
+            if self.service > 0 and msg is not START:
+                busy = self.busy.get(proc.id, 0.0)
+                if busy > t:
+                    heapq.heappush(heap, (busy, seq, proc, msg, counted))
+                    continue
+                self.busy[proc.id] = max(t, self.clock) + self.service
+            if t > self.clock:
+                self.clock = t
+            self.events += 1
+            if msg is START:
+                proc.onStart()
+            elif msg is not None:
+                if counted:
+                    proc.inbox.pending -= 1
+                proc.dispatch(msg)
+            if proc.stopped:
+                self.running.discard(proc)
+                proc.onStop()
+                proc.env.removeProc(proc.id, proc)
+            elif not heap or heap[0][2] is not proc or heap[0][0] > self.clock:
+                proc.onIdle()
+
+    def close(self):
+        """
+        Drop the pending events, and with them the processes stopped
+        from the outside, which exit here.
+        """
+        self.heap = []
+        for proc in self.running:
+            if proc.stopped:
+                proc.onStop()
+        self.running = set()
+
+START = object()   # Event that runs onStart() of a process
+
+RUNTIMES = {
+    ThreadRuntime.name: ThreadRuntime,
+    AsyncioRuntime.name: AsyncioRuntime,
+    SimRuntime.name: SimRuntime,
+}
+
+def get_runtime(name, **options):
+    """ Create a runtime from its name, passing it options. Return runtime. """
+    if name not in RUNTIMES:
+        raise ValueError("Unknown runtime '%s', expected one of: %s" %
+                         (name, ", ".join(sorted(RUNTIMES))))
+    return RUNTIMES[name](**options)
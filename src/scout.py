@@ -3,31 +3,63 @@
 #| From: https://github.com/denizalti/paxosmmc |
 #|_____________________________________________|
 from process import Process
-from message import P1aMessage, P1bMessage, PreemptedMessage, AdoptedMessage
+from message import P1aMessage, P1bMessage, PreemptedMessage, AdoptedMessage, TimerMessage
+from utils import THRIFTYTIMEOUT, measure, penalize
+from quorum import Majority
 
 class Scout(Process):
     """
     The scout runs what is known as phase 1 of the Synod protocol.
-    Every scout is created for a specific ballot number.
+    Every scout is created for a specific ballot number, and waits
+    for a phase 1 quorum of its leader's quorum system (see
+    quorum.py), by default a majority. A scout
+    given the latency map of a thrifty leader sends p1a messages to
+    the first phase 1 quorum of acceptors only, which the leader ranks by
+    latency, and to the others if they have not answered within
+    THRIFTYTIMEOUT seconds. It adds its replies to the map.
     """
-    def __init__(self, env, id, leader, acceptors, ballot_number):
+    def __init__(self, env, id, leader, acceptors, ballot_number, watermark=1, latency=None,
+                 quorum=None):
         Process.__init__(self, env, id)
         self.leader = leader
         self.acceptors = acceptors
         self.ballot_number = ballot_number
+        self.watermark = watermark
+        self.latency = latency
+        self.quorum = quorum if quorum is not None else Majority(acceptors)
         self.env.addProc(self)
 
-    def body(self):
+    def onStart(self):
         """
-        A scout sends a p1a message to all acceptors, and waits for
-        p1b responses. In each such response the ballot number in the
-        message will be greater than the ballot number of the
-        scout. There are two cases:
+        A scout starts by sending a p1a message to all acceptors, or
+        to a quorum if it is thrifty.
+        """
+        self.waitfor = set(self.acceptors)
+        self.pvalues = set()
+        self.sent = self.now()
+        if self.latency is None:
+            self.sendAll()
+            return
+        self.preferred = set(self.quorum.preferred1(self.acceptors))
+        for a in self.preferred:
+            self.sendMessage(a, P1aMessage(self.id, self.ballot_number, self.watermark))
+        self.setTimer(THRIFTYTIMEOUT, TimerMessage(self.id, "fallback"))
+
+    def sendAll(self):
+        """ Send a p1a message to every acceptor that has not answered. """
+        for a in self.waitfor:
+            self.sendMessage(a, P1aMessage(self.id, self.ballot_number, self.watermark))
+
+    def handle(self, msg):
+        """
+        A scout waits for p1b responses to its p1a messages. In each
+        such response the ballot number in the message will be greater
+        than the ballot number of the scout. There are two cases:
 
         - When a scout receives a p1b message it records all the
         values that are accepted by the acceptor that sent it. If the
         scout receives such p1b messages from all acceptors in a
-        majority of acceptors, then the scout learns that its ballot
+        phase 1 quorum of acceptors, then the scout learns that its ballot
         number is adopted. In this case, the commander notifies its
         leader and exits.
 
@@ -37,29 +69,35 @@ class Scout(Process):
         ballot number may no longer be able to make progress. In this
         case, the scout notifies its leader about the existence of
         the higher ballot number, and exits.
-        """
-        waitfor = set()
-        for a in self.acceptors:
-            self.sendMessage(a, P1aMessage(self.id, self.ballot_number))
-            waitfor.add(a)
 
-        pvalues = set()
-        while True:
-            msg = self.getNextMessage()
-            if isinstance(msg, P1bMessage):
-                if self.ballot_number == msg.ballot_number and msg.src in waitfor:
-                    pvalues.update(msg.accepted)
-                    waitfor.remove(msg.src)
-                    if len(waitfor) < float(len(self.acceptors))/2:
-                        self.sendMessage(self.leader,
-                                         AdoptedMessage(self.id,
-                                                        self.ballot_number,
-                                                        pvalues))
-                        return
-                else:
-                    self.sendMessage(self.leader,
-                                     PreemptedMessage(self.id,
-                                                      msg.ballot_number))
+        - Timer: A thrifty scout has not heard from a quorum within
+        THRIFTYTIMEOUT seconds and sends its p1a message to every
+        acceptor that has not answered, again every THRIFTYTIMEOUT
+        seconds until it exits.
+        """
+        if isinstance(msg, P1bMessage):
+            if self.ballot_number == msg.ballot_number:
+                if msg.src not in self.waitfor:
                     return
+                if self.latency is not None:
+                    measure(self.latency, msg.src, self.now() - self.sent)
+                self.pvalues.update(msg.accepted)
+                self.waitfor.remove(msg.src)
+                if self.quorum.phase1(self.waitfor):
+                    self.sendMessage(self.leader,
+                                     AdoptedMessage(self.id,
+                                                    self.ballot_number,
+                                                    self.pvalues))
+                    self.stop()
             else:
-                print("Scout: unexpected msg")
+                self.sendMessage(self.leader,
+                                 PreemptedMessage(self.id,
+                                                  msg.ballot_number))
+                self.stop()
+        elif isinstance(msg, TimerMessage):
+            penalize(self.latency, self.waitfor & self.preferred, self.now() - self.sent)
+            self.sent = self.now()
+            self.sendAll()
+            self.setTimer(THRIFTYTIMEOUT, TimerMessage(self.id, "fallback"))
+        else:
+            print("Scout: unexpected msg")
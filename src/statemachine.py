@@ -0,0 +1,96 @@
+class StateMachine:
+    """
+    The application state of a replica. Replicas apply the operation
+    of every decided command to their state machine in slot order, and
+    the result is sent back to the client.
+
+    Operations for which is_read() returns True do not change the
+    state, so a replica may answer them with read() outside the log
+    once it has performed every slot that could precede them.
+    """
+    name = None
+
+    def apply(self, op):
+        """ Apply op to the state. Return its result. """
+        raise NotImplementedError
+
+    def is_read(self, op):
+        """ Return True if op does not change the state. """
+        return False
+
+    def read(self, op):
+        """ Evaluate a read-only op. Return its result. """
+        return self.apply(op)
+
+    def snapshot(self):
+        """ Return a copy of the state, to be restored with restore(). """
+        return None
+
+    def restore(self, state):
+        """ Replace the state with one returned by snapshot(). """
+        pass
+
+class NullStateMachine(StateMachine):
+    """ No application state. Every operation is accepted and returns None. """
+    name = "null"
+
+    def apply(self, op):
+        return None
+
+class KVStore(StateMachine):
+    """
+    A key-value store. Operations are tuples:
+
+    - ("get", key): return the value of key, or None.
+    - ("put", key, value): set key to value. Return True.
+    - ("cas", key, expected, value): set key to value if its value is
+      expected, where None stands for a missing key. Return True if
+      the value was set, False otherwise.
+
+    Operations of any other form leave the store unchanged and return
+    None, so the string operations of the plain workloads run as
+    before.
+    """
+    name = "kv"
+
+    def __init__(self):
+        self.data = {}
+
+    def apply(self, op):
+        if type(op) is not tuple or len(op) == 0:
+            return None
+        if op[0] == "get":
+            return self.data.get(op[1])
+        elif op[0] == "put":
+            self.data[op[1]] = op[2]
+            return True
+        elif op[0] == "cas":
+            if self.data.get(op[1]) != op[2]:
+                return False
+            self.data[op[1]] = op[3]
+            return True
+        return None
+
+    def is_read(self, op):
+        return type(op) is tuple and len(op) == 2 and op[0] == "get"
+
+    def read(self, op):
+        return self.data.get(op[1])
+
+    def snapshot(self):
+        return dict(self.data)
+
+    def restore(self, state):
+        self.data = dict(state)
+
+STATEMACHINES = {
+    NullStateMachine.name: NullStateMachine,
+    KVStore.name: KVStore,
+}
+
+def get_state_machine(name):
+    """ Create a state machine from its name. Return StateMachine. """
+    if name not in STATEMACHINES:
+        raise ValueError("Unknown state machine '%s', expected one of: %s" %
+                         (name, ", ".join(sorted(STATEMACHINES))))
+    return STATEMACHINES[name]()
@@ -0,0 +1,260 @@
+import multiprocessing
+import pickle
+import queue
+import socket
+import struct
+import threading
+import time
+import codec
+from utils import NODEMASK
+
+CODECS = {
+    "pickle": (lambda obj: pickle.dumps(obj, pickle.HIGHEST_PROTOCOL), pickle.loads),
+    "binary": (codec.dumps, codec.loads),
+}
+
+class Transport:
+    """
+    A transport decides how messages travel from Env.sendMessage to the
+    inbox of the destination process. Every process asks the transport
+    of its environment for an inbox when it is created, and
+    Process.deliver puts messages into that inbox.
+    """
+    name = None
+
+    def inbox(self):
+        """ Return a new queue-like object with put(), get() and get_nowait(). """
+        raise NotImplementedError
+
+    def send(self, dst, msg):
+        """
+        Called by Env.sendMessage for destinations that are not local
+        processes. In-process transports drop such messages.
+        """
+        pass
+
+    def close(self):
+        """ Release any resources held by the transport. """
+        pass
+
+class LocalTransport(Transport):
+    """
+    Default transport for processes that live in the same interpreter.
+    Every inbox is a queue.SimpleQueue, an unbounded FIFO implemented in
+    C that relies on the GIL instead of a separate lock and condition
+    variable, so put() never blocks and get() only blocks when empty.
+    """
+    name = "local"
+
+    def inbox(self):
+        return queue.SimpleQueue()
+
+class ManagerTransport(Transport):
+    """
+    The original transport. Every inbox is a proxy to a queue hosted
+    by its own multiprocessing.Manager server process, so creating an
+    inbox starts a process and every message is pickled twice. Kept
+    for comparison in bench_transport.py.
+    """
+    name = "manager"
+
+    def __init__(self):
+        self.managers = []
+
+    def inbox(self):
+        manager = multiprocessing.Manager()
+        self.managers.append(manager)
+        return manager.Queue()
+
+    def close(self):
+        for manager in self.managers:
+            manager.shutdown()
+        self.managers = []
+
+class TcpTransport(LocalTransport):
+    """
+    A transport for processes spread over several OS processes or
+    hosts. Local processes use in-process queues as with the local
+    transport, while messages for other processes are sent over TCP.
+
+    addresses maps the process id of every role to a (host, port)
+    pair. Processes spawned by a role, such as scouts and commanders,
+    carry the id of their owner in the low bits of their id (see
+    Env.childId) and are reached through the address of their owner.
+    Every node keeps one persistent connection per remote address,
+    shared by all its local processes, and every
+    frame on it is a 4-byte big-endian length followed by the
+    (destination, message) pair, encoded with the codec named by codec
+    (see CODECS). Connections are made in the background, so that a
+    node that is down never holds up the sender.
+    """
+    name = "tcp"
+    HEADER = struct.Struct("!I")
+    MAXPENDING = 10000     # Most frames held for an address while connecting to it
+    RETRYDELAY = 0.05      # Seconds before connecting again to an address that failed once
+    MAXRETRYDELAY = 1.0    # Longest wait before connecting again to a failed address
+
+    def __init__(self, addresses={}, connect_timeout=10.0, codec="binary"):
+        self.dumps, self.loads = CODECS[codec]
+        self.addresses = {name: tuple(addr) for name, addr in addresses.items()}
+        self.connect_timeout = connect_timeout
+        self.links = {}
+        self.pending = {}
+        self.retry = {}
+        self.connected = set()
+        self.lock = threading.Lock()
+        self.server = None
+
+    def route(self, dst):
+        """ Return the address of the node hosting dst, or None. """
+        return self.addresses.get(dst & NODEMASK)
+
+    def enqueue(self, addr, frame):
+        """
+        Hold frame for addr, which has no link, until a connection
+        attempt in the background finishes, starting one unless an
+        earlier attempt failed less than the retry delay ago. Called
+        with the lock held. Frames beyond MAXPENDING, and frames sent
+        while the retry delay runs, are dropped.
+        """
+        pending = self.pending.get(addr)
+        if pending is None:
+            retry = self.retry.get(addr)
+            if retry is not None and time.monotonic() < retry[0]:
+                return
+            pending = self.pending[addr] = []
+            threading.Thread(target=self.connect, args=[addr], daemon=True).start()
+        if len(pending) < self.MAXPENDING:
+            pending.append(frame)
+
+    def connect(self, addr):
+        """
+        Connect to addr and send the frames held for it. The first
+        connection to an address is retried for up to connect_timeout
+        seconds, while its node starts; later ones are tried once. If
+        the connection fails, the frames are dropped and addr is not
+        tried again for a delay that doubles with every failure, up to
+        MAXRETRYDELAY.
+        """
+        deadline = time.monotonic() + (self.connect_timeout if addr not in self.connected else 0)
+        delay = 0.01
+        while True:
+            try:
+                sock = socket.create_connection(addr, timeout=self.connect_timeout)
+                break
+            except OSError as e:
+                if time.monotonic() > deadline:
+                    with self.lock:
+                        dropped = len(self.pending.pop(addr, ()))
+                        last = self.retry.get(addr, (0, self.RETRYDELAY / 2))[1]
+                        wait = min(2 * last, self.MAXRETRYDELAY)
+                        self.retry[addr] = (time.monotonic() + wait, wait)
+                    print("Transport: cannot reach", addr, ":", e, "- dropped", dropped,
+                          "messages, retrying in %.2f s" % wait)
+                    return
+                time.sleep(delay)
+                delay = min(2 * delay, 0.5)
+        sock.settimeout(None)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        lock = threading.Lock()
+        # Hold the link until the pending frames are out, so that they
+        # go before any frame sent on the new link.
+        with lock:
+            with self.lock:
+                self.links[addr] = (sock, lock)
+                self.connected.add(addr)
+                self.retry.pop(addr, None)
+                frames = self.pending.pop(addr, ())
+            try:
+                for frame in frames:
+                    sock.sendall(frame)
+            except OSError as e:
+                self.fail(addr, sock, e)
+
+    def fail(self, addr, sock, error):
+        """ Drop the broken link to addr, which is reconnected on the next send. """
+        print("Transport: lost the link to", addr, ":", error)
+        with self.lock:
+            if self.links.get(addr, (None,))[0] is sock:
+                del self.links[addr]
+        sock.close()
+
+    def send(self, dst, msg):
+        """
+        Send msg to dst without waiting for a connection: messages for
+        a node that is not connected are held while a connection is
+        made in the background, and dropped while its node is down.
+        Paxos tolerates lost messages.
+        """
+        addr = self.route(dst)
+        if addr is None:
+            return
+        payload = self.dumps((dst, msg))
+        frame = self.HEADER.pack(len(payload)) + payload
+        with self.lock:
+            link = self.links.get(addr)
+            if link is None:
+                self.enqueue(addr, frame)
+                return
+        sock, lock = link
+        try:
+            with lock:
+                sock.sendall(frame)
+        except OSError as e:
+            self.fail(addr, sock, e)
+
+    def listen(self, env, addr):
+        """ Accept connections on addr and deliver incoming messages to env. """
+        self.server = socket.create_server(tuple(addr), reuse_port=False)
+        threading.Thread(target=self.accept, args=[env], daemon=True).start()
+
+    def accept(self, env):
+        while True:
+            try:
+                conn, peer = self.server.accept()
+            except OSError:
+                return
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.receive, args=[env, conn], daemon=True).start()
+
+    def receive(self, env, conn):
+        f = conn.makefile("rb")
+        try:
+            while True:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    break
+                length = self.HEADER.unpack(header)[0]
+                payload = f.read(length)
+                if len(payload) != length:
+                    break     # The peer went away in the middle of a frame
+                dst, msg = self.loads(payload)
+                proc = env.procs.get(dst)
+                if proc is not None:
+                    proc.deliver(msg)
+        finally:
+            f.close()
+            conn.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        with self.lock:
+            for sock, lock in self.links.values():
+                sock.close()
+            self.links = {}
+
+TRANSPORTS = {
+    LocalTransport.name: LocalTransport,
+    ManagerTransport.name: ManagerTransport,
+    TcpTransport.name: TcpTransport,
+}
+
+def get_transport(name, **kwargs):
+    """ Create a transport from its name, or pass a Transport through. Return Transport. """
+    if isinstance(name, Transport):
+        return name
+    if name not in TRANSPORTS:
+        raise ValueError("Unknown transport '%s', expected one of: %s" %
+                         (name, ", ".join(sorted(TRANSPORTS))))
+    return TRANSPORTS[name](**kwargs)
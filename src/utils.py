@@ -4,9 +4,24 @@
 #|_____________________________________________|
 from collections import namedtuple
 
-WINDOW = 5               # Number of slots that can have proposals pending
+WINDOW = 5               # Initial number of slots that can have proposals pending
+MAXWINDOW = 64           # Largest window, and the slots before a reconfiguration takes effect
 TIMEOUTMULTIPLY = 1.2    # Multiplicative increase amount for liveness timeouts
 TIMEOUTSUBTRACT = 0.03   # Additive decrease amount for liveness timeouts
+COMPACTINTERVAL = 100    # Number of executed slots between watermark reports from replicas
+SNAPSHOTINTERVAL = 10000 # Number of executed slots between snapshots of replica state
+STATETIMEOUT = 1.0       # Seconds a replica waits for a state transfer before asking another
+LEASEDRIFT = 0.1         # Fraction of a lease a leader gives up to allow for clock drift
+READTIMEOUT = 1.0        # Seconds a replica waits for a read index before ordering its reads
+CHECKPOINTINTERVAL = 100 # Number of executed slots between digests sent to the checker
+DIGESTHISTORY = 1000     # Number of most recent slot digests a replica keeps for the checker
+HEARTBEATINTERVAL = 0.05 # Seconds between the heartbeats a leader sends to the other leaders
+SUSPECTTIMEOUT = 0.25    # Seconds without a heartbeat before a leader suspects another has failed
+PROPOSETIMEOUT = 0.5     # Seconds a replica waits for the decision of a proposal sent to one leader
+THRIFTYTIMEOUT = 0.05    # Seconds a thrifty leader waits for its preferred acceptors alone
+LATENCYALPHA = 0.2       # Weight of the newest sample in the smoothed latency of an acceptor
+NODEBITS = 16            # Low bits of a process id that identify the named process hosting it
+NODEMASK = (1 << NODEBITS) - 1
 
 class BallotNumber(namedtuple('BallotNumber',['round','leader_id'])):
     """
@@ -17,6 +32,17 @@ class BallotNumber(namedtuple('BallotNumber',['round','leader_id'])):
     def __str__(self):
         return "BN(%d,%s)" % (self.round, str(self.leader_id))
 
+BALLOTS = {}
+
+def intern_ballot(round, leader_id):
+    """
+    Return the one BallotNumber object for (round, leader_id), so that
+    the ballot carried by every message and pvalue of a round is
+    shared instead of being allocated again.
+    """
+    b = BallotNumber(round, leader_id)
+    return BALLOTS.setdefault(b, b)
+
 class PValue(namedtuple('PValue',['ballot_number','slot_number','command'])):
     """
     PValue is a triple consisting of a ballot number, a slot number, a command.
@@ -52,16 +78,29 @@ class ReconfigCommand(namedtuple('ReconfigCommand',['client','req_id','config'])
                                               str(self.req_id),
                                               str(self.config))
 
+class BatchCommand(namedtuple('BatchCommand',['client','req_id','commands'])):
+    """
+    A batch command packs several client commands into one slot. It
+    consists of the process identifier of the replica that created
+    the batch, a replica-local batch identifier, and a tuple of
+    commands that are performed in order.
+    """
+    __slots__ = ()
+    def __str__(self):
+        return "BatchCommand(%s,%s,[%s])" % (str(self.client),
+                                             str(self.req_id),
+                                             ",".join(str(c) for c in self.commands))
+
 class Config(namedtuple('Config',['replicas','acceptors','leaders'])):
     """
     A configuration consists of a list of replicas, a list of
-    acceptors and a list of leaders.
+    acceptors and a list of leaders, given by their process ids.
     """
     __slots__ = ()
     def __str__(self):
-        return "%s;%s;%s" % (','.join(self.replicas),
-                             ','.join(self.acceptors),
-                             ','.join(self.leaders))
+        return "%s;%s;%s" % (','.join(map(str, self.replicas)),
+                             ','.join(map(str, self.acceptors)),
+                             ','.join(map(str, self.leaders)))
 
 
 def parse_config(cfg):
@@ -83,3 +122,26 @@ def create_config(r,l,a):
     l = str(l)+","
     a = str(a)
     return r+l+a
+
+def measure(latency, acceptor, sample):
+    """ Add sample, in seconds, to the smoothed latency of acceptor in the map latency. """
+    smoothed = latency.get(acceptor)
+    if smoothed is None:
+        latency[acceptor] = sample
+    else:
+        latency[acceptor] = smoothed + LATENCYALPHA * (sample - smoothed)
+
+def penalize(latency, acceptors, waited):
+    """
+    Add waited seconds to the latency of acceptors that have not
+    answered, so that they sink in the ranking.
+    """
+    for a in acceptors:
+        latency[a] = latency.get(a, 0.0) + waited
+
+def rank(acceptors, latency):
+    """
+    Return acceptors ordered by their smoothed latency in the map
+    latency, those not yet measured first.
+    """
+    return sorted(acceptors, key=lambda a: latency.get(a, 0.0))
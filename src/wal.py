@@ -0,0 +1,115 @@
+import mmap
+import os
+import struct
+import zlib
+import codec
+
+FSYNC = ["always", "group", "none"]
+LOGREWRITE = 10000       # Records a log may hold beyond twice the live state before it is rewritten
+
+fdatasync = getattr(os, "fdatasync", os.fsync)
+
+class Log:
+    """
+    An append-only write-ahead log of acceptor state on disk. Every
+    record is a 4 byte length, a 4 byte crc32 of the payload and the
+    payload: a one byte kind followed by a value encoded with codec.
+
+    append() only adds a record to an in-memory buffer. sync() writes
+    the buffer with a single write() call and makes it durable
+    according to the fsync policy:
+
+    - always: the caller syncs after every record, one fsync each.
+    - group: the caller syncs once for every group of records, so one
+      fsync covers all requests handled since the last one.
+    - none: records are handed to the operating system but never
+      fsynced. They survive a crash of the process, not of the host.
+
+    On opening, a record that was only partly written or fails its
+    checksum ends the log, and the file is truncated before it.
+    """
+    HEADER = struct.Struct("<II")
+
+    def __init__(self, path, fsync="group"):
+        if fsync not in FSYNC:
+            raise ValueError("Unknown fsync policy '%s', expected one of: %s" %
+                             (fsync, ", ".join(FSYNC)))
+        self.path = path
+        self.fsync = fsync
+        self.buf = bytearray()
+        self.records = 0
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+    def replay(self):
+        """
+        Read the log through a memory map and yield every intact
+        record as a (kind, value) pair. Truncate the log after the
+        last intact record.
+        """
+        size = os.fstat(self.fd).st_size
+        end = 0
+        if size > 0:
+            with mmap.mmap(self.fd, size, access=mmap.ACCESS_READ) as m:
+                data = memoryview(m)
+                while end + self.HEADER.size <= size:
+                    length, crc = self.HEADER.unpack_from(data, end)
+                    start = end + self.HEADER.size
+                    if start + length > size or zlib.crc32(data[start:start + length]) != crc:
+                        break
+                    kind = chr(data[start])
+                    value = codec.loads(data[start + 1:start + length])
+                    end = start + length
+                    self.records += 1
+                    yield kind, value
+                data.release()
+        if end < size:
+            print("Log: truncating", self.path, "from", size, "to", end, "bytes")
+            os.ftruncate(self.fd, end)
+
+    def append(self, kind, value):
+        """ Add a record to the buffer. It is written by the next sync(). """
+        payload = kind.encode() + codec.dumps(value)
+        self.buf += self.HEADER.pack(len(payload), zlib.crc32(payload))
+        self.buf += payload
+        self.records += 1
+
+    def dirty(self):
+        """ Return True if there are records that sync() has not yet written. """
+        return len(self.buf) > 0
+
+    def sync(self):
+        """ Write all buffered records and make them durable. """
+        if len(self.buf) == 0:
+            return
+        os.write(self.fd, self.buf)
+        self.buf = bytearray()
+        if self.fsync != "none":
+            fdatasync(self.fd)
+
+    def rewrite(self, records):
+        """
+        Replace the log with records, a list of (kind, value) pairs
+        describing the live state. The new log is written and fsynced
+        next to the old one and renamed over it, so a crash leaves
+        either the old or the new log.
+        """
+        self.sync()
+        tmp = self.path + ".tmp"
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        self.records = 0
+        for kind, value in records:
+            self.append(kind, value)
+        os.write(fd, self.buf)
+        self.buf = bytearray()
+        os.fsync(fd)
+        os.close(fd)
+        os.replace(tmp, self.path)
+        os.close(self.fd)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_APPEND)
+        d = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        os.fsync(d)
+        os.close(d)
+
+    def close(self):
+        self.sync()
+        os.close(self.fd)
@@ -0,0 +1,77 @@
+from utils import WINDOW, MAXWINDOW
+
+class FixedWindow:
+    """
+    A window of a fixed number of slots that can have proposals pending.
+    """
+    def __init__(self, size=WINDOW):
+        self.size = min(int(size), MAXWINDOW)
+        self.history = []
+
+    def update(self, latency, now):
+        pass
+
+class AdaptiveWindow:
+    """
+    A window that adapts the number of pending slots to the decision
+    latency observed by a replica, in the style of TCP congestion
+    avoidance. The latency of every decided proposal is smoothed with
+    an exponentially weighted moving average and compared to the
+    base latency, the lowest smoothed latency of the last one to two
+    periods of period seconds, in the style of the minimum RTT filter
+    of BBR. A lasting rise of the latency, such as a slower link,
+    thus becomes the new base within two periods instead of holding
+    the window at its minimum for good:
+
+    - While the smoothed latency stays within tolerance times the
+    lowest latency, the window grows by one slot per window of
+    decisions.
+
+    - Once it rises above that, the window shrinks by the factor
+    decrease, at most once per window of decisions.
+
+    The window never exceeds MAXWINDOW, which is also the lag before a
+    reconfiguration takes effect, so a replica always knows the
+    configuration of every slot it proposes for. Every change of size
+    is recorded in history as a (time, size) pair.
+    """
+    def __init__(self, size=WINDOW, minimum=1, maximum=MAXWINDOW,
+                 tolerance=1.5, decrease=0.75, alpha=0.2, period=1.0):
+        self.size = size
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self.decrease = decrease
+        self.alpha = alpha
+        self.period = period
+        self.estimate = float(size)
+        self.smoothed = None
+        self.base = None
+        self.previous = None
+        self.current = None
+        self.period_start = None
+        self.since_decrease = 0
+        self.history = []
+
+    def update(self, latency, now):
+        """ Account for the decision latency of one proposal. """
+        if self.smoothed is None:
+            self.smoothed = latency
+        else:
+            self.smoothed += self.alpha * (latency - self.smoothed)
+        if self.period_start is None or now - self.period_start >= self.period:
+            self.previous, self.current = self.current, self.smoothed
+            self.period_start = now
+        else:
+            self.current = min(self.current, self.smoothed)
+        self.base = self.current if self.previous is None else min(self.previous, self.current)
+        self.since_decrease += 1
+        if self.smoothed <= self.base * self.tolerance:
+            self.estimate = min(self.maximum, self.estimate + 1.0 / self.estimate)
+        elif self.since_decrease >= self.size:
+            self.estimate = max(self.minimum, self.estimate * self.decrease)
+            self.since_decrease = 0
+        size = int(self.estimate)
+        if size != self.size:
+            self.size = size
+            self.history.append((now, size))